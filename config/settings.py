@@ -13,6 +13,12 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.getenv('SECRET_KEY')
 STRIPE_API_KEY = os.getenv('STRIPE_API_KEY')
+STRIPE_TIMEOUT = 10
+STRIPE_MAX_NETWORK_RETRIES = 2
+STRIPE_USE_STUB = os.getenv('STRIPE_USE_STUB') == 'True'
+STRIPE_ASYNC_CHECKOUT = os.getenv('STRIPE_ASYNC_CHECKOUT') == 'True'
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
+STRIPE_EVENTS_BATCH_SIZE = 500
 
 DEBUG = True
 
@@ -40,7 +46,7 @@ REST_FRAMEWORK = {
         'rest_framework.filters.OrderingFilter',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -50,10 +56,13 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    # Отозванные refresh-токены отклоняются по кешу (users.revocation)
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.RevocableTokenRefreshSerializer',
 }
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'lms.middleware.QueryMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -141,10 +150,20 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'users.tasks.deactivate_users',
         'schedule': crontab(hour=0, minute=0)
     },
+    'rollup_payments': {
+        'task': 'users.tasks.rollup_payments',
+        'schedule': crontab(minute='*/15')
+    },
 }
 
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 
+# Блокировка неактивных пользователей (users.tasks.deactivate_users): срок неактивности в днях,
+# количество пользователей в одном запросе UPDATE и пауза между запросами в секундах
+DEACTIVATE_USERS_INACTIVE_DAYS = 30
+DEACTIVATE_USERS_BATCH_SIZE = 1000
+DEACTIVATE_USERS_PAUSE = 0.1
+
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.mail.ru'
 EMAIL_PORT = 587
@@ -155,9 +174,37 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 SERVER_EMAIL = EMAIL_HOST_USER
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+NOTIFICATION_BATCH_SIZE = 500
+COURSE_UPDATE_NOTIFICATION_WINDOW = 60
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
         'LOCATION': 'redis://redis:6379/1',
     }
 }
+
+USER_ROLES_CACHE_TIMEOUT = 60 * 60
+# Время хранения в кеше пользователя, найденного по JWT (users.authentication.CachedJWTAuthentication)
+AUTH_USER_CACHE_TIMEOUT = 60
+LMS_CACHE_TIMEOUT = 60 * 5
+# Время хранения в кеше оплаченных пользователем курсов и уроков (users.entitlements)
+ENTITLEMENTS_CACHE_TIMEOUT = 60 * 60
+
+# Домены, ссылки на которые разрешены в описаниях курсов и уроков (вместе с поддоменами)
+LMS_ALLOWED_LINK_DOMAINS = ('youtube.com', 'youtu.be')
+
+# Максимальное количество уроков в одном пакетном запросе
+LESSONS_BULK_MAX_SIZE = 1000
+# Максимальное количество курсов в одном запросе пакетной подписки (отписки)
+SUBSCRIPTIONS_BATCH_MAX_SIZE = 1000
+
+# Размер пачки при экспорте (чтение итератором) и импорте (bulk_create) курсов в формате JSON Lines
+LMS_TRANSFER_BATCH_SIZE = 2000
+
+# Метрики SQL-запросов и времени ответа по эндпоинтам (lms.middleware.QueryMetricsMiddleware):
+# доля измеряемых запросов, заголовок Server-Timing и токен доступа к эндпоинту метрик Prometheus
+LMS_METRICS_ENABLED = os.getenv('LMS_METRICS_ENABLED', 'True') == 'True'
+LMS_METRICS_SAMPLE_RATE = float(os.getenv('LMS_METRICS_SAMPLE_RATE', '0.1'))
+LMS_METRICS_SERVER_TIMING = os.getenv('LMS_METRICS_SERVER_TIMING', 'True') == 'True'
+LMS_METRICS_TOKEN = os.getenv('LMS_METRICS_TOKEN')
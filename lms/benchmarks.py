@@ -0,0 +1,62 @@
+import math
+import statistics
+import time
+
+
+def percentile(values, percent):
+    """Возвращает перцентиль (методом ближайшего ранга) для списка значений"""
+
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(timings):
+    """Сводная статистика по списку времен выполнения (в миллисекундах)"""
+
+    return {
+        'iterations': len(timings),
+        'mean': round(statistics.fmean(timings), 3),
+        'p50': round(percentile(timings, 50), 3),
+        'p95': round(percentile(timings, 95), 3),
+        'p99': round(percentile(timings, 99), 3),
+        'max': round(max(timings), 3),
+    }
+
+
+def measure(func, iterations, warmup=0):
+    """Выполняет func заданное количество раз (после прогрева) и возвращает статистику времени выполнения в мс"""
+
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return summarize(timings)
+
+
+def format_stats(name, stats):
+    """Форматирует статистику для вывода в консоль"""
+
+    return (f"{name}: p50={stats['p50']} мс, p95={stats['p95']} мс, p99={stats['p99']} мс, "
+            f"mean={stats['mean']} мс, max={stats['max']} мс ({stats['iterations']} итераций)")
+
+
+def compare_results(results, baseline, threshold):
+    """Сравнивает результаты замеров с сохраненными базовыми (словари {сценарий: статистика}).
+    Регрессия - рост p50 или p95 более чем на threshold процентов или рост количества SQL-запросов.
+    Возвращает список регрессий (сценарий, метрика, базовое значение, новое значение)"""
+
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric in ('p50', 'p95'):
+            if stats[metric] > base[metric] * (1 + threshold / 100):
+                regressions.append((name, metric, base[metric], stats[metric]))
+        if stats['queries'] > base['queries']:
+            regressions.append((name, 'queries', base['queries'], stats['queries']))
+    return regressions
@@ -0,0 +1,156 @@
+import time
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+from config.settings import LMS_CACHE_TIMEOUT
+from users.roles import is_moderator
+
+
+COURSES = 'courses'
+LESSONS = 'lessons'
+SUBSCRIPTIONS = 'subscriptions'
+ENTITLEMENTS = 'entitlements'
+
+CACHE_VERSION_KEY = 'lms:cache_version:{resource}'
+CACHE_VALUE_KEY = 'lms:value:{resource}'
+CACHE_RESPONSE_KEY = 'lms:response:{resource}:v{version}:{scope}:{view}:{pk}:{params}'
+CACHE_STATS_KEY = 'lms:cache_stats:{result}'
+
+
+def get_cache_version(resource):
+    """Возвращает текущую версию кеша ресурса. Версия входит в ключ кеша, поэтому ее увеличение
+    делает недоступными все ранее сохраненные ответы ресурса"""
+
+    key = CACHE_VERSION_KEY.format(resource=resource)
+    version = cache.get(key)
+    if version is None:
+        # Начальная версия уникальна, чтобы после вытеснения ключа не вернуться к старым ответам
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _incr_cache_versions(resources):
+    """Увеличивает версии кеша указанных ресурсов"""
+
+    for resource in resources:
+        key = CACHE_VERSION_KEY.format(resource=resource)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump_cache_version(*resources):
+    """Инвалидирует кеш ответов указанных ресурсов.
+    Версия увеличивается сразу и повторно после фиксации транзакции, чтобы ответ, закешированный
+    конкурентным запросом до фиксации изменений, не остался в кеше"""
+
+    _incr_cache_versions(resources)
+    transaction.on_commit(lambda: _incr_cache_versions(resources))
+
+
+def user_resource(resource, user_id):
+    """Имя персонального ресурса пользователя (например, подписок) с собственной версией кеша"""
+
+    return f'{resource}:{user_id}'
+
+
+def get_cached_value(resource, loader, timeout=LMS_CACHE_TIMEOUT):
+    """Возвращает значение ресурса (например, множество id) за одно обращение к кешу (get_many).
+    Значение хранится вместе с версией ресурса, на момент которой оно загружено. Если версия устарела
+    (bump_cache_version) или значения нет в кеше, оно загружается заново через loader().
+    Значение, загруженное конкурентным запросом до изменения данных, сохраняется со старой версией
+    и поэтому никогда не будет использовано"""
+
+    version_key = CACHE_VERSION_KEY.format(resource=resource)
+    value_key = CACHE_VALUE_KEY.format(resource=resource)
+    values = cache.get_many([version_key, value_key])
+    version = values.get(version_key)
+    cached = values.get(value_key)
+    if version is None:
+        version = get_cache_version(resource)
+    elif cached is not None and cached[0] == version:
+        return cached[1]
+
+    value = loader()
+    cache.set(value_key, (version, value), timeout)
+    return value
+
+
+def get_cached_ids(resource, loader, timeout=LMS_CACHE_TIMEOUT):
+    """Возвращает множество id ресурса (frozenset) из кеша (см. get_cached_value)"""
+
+    return get_cached_value(resource, lambda: frozenset(loader()), timeout)
+
+
+def increment_counter(key):
+    """Атомарно увеличивает бессрочный счетчик в кеше"""
+
+    if not cache.add(key, 1, None):
+        cache.incr(key)
+
+
+def _record_cache_result(result):
+    """Увеличивает счетчик попаданий ('hits') или промахов ('misses') кеша"""
+
+    increment_counter(CACHE_STATS_KEY.format(result=result))
+
+
+def get_cache_stats():
+    """Возвращает счетчики попаданий и промахов кеша ответов"""
+
+    return {result: cache.get(CACHE_STATS_KEY.format(result=result), 0) for result in ('hits', 'misses')}
+
+
+class CachedResponseMixin:
+    """Примесь для контроллеров, кеширующая ответы list/retrieve в Redis.
+    Ключ кеша включает версию ресурса, область видимости пользователя (модератор или владелец),
+    имя маршрута, pk объекта и параметры запроса (page, page_size и др.)"""
+
+    cache_resource = None
+
+    def get_cache_scope(self):
+        """Область видимости данных: модераторы видят все объекты, владельцы - только свои"""
+
+        user = self.request.user
+        if is_moderator(user):
+            return 'moderator'
+        return f'owner:{user.pk}'
+
+    def get_cache_key(self, request):
+        """Формирует ключ кеша для текущего запроса"""
+
+        return CACHE_RESPONSE_KEY.format(
+            resource=self.cache_resource,
+            version=get_cache_version(self.cache_resource),
+            scope=self.get_cache_scope(),
+            view=request.resolver_match.view_name,
+            pk=self.kwargs.get('pk', ''),
+            params=urlencode(sorted(request.query_params.items())),
+        )
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        """Возвращает ответ из кеша или вызывает handler и сохраняет успешный ответ в кеш"""
+
+        key = self.get_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            _record_cache_result('hits')
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        _record_cache_result('misses')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, LMS_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(super().retrieve, request, *args, **kwargs)
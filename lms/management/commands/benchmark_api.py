@@ -0,0 +1,141 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from lms.benchmarks import compare_results, format_stats, summarize
+from lms.cache import COURSES, LESSONS, bump_cache_version
+from lms.models import Course
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный замер основных эндпоинтов API (курсы, уроки, подписки, платежи, профили) тестовым клиентом '
+            'Django на текущих данных (см. fill_payments): пропускная способность, перцентили задержки и количество '
+            'SQL-запросов. Результаты сохраняются в JSON и сравниваются с базовыми для поиска регрессий. '
+            'Изменения данных во время замера откатываются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='Email пользователя, от имени которого выполняются запросы')
+        parser.add_argument('--iterations', type=int, default=100, help='Количество запросов на каждый сценарий')
+        parser.add_argument('--warmup', type=int, default=5, help='Количество прогревочных запросов')
+        parser.add_argument('--page-size', type=int, default=10, help='Размер страницы списков')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Запускать только указанный сценарий (можно указать несколько раз)')
+        parser.add_argument('--cold-cache', action='store_true',
+                            help='Сбрасывать кеш ответов перед каждым запросом (замер без кеша)')
+        parser.add_argument('--output', help='Файл для сохранения результатов в JSON')
+        parser.add_argument('--baseline', help='Файл JSON с базовыми результатами для сравнения')
+        parser.add_argument('--threshold', type=float, default=20,
+                            help='Допустимый рост задержки p50/p95 относительно базовой, %%')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options['email']).first() if options['email'] else User.objects.first()
+        if user is None:
+            raise CommandError('Не найден пользователь для выполнения запросов')
+        if options['iterations'] < 1:
+            raise CommandError('Количество запросов должно быть не меньше 1')
+
+        scenarios = self.get_scenarios(user, options['page_size'])
+        if options['scenarios']:
+            unknown = set(options['scenarios']) - set(scenarios)
+            if unknown:
+                raise CommandError(f"Неизвестные сценарии: {', '.join(sorted(unknown))}. "
+                                   f"Доступны: {', '.join(scenarios)}")
+            scenarios = {name: scenarios[name] for name in options['scenarios']}
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        results = {}
+        with transaction.atomic():
+            for name, scenario in scenarios.items():
+                results[name] = self.run_scenario(client, *scenario, options)
+                self.print_result(name, results[name])
+            transaction.set_rollback(True)
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'user': user.email,
+            'iterations': options['iterations'],
+            'cold_cache': options['cold_cache'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты сохранены в {options['output']}")
+
+        if options['baseline']:
+            self.compare(report, options['baseline'], options['threshold'])
+
+    def get_scenarios(self, user, page_size):
+        """Сценарии замера: {название: (метод, url, данные запроса, ресурс кеша ответов)}"""
+        params = {'page_size': page_size}
+        scenarios = {
+            'courses_list': ('get', reverse('lms:courses-list'), params, COURSES),
+            'lessons_list': ('get', reverse('lms:lessons_list'), params, LESSONS),
+            'payments_list': ('get', reverse('users:payments-list'), params, None),
+            'profile_list': ('get', reverse('users:user-profile-list'), params, None),
+            'profile_detail': ('get', reverse('users:user-profile-detail', args=(user.pk,)), None, None),
+        }
+        own_course = Course.objects.filter(owner=user).order_by('id').first()
+        if own_course is not None:
+            scenarios['courses_detail'] = ('get', reverse('lms:courses-detail', args=(own_course.pk,)), None, COURSES)
+        course = own_course or Course.objects.order_by('id').first()
+        if course is not None:
+            # Каждый запрос переключает подписку: попеременно создает и удаляет ее
+            scenarios['subscriptions_toggle'] = ('post', reverse('lms:subscriptions'), {'course_id': course.pk}, None)
+        return scenarios
+
+    def run_scenario(self, client, method, url, data, resource, options):
+        """Выполняет запросы сценария и возвращает статистику задержки (мс), пропускную способность (запросов/с),
+        максимальное количество SQL-запросов на запрос и количество ответов с ошибкой"""
+        request = getattr(client, method)
+        for _ in range(options['warmup']):
+            request(url, data)
+
+        timings, queries, errors = [], [], 0
+        for _ in range(options['iterations']):
+            if options['cold_cache'] and resource:
+                bump_cache_version(resource)
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = request(url, data)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(captured))
+            errors += response.status_code >= 400
+
+        stats = summarize(timings)
+        stats['rps'] = round(len(timings) / (sum(timings) / 1000), 1)
+        stats['queries'] = max(queries)
+        stats['errors'] = errors
+        return stats
+
+    def print_result(self, name, stats):
+        """Выводит результат сценария"""
+        line = f"{format_stats(name, stats)}, {stats['rps']} запросов/с, SQL-запросов: {stats['queries']}"
+        if stats['errors']:
+            self.stdout.write(self.style.WARNING(f"{line}, ответов с ошибкой: {stats['errors']}"))
+        else:
+            self.stdout.write(line)
+
+    def compare(self, report, baseline_path, threshold):
+        """Сравнивает результаты с базовыми. При регрессиях команда завершается с ошибкой"""
+        with open(baseline_path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        if (baseline.get('database'), baseline.get('cold_cache')) != (report['database'], report['cold_cache']):
+            self.stdout.write(self.style.WARNING('Базовые результаты получены с другой БД или другим режимом кеша'))
+
+        regressions = compare_results(report['results'], baseline['results'], threshold)
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(f'Регрессий относительно {baseline_path} нет'))
+            return
+        for name, metric, before, after in regressions:
+            self.stdout.write(self.style.ERROR(f'{name}: {metric} {before} -> {after}'))
+        raise CommandError(f'Обнаружено регрессий: {len(regressions)}')
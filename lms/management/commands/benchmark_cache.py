@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from lms.benchmarks import format_stats, measure
+from lms.cache import COURSES, LESSONS, bump_cache_version, get_cache_stats
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Измеряет задержку (p50/p99) эндпоинтов курсов и уроков с холодным и прогретым кешем'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='Email пользователя, от имени которого выполняются запросы')
+        parser.add_argument('--iterations', type=int, default=200, help='Количество запросов на каждый замер')
+        parser.add_argument('--page-size', type=int, default=10, help='Размер страницы списка')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options['email']).first() if options['email'] else User.objects.first()
+        if user is None:
+            raise CommandError('Не найден пользователь для выполнения запросов')
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        endpoints = [
+            ('courses list', reverse('lms:courses-list'), COURSES),
+            ('lessons list', reverse('lms:lessons_list'), LESSONS),
+        ]
+        stats_before = get_cache_stats()
+
+        for name, url, resource in endpoints:
+            params = {'page_size': options['page_size']}
+
+            def cold_request():
+                bump_cache_version(resource)
+                client.get(url, params)
+
+            def warm_request():
+                client.get(url, params)
+
+            cold = measure(cold_request, options['iterations'])
+            warm = measure(warm_request, options['iterations'], warmup=1)
+            self.stdout.write(format_stats(f'{name} (холодный кеш)', cold))
+            self.stdout.write(format_stats(f'{name} (прогретый кеш)', warm))
+
+        stats_after = get_cache_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Попаданий в кеш: {stats_after['hits'] - stats_before['hits']}, "
+            f"промахов: {stats_after['misses'] - stats_before['misses']}"
+        ))
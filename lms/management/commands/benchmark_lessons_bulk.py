@@ -0,0 +1,84 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from lms.models import Course, Lesson
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает создание, обновление и удаление уроков курса поштучными запросами и пакетными эндпоинтами. '
+            'Все изменения, сделанные во время замера, откатываются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='Email пользователя, от имени которого выполняются запросы')
+        parser.add_argument('--lessons', type=int, default=1000, help='Количество уроков')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options['email']).first() if options['email'] else User.objects.first()
+        if user is None:
+            raise CommandError('Не найден пользователь для выполнения запросов')
+        if user.is_moderator:
+            raise CommandError('Модераторы не могут создавать уроки, укажите другого пользователя')
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        count = options['lessons']
+        bulk_url = reverse('lms:lessons_bulk')
+
+        with transaction.atomic():
+            course = Course.objects.create(title='Курс для замера', owner=user)
+            lessons = [
+                {'title': f'Урок {number}', 'description': f'Разбор: https://youtu.be/{number}'}
+                for number in range(count)
+            ]
+
+            def single_create():
+                for lesson in lessons:
+                    client.post(reverse('lms:lessons_create'), {**lesson, 'course': course.id}, format='json')
+
+            def single_update():
+                for lesson_id in Lesson.objects.filter(course=course).values_list('id', flat=True):
+                    client.patch(reverse('lms:lessons_update', args=(lesson_id,)), {'title': 'Урок'}, format='json')
+
+            def single_delete():
+                for lesson_id in Lesson.objects.filter(course=course).values_list('id', flat=True):
+                    client.delete(reverse('lms:lessons_destroy', args=(lesson_id,)))
+
+            def bulk_create():
+                client.post(bulk_url, {'course': course.id, 'lessons': lessons}, format='json')
+
+            def bulk_update():
+                ids = Lesson.objects.filter(course=course).values_list('id', flat=True)
+                data = {'course': course.id, 'lessons': [{'id': lesson_id, 'title': 'Урок'} for lesson_id in ids]}
+                client.patch(bulk_url, data, format='json')
+
+            def bulk_delete():
+                ids = list(Lesson.objects.filter(course=course).values_list('id', flat=True))
+                client.delete(bulk_url, {'course': course.id, 'ids': ids}, format='json')
+
+            for name, operation in [
+                ('Поштучное создание', single_create),
+                ('Поштучное обновление', single_update),
+                ('Поштучное удаление', single_delete),
+                ('Пакетное создание', bulk_create),
+                ('Пакетное обновление', bulk_update),
+                ('Пакетное удаление', bulk_delete),
+            ]:
+                self.run(name, operation, count)
+            transaction.set_rollback(True)
+
+    def run(self, name, operation, count):
+        """Выполняет операцию над всеми уроками и выводит общее время и количество SQL-запросов"""
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            operation()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'{name} ({count} уроков): {elapsed * 1000:.1f} мс, {elapsed * 1000 / count:.3f} мс/урок, '
+            f'{len(queries)} SQL-запросов'
+        )
@@ -0,0 +1,59 @@
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.pagination import Cursor
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from lms.benchmarks import format_stats, measure
+from lms.models import Lesson
+from lms.paginations import CustomCursorPagination, CustomPagination
+from users.models import Payment
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает задержку получения глубокой страницы при постраничной и курсорной пагинации'
+
+    models = {
+        'lessons': Lesson,
+        'payments': Payment,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=self.models, default='payments', help='Таблица для замера')
+        parser.add_argument('--page', type=int, default=1000, help='Номер глубокой страницы')
+        parser.add_argument('--page-size', type=int, default=10, help='Размер страницы')
+        parser.add_argument('--iterations', type=int, default=50, help='Количество замеров')
+
+    def handle(self, *args, **options):
+        queryset = self.models[options['model']].objects.order_by('id')
+        page_size = options['page_size']
+        offset = (options['page'] - 1) * page_size
+        # Позиция курсора, соответствующая началу глубокой страницы: id последней записи предыдущей страницы
+        position = queryset.values_list('id', flat=True)[offset - 1:offset].first() if offset else 0
+        if position is None:
+            raise CommandError(f'В таблице меньше {offset} записей')
+
+        factory = APIRequestFactory()
+        cursor = self.get_cursor(factory, position)
+
+        def paginate(paginator_class, params):
+            request = Request(factory.get('/', {'page_size': page_size, **params}))
+            return paginator_class().paginate_queryset(queryset, request)
+
+        results = {
+            'page + count': lambda: paginate(CustomPagination, {'page': options['page']}),
+            'page без count': lambda: paginate(CustomPagination, {'page': options['page'], 'count': 'false'}),
+            'cursor': lambda: paginate(CustomCursorPagination, {'cursor': cursor}),
+        }
+        self.stdout.write(f"Таблица: {options['model']}, страница {options['page']} по {page_size} записей")
+        for name, func in results.items():
+            self.stdout.write(format_stats(name, measure(func, options['iterations'], warmup=1)))
+
+    def get_cursor(self, factory, position):
+        """Формирует значение параметра cursor для страницы, начинающейся после записи с id=position"""
+
+        paginator = CustomCursorPagination()
+        paginator.base_url = Request(factory.get('/')).build_absolute_uri()
+        url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(position)))
+        return parse_qs(urlparse(url).query)[paginator.cursor_query_param][0]
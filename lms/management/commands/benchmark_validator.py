@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from rest_framework.serializers import ValidationError
+
+from lms.benchmarks import format_stats, measure
+from lms.validators import ExternalLinksValidator
+
+
+class Command(BaseCommand):
+    help = ('Микробенчмарк ExternalLinksValidator на больших описаниях с тысячами ссылок: '
+            'время проверки должно расти линейно с размером текста')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-kb', type=int, default=100, help='Размер наименьшего описания, КБ')
+        parser.add_argument('--steps', type=int, default=4, help='Количество удвоений размера описания')
+        parser.add_argument('--iterations', type=int, default=20, help='Количество замеров на каждый размер')
+
+    def handle(self, *args, **options):
+        validator = ExternalLinksValidator(field='description')
+        chunk = 'Смотрите урок https://www.youtube.com/watch?v=dQw4w9WgXcQ и разбор https://youtu.be/dQw4w9WgXcQ. '
+
+        size_kb = options['size_kb']
+        for _ in range(options['steps']):
+            text = chunk * (size_kb * 1024 // len(chunk.encode()) + 1)
+            links = text.count('https://')
+            allowed = measure(lambda: validator({'description': text}), options['iterations'], warmup=1)
+            # Запрещенная ссылка в конце: проверяется весь текст, после чего выбрасывается ошибка
+            forbidden_text = text + ' https://evil-youtube.com.attacker.net/'
+            forbidden = measure(lambda: self.validate_forbidden(validator, forbidden_text), options['iterations'])
+
+            self.stdout.write(format_stats(f'{size_kb} КБ, {links} ссылок', allowed))
+            self.stdout.write(format_stats(f'{size_kb} КБ, запрещенная ссылка в конце', forbidden))
+            self.stdout.write(f"  {allowed['p50'] * 1000 / size_kb:.2f} мкс/КБ")
+            size_kb *= 2
+
+    @staticmethod
+    def validate_forbidden(validator, text):
+        try:
+            validator({'description': text})
+        except ValidationError:
+            pass
@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from config.settings import LMS_TRANSFER_BATCH_SIZE
+from lms.transfer import export_jsonl
+
+
+class Command(BaseCommand):
+    help = 'Экспортирует курсы с уроками и подписками в формате JSON Lines (потоково, с ограниченным расходом памяти)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Файл для записи, по умолчанию стандартный вывод')
+        parser.add_argument('--course', type=int, action='append', dest='course_ids',
+                            help='id экспортируемого курса (можно указать несколько раз), по умолчанию все курсы')
+        parser.add_argument('--chunk-size', type=int, default=LMS_TRANSFER_BATCH_SIZE,
+                            help='Количество строк, читаемых из БД за один раз')
+
+    def handle(self, *args, **options):
+        lines = export_jsonl(options['course_ids'], options['chunk_size'])
+        if not options['output']:
+            sys.stdout.writelines(lines)
+            return
+
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            count = 0
+            for line in lines:
+                file.write(line)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(f'Экспортировано записей: {count}'))
@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from config.settings import LMS_TRANSFER_BATCH_SIZE
+from lms.transfer import import_jsonl
+
+
+class Command(BaseCommand):
+    help = ('Импортирует курсы с уроками и подписками из файла JSON Lines (формат export_courses). '
+            'Файл читается построчно, объекты создаются пачками в одной транзакции')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--input', help='Файл для чтения, по умолчанию стандартный ввод')
+        parser.add_argument('--batch-size', type=int, default=LMS_TRANSFER_BATCH_SIZE,
+                            help='Количество объектов в одном bulk_create')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пачки должен быть не меньше 1')
+
+        try:
+            if options['input']:
+                with open(options['input'], encoding='utf-8') as file:
+                    counts = import_jsonl(file, options['batch_size'])
+            else:
+                counts = import_jsonl(sys.stdin, options['batch_size'])
+        except (KeyError, ValueError) as error:
+            raise CommandError(f'Импорт отменен: {error}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано курсов: {counts['course']}, уроков: {counts['lesson']}, подписок: {counts['subscription']}, "
+            f"пропущено записей: {counts['skipped']}"
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from lms.cache import COURSES, bump_cache_version
+from lms.services import repair_course_counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счетчики курсов (количество уроков и подписчиков) по фактическим данным. '
+            'Курсы обрабатываются диапазонами id, обновляются только курсы с расхождениями')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Количество id курсов в одном диапазоне')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Размер диапазона должен быть не меньше 1')
+
+        total = 0
+        for start, end, fixed in repair_course_counters(options['batch_size']):
+            total += fixed
+            if fixed:
+                self.stdout.write(f'Курсы {start} - {end}: исправлено {fixed}')
+
+        if total:
+            bump_cache_version(COURSES)
+        self.stdout.write(self.style.SUCCESS(f'Успешно исправлены счетчики {total} курсов'))
@@ -0,0 +1,133 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+
+# Границы корзин гистограммы времени ответа, секунды
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_lock = threading.Lock()
+_endpoints = {}
+
+
+class QueryRecorder:
+    """Обертка выполнения SQL-запросов (для connection.execute_wrapper): считает запросы, их суммарное время
+    и повторы одного и того же SQL (шаблона запроса без параметров). Повторы - признак проблемы N+1:
+    например, проверка группы модератора или lessons.count() для каждого объекта списка"""
+
+    def __init__(self):
+        """Конструктор класса QueryRecorder"""
+
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self):
+        """Количество повторных выполнений одного и того же SQL"""
+
+        return self.count - len(self.statements)
+
+
+class EndpointMetrics:
+    """Накопленные метрики одного эндпоинта (имя URL + HTTP-метод)"""
+
+    def __init__(self):
+        """Конструктор класса EndpointMetrics"""
+
+        self.requests = 0
+        self.duration = 0.0
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+        self.queries = 0
+        self.queries_duration = 0.0
+        self.duplicate_queries = 0
+
+
+def record_request(view_name, method, duration, recorder):
+    """Добавляет результаты запроса к метрикам эндпоинта. Метрики хранятся в памяти процесса"""
+
+    with _lock:
+        metrics = _endpoints.get((view_name, method))
+        if metrics is None:
+            metrics = _endpoints[(view_name, method)] = EndpointMetrics()
+        metrics.requests += 1
+        metrics.duration += duration
+        metrics.buckets[bisect_left(DURATION_BUCKETS, duration)] += 1
+        metrics.queries += recorder.count
+        metrics.queries_duration += recorder.duration
+        metrics.duplicate_queries += recorder.duplicates
+
+
+def reset_metrics():
+    """Очищает накопленные метрики"""
+
+    with _lock:
+        _endpoints.clear()
+
+
+def get_metrics():
+    """Копия накопленных метрик: {(имя URL, HTTP-метод): словарь значений EndpointMetrics}"""
+
+    with _lock:
+        return {key: vars(metrics).copy() for key, metrics in _endpoints.items()}
+
+
+def _escape(value):
+    """Экранирует значение метки в формате Prometheus"""
+
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(value):
+    """Форматирует значение метрики: целые числа без экспоненты, время с точностью до микросекунды"""
+
+    return f'{value:.6f}' if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """Метрики эндпоинтов в текстовом формате Prometheus"""
+
+    metrics = get_metrics()
+    lines = []
+
+    def write(name, metric_type, help_text, values):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        lines.extend(values)
+
+    def labels(view_name, method, **extra):
+        pairs = {'view': view_name, 'method': method, **extra}
+        return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs.items()) + '}'
+
+    histogram = []
+    for (view_name, method), values in sorted(metrics.items()):
+        cumulative = 0
+        for bound, count in zip((*DURATION_BUCKETS, '+Inf'), values['buckets']):
+            cumulative += count
+            histogram.append(f'lms_http_request_duration_seconds_bucket{labels(view_name, method, le=str(bound))} '
+                             f'{cumulative}')
+        histogram.append(f"lms_http_request_duration_seconds_sum{labels(view_name, method)} "
+                         f"{_format(values['duration'])}")
+        histogram.append(f"lms_http_request_duration_seconds_count{labels(view_name, method)} {values['requests']}")
+    write('lms_http_request_duration_seconds', 'histogram', 'Время ответа эндпоинта', histogram)
+
+    for name, key, help_text in (
+        ('lms_db_queries_total', 'queries', 'Количество SQL-запросов'),
+        ('lms_db_duplicate_queries_total', 'duplicate_queries', 'Количество повторных выполнений того же SQL'),
+        ('lms_db_query_duration_seconds_total', 'queries_duration', 'Суммарное время SQL-запросов'),
+    ):
+        write(name, 'counter', help_text, [
+            f'{name}{labels(view_name, method)} {_format(values[key])}'
+            for (view_name, method), values in sorted(metrics.items())
+        ])
+    return '\n'.join(lines) + '\n'
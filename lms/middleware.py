@@ -0,0 +1,40 @@
+import random
+import time
+
+from django.db import connection
+
+from config.settings import LMS_METRICS_ENABLED, LMS_METRICS_SAMPLE_RATE, LMS_METRICS_SERVER_TIMING
+from lms.metrics import QueryRecorder, record_request
+
+
+class QueryMetricsMiddleware:
+    """Собирает метрики запросов по эндпоинтам (имя URL + HTTP-метод): время ответа, количество SQL-запросов,
+    их суммарное время и повторы одного и того же SQL. Метрики отдаются в формате Prometheus (QueryMetricsAPIView),
+    а для каждого измеренного ответа добавляется заголовок Server-Timing.
+    Измеряется доля запросов LMS_METRICS_SAMPLE_RATE: остальные запросы проходят без обертки SQL-запросов"""
+
+    def __init__(self, get_response):
+        """Конструктор класса QueryMetricsMiddleware"""
+
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not LMS_METRICS_ENABLED or random.random() >= LMS_METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view_name = match.view_name if match and match.view_name else '<unresolved>'
+        record_request(view_name, request.method, duration, recorder)
+
+        if LMS_METRICS_SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries, '
+                f'{recorder.duplicates} duplicates", total;dur={duration * 1000:.1f}'
+            )
+        return response
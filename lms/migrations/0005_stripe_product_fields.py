@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0004_course_price_lesson_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='stripe_price_amount',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Сумма цены Stripe'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='stripe_price_id',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, verbose_name='ID цены Stripe'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='stripe_product_id',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, verbose_name='ID продукта Stripe'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='stripe_product_name',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, verbose_name='Название продукта Stripe'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='stripe_price_amount',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Сумма цены Stripe'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='stripe_price_id',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, verbose_name='ID цены Stripe'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='stripe_product_id',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, verbose_name='ID продукта Stripe'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='stripe_product_name',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, verbose_name='Название продукта Stripe'),
+        ),
+    ]
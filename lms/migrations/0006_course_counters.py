@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:49
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_course_counters(apps, schema_editor):
+    """Заполняет счетчики уроков и подписчиков существующих курсов"""
+    Course = apps.get_model('lms', 'Course')
+
+    def count_subquery(model_name):
+        model = apps.get_model('lms', model_name)
+        counts = model.objects.filter(
+            course=OuterRef('pk')
+        ).order_by().values('course').annotate(count=Count('pk')).values('count')
+        return Coalesce(Subquery(counts), 0)
+
+    Course.objects.update(lessons_count=count_subquery('Lesson'), subscribers_count=count_subquery('Subscription'))
+
+
+class Migration(migrations.Migration):
+    # Индекс создается без блокировки записи в таблицу (CREATE INDEX CONCURRENTLY), вне транзакции
+    atomic = False
+
+    dependencies = [
+        ('lms', '0005_stripe_product_fields'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='lessons_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество уроков'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество подписчиков'),
+        ),
+        migrations.RunPython(fill_course_counters, migrations.RunPython.noop, atomic=True),
+        AddIndexConcurrently(
+            model_name='course',
+            index=models.Index(fields=['-subscribers_count', 'id'], name='course_subscribers_idx'),
+        ),
+    ]
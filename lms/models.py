@@ -3,12 +3,47 @@ from django.db import models
 from config import settings
 
 
-class Course(models.Model):
+class StripeProductModel(models.Model):
+    """Абстрактная модель объекта оплаты. Хранит созданные для объекта продукт и цену в Stripe,
+    чтобы не создавать их заново при каждой покупке:
+        - stripe_product_id: id продукта в Stripe
+        - stripe_product_name: название, с которым создан (обновлен) продукт
+        - stripe_price_id: id цены в Stripe
+        - stripe_price_amount: сумма, для которой создана цена"""
+
+    stripe_product_id = models.CharField(max_length=255,
+                                         null=True,
+                                         blank=True,
+                                         editable=False,
+                                         verbose_name='ID продукта Stripe')
+    stripe_product_name = models.CharField(max_length=255,
+                                           null=True,
+                                           blank=True,
+                                           editable=False,
+                                           verbose_name='Название продукта Stripe')
+    stripe_price_id = models.CharField(max_length=255,
+                                       null=True,
+                                       blank=True,
+                                       editable=False,
+                                       verbose_name='ID цены Stripe')
+    stripe_price_amount = models.PositiveIntegerField(null=True,
+                                                      blank=True,
+                                                      editable=False,
+                                                      verbose_name='Сумма цены Stripe')
+
+    class Meta:
+        abstract = True
+
+
+class Course(StripeProductModel):
     """Модель обучающего курса. Хранит информацию об обучающем курсе в полях:
         - title (название): название обучающего курса
         - preview (изображение): картинка с изображением обучающего курса
         - description (описание): описание обучающего курса
-        - owner (владелец): при создании автоматически заполняется текущим пользователем"""
+        - owner (владелец): при создании автоматически заполняется текущим пользователем
+        - lessons_count, subscribers_count: количество уроков и подписчиков курса. Денормализованные счетчики,
+          изменяются атомарно (F-выражениями) при создании и удалении уроков и подписок (см. lms.services),
+          пересчитываются командой repair_course_counters"""
 
     title = models.CharField(max_length=100,
                              verbose_name='Название курса',
@@ -31,16 +66,41 @@ class Course(models.Model):
                               null=True,
                               blank=True,
                               related_name='courses')
+    lessons_count = models.PositiveIntegerField(default=0,
+                                                editable=False,
+                                                verbose_name='Количество уроков')
+    subscribers_count = models.PositiveIntegerField(default=0,
+                                                    editable=False,
+                                                    verbose_name='Количество подписчиков')
 
     class Meta:
         verbose_name = 'Курс'
         verbose_name_plural = 'Курсы'
+        # Индекс под сортировку списка курсов по популярности (?ordering=-subscribers_count,id)
+        indexes = [
+            models.Index(fields=['-subscribers_count', 'id'], name='course_subscribers_idx'),
+        ]
+
+    # Счетчики изменяются только запросами UPDATE с F-выражениями и не перезаписываются при save()
+    COUNTER_FIELDS = ('lessons_count', 'subscribers_count')
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        """Сохраняет курс. У существующего курса счетчики не сохраняются: иначе сохранение загруженного ранее
+        экземпляра (изменение курса в API или админке) затерло бы изменения счетчиков конкурентными запросами"""
+
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            excluded = {*self.COUNTER_FIELDS, *self.get_deferred_fields()}
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in excluded
+            ]
+        super().save(*args, **kwargs)
+
 
-class Lesson(models.Model):
+class Lesson(StripeProductModel):
     """Модель урока. Связана с моделью Course (обучающего курса) и хранит информацию об уроке в полях:
         - course: поле внешнего ключа для связи с моделью Course
         - title: название урока
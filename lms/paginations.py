@@ -1,9 +1,126 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
-    """Кастомный пагинатор для отображения количества сущностей на странице"""
+    """Кастомный пагинатор для отображения количества сущностей на странице.
+    С параметром запроса ?count=false работает без подсчета общего количества (COUNT(*)):
+    наличие следующей страницы определяется выборкой одной лишней записи, поле 'count' в ответе отсутствует"""
 
     page_size = 4
     page_size_query_param = 'page_size'
     max_page_size = 10
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Разбивает queryset на страницы с подсчетом общего количества или без него"""
+
+        self.with_count = request.query_params.get(self.count_query_param) != 'false'
+        if self.with_count:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        try:
+            self.page_number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            self.page_number = 0
+        if self.page_number < 1:
+            raise NotFound(self.invalid_page_message)
+
+        offset = (self.page_number - 1) * page_size
+        items = list(queryset[offset:offset + page_size + 1])
+        if not items and self.page_number > 1:
+            # Как и в режиме с подсчетом: страница за пределами списка не существует
+            raise NotFound(self.invalid_page_message)
+        self.has_next = len(items) > page_size
+        return items[:page_size]
+
+    def get_paginated_response(self, data):
+        """Формирует ответ со ссылками на соседние страницы (и общим количеством, если оно подсчитано)"""
+
+        if self.with_count:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if self.with_count:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.with_count:
+            return super().get_previous_link()
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+
+class CustomCursorPagination(CursorPagination):
+    """Курсорный (keyset) пагинатор: страница выбирается условием по индексированному полю сортировки
+    вместо OFFSET и не требует COUNT(*), поэтому скорость не зависит от глубины страницы.
+    Если у контроллера есть OrderingFilter с сортировкой, используется она, иначе сортировка по 'id'"""
+
+    page_size = 4
+    page_size_query_param = 'page_size'
+    max_page_size = 10
+    ordering = 'id'
+
+
+class SwitchablePagination(BasePagination):
+    """Пагинатор, выбирающий режим постраничного вывода:
+        - 'page': по номеру страницы (CustomPagination)
+        - 'cursor': курсорная пагинация (CustomCursorPagination)
+        - 'none': список без пагинации (массив объектов, как до введения пагинации) - для обратной совместимости
+          эндпоинтов, которые раньше отдавали массив. Клиент может выбрать этот режим, только если у контроллера
+          есть атрибут 'allow_unpaginated' (или режим задан контроллеру по умолчанию)
+    Режим по умолчанию задается атрибутом контроллера 'pagination_mode',
+    клиент может выбрать режим параметром запроса ?pagination=page|cursor|none"""
+
+    mode_query_param = 'pagination'
+    default_mode = 'page'
+    unpaginated_mode = 'none'
+    paginator_classes = {
+        'page': CustomPagination,
+        'cursor': CustomCursorPagination,
+    }
+
+    def get_mode(self, request, view):
+        """Определяет режим пагинации из параметра запроса или атрибута контроллера"""
+
+        mode = request.query_params.get(self.mode_query_param)
+        if mode in self.paginator_classes:
+            return mode
+        if mode == self.unpaginated_mode and getattr(view, 'allow_unpaginated', False):
+            return mode
+        return getattr(view, 'pagination_mode', self.default_mode)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        mode = self.get_mode(request, view)
+        if mode == self.unpaginated_mode:
+            # None означает для контроллера вывод списка без пагинации
+            return None
+        self.paginator = self.paginator_classes[mode]()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+
+class PaymentHistoryPagination(CustomCursorPagination):
+    """Курсорный пагинатор истории платежей пользователя (новые сначала).
+    Страница выбирается по индексу (user, -payment_date), без OFFSET и COUNT(*)"""
+
+    ordering = '-payment_date'
@@ -1,8 +1,11 @@
+from collections import Counter
+
 from rest_framework import serializers
-from rest_framework.fields import SerializerMethodField
 from rest_framework.serializers import ModelSerializer
 
+from config.settings import SUBSCRIPTIONS_BATCH_MAX_SIZE
 from lms.models import Course, Lesson, Subscription
+from lms.services import change_lessons_count
 from lms.validators import ExternalLinksValidator
 
 
@@ -13,37 +16,88 @@ class LessonSerializer(ModelSerializer):
 
     class Meta:
         model = Lesson
-        fields = '__all__'
+        exclude = ('stripe_product_id', 'stripe_product_name', 'stripe_price_id', 'stripe_price_amount')
         read_only_fields = ('owner',)
         validators = [ExternalLinksValidator(field='description')]
 
 
+class LessonBulkListSerializer(serializers.ListSerializer):
+    """Списочный сериализатор для пакетной работы с уроками одного курса.
+    Уроки проверяются вместе, а сохраняются одним запросом bulk_create / bulk_update.
+    При обновлении instance - словарь {id: урок}, каждый элемент данных сопоставляется с уроком по 'id'"""
+
+    def run_child_validation(self, data):
+        """Сопоставляет элемент данных с обновляемым уроком. Неизвестный 'id' - ошибка этого элемента"""
+        if self.instance is not None:
+            lesson_id = data.get('id') if isinstance(data, dict) else None
+            self.child.instance = self.instance.get(lesson_id) if isinstance(lesson_id, int) else None
+            if self.child.instance is None:
+                raise serializers.ValidationError({'id': ['Урок не найден']})
+        return super().run_child_validation(data)
+
+    def create(self, validated_data):
+        """Создает все уроки одним запросом. Переданный 'id' при создании игнорируется.
+        bulk_create не отправляет сигналы, поэтому счетчики уроков курсов увеличиваются явно"""
+        lessons = []
+        for attrs in validated_data:
+            attrs.pop('id', None)
+            lessons.append(Lesson(**attrs))
+        lessons = Lesson.objects.bulk_create(lessons)
+        change_lessons_count(Counter(lesson.course_id for lesson in lessons))
+        return lessons
+
+    def update(self, instance, validated_data):
+        """Обновляет все уроки одним запросом, изменяя только переданные поля"""
+        lessons = []
+        fields = set()
+        for attrs in validated_data:
+            lesson = instance[attrs.pop('id')]
+            for field, value in attrs.items():
+                setattr(lesson, field, value)
+            fields.update(attrs)
+            lessons.append(lesson)
+        if fields:
+            Lesson.objects.bulk_update(lessons, fields)
+        return lessons
+
+
+class LessonBulkSerializer(LessonSerializer):
+    """Сериализатор урока для пакетных операций. Курс задается один на весь пакет (передается в save),
+    поэтому поле 'course' только для чтения и не проверяется отдельным запросом для каждого урока.
+    Поле 'id' используется для сопоставления обновляемых уроков"""
+
+    id = serializers.IntegerField(required=False)
+
+    class Meta(LessonSerializer.Meta):
+        read_only_fields = ('owner', 'course')
+        list_serializer_class = LessonBulkListSerializer
+
+
 class CourseSerializer(ModelSerializer):
     """Сериализатор для получения обучающего курса (Course).
     Включает основные данные обучающего курса, включая поля:
-        - lessons_count: поле показывает количество уроков курса (вычисляемое поле)
+        - lessons_count: количество уроков курса (хранимый счетчик, только для чтения)
+        - subscribers_count: количество подписчиков курса (хранимый счетчик, только для чтения)
         - lessons: поле для отображения списка уроков курса (вложенный сериализатор)
     Есть валидация по полю 'description', для запрета использования сторонних ссылок, кроме 'youtube'"""
 
-    lessons_count = SerializerMethodField()
     lessons = LessonSerializer(many=True, read_only=True)
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
         model = Course
-        fields = ['id', 'title', 'description', 'price', 'lessons_count', 'lessons', 'is_subscribed']
+        fields = ['id', 'title', 'description', 'price', 'lessons_count', 'subscribers_count', 'lessons',
+                  'is_subscribed']
         read_only_fields = ('owner',)
         validators = [ExternalLinksValidator(field='description')]
 
-    def get_lessons_count(self, obj):
-        """Вычисляет общее количество уроков, связанных с курсом.
-        Использует аргумент obj (Course): Объект курса, для которого рассчитывается количество уроков
-        и related_name='lessons' из модели Lesson.course
-        """
-        return obj.lessons.count()
-
     def get_is_subscribed(self, obj):
-        """Сериализатор проверяет, подписан ли текущий пользователь на курс"""
+        """Сериализатор проверяет, подписан ли текущий пользователь на курс.
+        Использует множество курсов пользователя из контекста ('subscribed_course_ids', см. CourseViewSet),
+        если оно есть, иначе выполняет запрос к подпискам"""
+        subscribed_course_ids = self.context.get('subscribed_course_ids')
+        if subscribed_course_ids is not None:
+            return obj.id in subscribed_course_ids
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Subscription.objects.filter(
@@ -51,3 +105,16 @@ class CourseSerializer(ModelSerializer):
                 course=obj
             ).exists()
         return False
+
+
+class SubscriptionToggleSerializer(serializers.Serializer):
+    """Сериализатор параметров переключения подписки на курс"""
+
+    course_id = serializers.IntegerField(min_value=1)
+
+
+class SubscriptionBatchSerializer(serializers.Serializer):
+    """Сериализатор параметров пакетной подписки (отписки) на курсы"""
+
+    course_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False,
+                                       max_length=SUBSCRIPTIONS_BATCH_MAX_SIZE)
@@ -0,0 +1,158 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from lms.cache import COURSES, LESSONS, SUBSCRIPTIONS, bump_cache_version, get_cached_ids, user_resource
+from lms.models import Course, Lesson, Subscription
+
+
+def get_subscribed_course_ids(user_id):
+    """Множество id курсов, на которые подписан пользователь. Хранится в кеше и загружается из БД
+    только после изменения подписок пользователя (или вытеснения из кеша)"""
+
+    return get_cached_ids(
+        user_resource(SUBSCRIPTIONS, user_id),
+        lambda: Subscription.objects.filter(user_id=user_id).values_list('course_id', flat=True)
+    )
+
+
+def invalidate_subscriptions(*user_ids):
+    """Сбрасывает кеш подписок пользователей (множество курсов и персональный кеш ответов курсов)"""
+
+    bump_cache_version(*(user_resource(SUBSCRIPTIONS, user_id) for user_id in user_ids))
+
+
+def lock_courses(course_ids):
+    """Блокирует строки курсов (SELECT ... FOR UPDATE в порядке id, чтобы избежать взаимных блокировок) и возвращает
+    множество id существующих курсов. Пока блокировка удерживается, подписки этих курсов другими транзакциями
+    через subscribe и unsubscribe не создаются и не удаляются, поэтому прочитанные подписки пользователя
+    не устаревают до изменения счетчиков"""
+
+    courses = Course.objects.select_for_update().filter(pk__in=course_ids).order_by('pk')
+    return set(courses.values_list('pk', flat=True))
+
+
+def get_user_subscriptions(user, course_ids):
+    """Множество id курсов из course_ids, на которые подписан пользователь (по индексу уникальности подписки)"""
+
+    return set(Subscription.objects.filter(user=user, course_id__in=course_ids).values_list('course_id', flat=True))
+
+
+def subscribe(user, course_ids):
+    """Подписывает пользователя на курсы одним запросом INSERT и увеличивает счетчики подписчиков
+    только тех курсов, подписки на которые созданы (одним запросом UPDATE с F()).
+    Повторная подписка ничего не меняет, поэтому одновременные запросы не приводят к IntegrityError.
+    Если какого-то из курсов не существует, подписки не создаются. Возвращает множество id несуществующих курсов"""
+
+    course_ids = set(course_ids)
+    with transaction.atomic():
+        missing = course_ids - lock_courses(course_ids)
+        if missing:
+            return missing
+
+        # Пакетная вставка не отправляет сигналы моделей, поэтому счетчики подписчиков и кеш подписок
+        # обновляются явно
+        created = course_ids - get_user_subscriptions(user, course_ids)
+        Subscription.objects.bulk_create(
+            [Subscription(user=user, course_id=course_id) for course_id in created],
+            ignore_conflicts=True
+        )
+        change_subscribers_count(created, 1)
+    if created:
+        invalidate_subscriptions(user.pk)
+    return missing
+
+
+def unsubscribe(user, course_ids):
+    """Отписывает пользователя от курсов одним запросом DELETE и уменьшает счетчики подписчиков курсов,
+    подписки на которые удалены (одним запросом UPDATE с F()).
+    Отписка от курса без подписки ничего не меняет. Возвращает количество удаленных подписок"""
+
+    with transaction.atomic():
+        lock_courses(course_ids)
+        subscribed = get_user_subscriptions(user, course_ids)
+        if subscribed:
+            subscriptions = Subscription.objects.filter(user=user, course_id__in=subscribed)
+            # Обработчик post_delete подписок (lms.signals) пропускает это удаление: счетчики изменяются ниже
+            subscriptions.subscribers_counted = True
+            subscriptions.delete()
+            change_subscribers_count(subscribed, -1)
+    if subscribed:
+        invalidate_subscriptions(user.pk)
+    return len(subscribed)
+
+
+def count_subquery(model):
+    """Подзапрос количества объектов model (уроков или подписок), ссылающихся на курс внешнего запроса"""
+
+    counts = model.objects.filter(
+        course=OuterRef('pk')
+    ).order_by().values('course').annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts), 0)
+
+
+def change_lessons_count(deltas):
+    """Изменяет счетчики уроков курсов на величины из словаря {id курса: изменение}.
+    Изменение выполняется в БД выражением F(), поэтому одновременные изменения одного курса не теряются"""
+
+    for course_id, delta in deltas.items():
+        if delta:
+            Course.objects.filter(pk=course_id).update(lessons_count=Greatest(F('lessons_count') + delta, 0))
+
+
+def delete_lessons(queryset):
+    """Удаляет уроки queryset. Счетчики уроков изменяются одним запросом на курс, а кеш сбрасывается один раз:
+    обработчики post_delete уроков (lms.signals) пропускают удаление, запущенное этим queryset
+    (признак lessons_counted), иначе на каждый удаленный урок выполнялся бы отдельный UPDATE курса"""
+
+    deltas = Counter()
+    for course_id in queryset.values_list('course_id', flat=True):
+        deltas[course_id] -= 1
+    queryset.lessons_counted = True
+    queryset.delete()
+    change_lessons_count(deltas)
+    bump_cache_version(COURSES, LESSONS)
+
+
+def change_subscribers_count(course_ids, delta):
+    """Изменяет счетчики подписчиков курсов на delta одним запросом UPDATE с выражением F().
+    Одновременные изменения одного курса не теряются, а уменьшение не опускает счетчик ниже нуля.
+    Счетчик выводится в кешируемых ответах курсов всех пользователей (и по нему сортируется список),
+    поэтому кеш курсов сбрасывается"""
+
+    if course_ids:
+        Course.objects.filter(pk__in=course_ids).update(
+            subscribers_count=Greatest(F('subscribers_count') + delta, 0)
+        )
+        bump_cache_version(COURSES)
+
+
+def recount_course_counters(queryset):
+    """Пересчитывает счетчики уроков и подписчиков курсов из queryset одним запросом UPDATE.
+    Обновляются только курсы, счетчики которых расходятся с фактическими. Возвращает количество исправленных курсов"""
+
+    stale = queryset.annotate(
+        actual_lessons=count_subquery(Lesson),
+        actual_subscribers=count_subquery(Subscription),
+    ).exclude(
+        lessons_count=F('actual_lessons'),
+        subscribers_count=F('actual_subscribers'),
+    )
+    return Course.objects.filter(pk__in=stale.values('pk')).update(
+        lessons_count=count_subquery(Lesson),
+        subscribers_count=count_subquery(Subscription),
+    )
+
+
+def repair_course_counters(batch_size):
+    """Пересчитывает счетчики всех курсов диапазонами id по batch_size (каждый диапазон - отдельный запрос,
+    таблица не блокируется целиком). Генератор кортежей (первый id, последний id, количество исправленных курсов)"""
+
+    bounds = Course.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return
+    for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+        end = min(start + batch_size - 1, bounds['last'])
+        yield start, end, recount_course_counters(Course.objects.filter(pk__gte=start, pk__lte=end))
@@ -0,0 +1,118 @@
+from django.contrib.auth import get_user_model
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from lms.cache import COURSES, LESSONS, bump_cache_version
+from lms.models import Course, Lesson, Subscription
+from lms.services import change_lessons_count, change_subscribers_count, invalidate_subscriptions
+
+
+def is_deleted_with(origin, model):
+    """Проверяет, что объект удаляется каскадно вместе с объектом (объектами queryset) модели model"""
+
+    return isinstance(origin, model) or (isinstance(origin, QuerySet) and origin.model is model)
+
+
+def is_counted_delete(origin, marker):
+    """Проверяет, что удаление запущено функцией lms.services, которая сама изменяет счетчики и сбрасывает кеш
+    (queryset помечен атрибутом marker)"""
+
+    return isinstance(origin, QuerySet) and getattr(origin, marker, False)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_courses_cache(sender, **kwargs):
+    """Сбрасывает кеш курсов при изменении курса"""
+
+    bump_cache_version(COURSES)
+
+
+@receiver(post_save, sender=Subscription)
+def invalidate_subscriptions_cache(sender, instance, **kwargs):
+    """Сбрасывает кеш подписок пользователя при создании подписки"""
+
+    invalidate_subscriptions(instance.user_id)
+
+
+@receiver(post_save, sender=Subscription)
+def increment_subscribers_count(sender, instance, created, raw=False, **kwargs):
+    """Увеличивает счетчик подписчиков курса при создании подписки через save()"""
+
+    if created and not raw:
+        change_subscribers_count([instance.course_id], 1)
+
+
+@receiver(post_delete, sender=Subscription)
+def decrement_subscribers_count(sender, instance, origin=None, **kwargs):
+    """Уменьшает счетчик подписчиков курса и сбрасывает кеш подписок пользователя при удалении подписки
+    (subscription.delete(), админка, удаление queryset). Пропускаются:
+        - отписка через lms.services.unsubscribe (признак subscribers_counted): счетчики и кеш уже обновлены
+        - каскадное удаление пользователя: счетчики уменьшаются одним запросом (decrement_user_subscriptions)
+        - каскадное удаление курса: счетчик удаляется вместе с курсом, сбрасывается только кеш подписок"""
+
+    if is_counted_delete(origin, 'subscribers_counted') or is_deleted_with(origin, get_user_model()):
+        return
+    if not is_deleted_with(origin, Course):
+        change_subscribers_count([instance.course_id], -1)
+    invalidate_subscriptions(instance.user_id)
+
+
+@receiver(pre_delete, sender=get_user_model())
+def remember_user_subscriptions(sender, instance, **kwargs):
+    """Запоминает курсы, на которые подписан удаляемый пользователь: его подписки удаляются каскадно,
+    и счетчики подписчиков этих курсов нужно уменьшить"""
+
+    instance._subscribed_course_ids = list(
+        Subscription.objects.filter(user=instance).values_list('course_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=get_user_model())
+def decrement_user_subscriptions(sender, instance, **kwargs):
+    """Уменьшает счетчики подписчиков курсов удаленного пользователя одним запросом"""
+
+    change_subscribers_count(getattr(instance, '_subscribed_course_ids', None), -1)
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_lessons_cache(sender, origin=None, **kwargs):
+    """Сбрасывает кеш уроков и курсов (курс содержит вложенный список уроков) при изменении урока"""
+
+    if not is_counted_delete(origin, 'lessons_counted'):
+        bump_cache_version(COURSES, LESSONS)
+
+
+@receiver(post_init, sender=Lesson)
+def remember_lesson_course(sender, instance, **kwargs):
+    """Запоминает курс загруженного урока, чтобы при переносе урока в другой курс изменить счетчики обоих курсов.
+    Значение берется из __dict__: при отложенном поле course_id обращение к атрибуту выполнило бы запрос"""
+
+    instance._counted_course_id = instance.__dict__.get('course_id')
+
+
+@receiver(post_save, sender=Lesson)
+def update_lessons_count(sender, instance, created, raw=False, **kwargs):
+    """Изменяет счетчики уроков курсов при создании урока или его переносе в другой курс"""
+
+    if raw:
+        return
+    previous = instance._counted_course_id
+    if created:
+        change_lessons_count({instance.course_id: 1})
+    elif previous is not None and previous != instance.course_id:
+        change_lessons_count({previous: -1, instance.course_id: 1})
+    instance._counted_course_id = instance.course_id
+
+
+@receiver(post_delete, sender=Lesson)
+def decrement_lessons_count(sender, instance, origin=None, **kwargs):
+    """Уменьшает счетчик уроков курса при удалении урока. При каскадном удалении самого курса
+    счетчик не изменяется: строка курса удаляется в той же операции. При пакетном удалении
+    (lms.services.delete_lessons) счетчики изменяются одним запросом на курс"""
+
+    if is_deleted_with(origin, Course) or is_counted_delete(origin, 'lessons_counted'):
+        return
+    change_lessons_count({instance.course_id: -1})
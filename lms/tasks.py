@@ -1,16 +1,76 @@
 from celery import shared_task
-from django.core.mail import send_mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
 
-from config.settings import EMAIL_HOST_USER
+from config.settings import COURSE_UPDATE_NOTIFICATION_WINDOW, EMAIL_HOST_USER, NOTIFICATION_BATCH_SIZE
+from lms.cache import increment_counter
 from lms.models import Course, Subscription
 
 
+PENDING_NOTIFICATION_KEY = 'lms:course_update_pending:{course_id}'
+NOTIFICATION_STATS_KEY = 'lms:course_update_notifications:{result}'
+
+
+def schedule_course_update_notification(course_id):
+    """Планирует уведомление подписчиков об обновлении курса с задержкой COURSE_UPDATE_NOTIFICATION_WINDOW.
+    Если уведомление по курсу уже запланировано (в Redis есть маркер), новое не создается - все обновления
+    курса в пределах окна объединяются в одну рассылку. Возвращает True, если рассылка запланирована"""
+
+    key = PENDING_NOTIFICATION_KEY.format(course_id=course_id)
+    # Время жизни маркера с запасом: если задача потеряется, маркер все равно истечет
+    if cache.add(key, 1, COURSE_UPDATE_NOTIFICATION_WINDOW * 2):
+        send_mail_about_update.apply_async((course_id,), countdown=COURSE_UPDATE_NOTIFICATION_WINDOW)
+        increment_counter(NOTIFICATION_STATS_KEY.format(result='scheduled'))
+        return True
+    increment_counter(NOTIFICATION_STATS_KEY.format(result='coalesced'))
+    return False
+
+
+def get_notification_stats():
+    """Возвращает количество запланированных и объединенных уведомлений об обновлении курсов"""
+
+    return {
+        result: cache.get(NOTIFICATION_STATS_KEY.format(result=result), 0)
+        for result in ('scheduled', 'coalesced')
+    }
+
+
 @shared_task
 def send_mail_about_update(course_id):
-    """Отправляет email-уведомления всем подписанным пользователям об обновлении курса."""
+    """Отправляет email-уведомления всем подписанным пользователям об обновлении курса.
+    Адреса подписчиков читаются из БД потоком, разбиваются на пачки по NOTIFICATION_BATCH_SIZE,
+    и каждая пачка сразу ставится в очередь отдельной подзадачей: память задачи ограничена одной пачкой,
+    а скорость рассылки масштабируется числом воркеров"""
+
+    # Снимаем маркер до чтения данных: обновления, пришедшие во время рассылки, запланируют новую
+    cache.delete(PENDING_NOTIFICATION_KEY.format(course_id=course_id))
+
+    course_title = Course.objects.filter(id=course_id).values_list('title', flat=True).first()
+    if course_title is None:
+        return 'Курс не найден'
+
+    emails = Subscription.objects.filter(course_id=course_id).values_list('user__email', flat=True)
+    batches_count = 0
+    batch = []
+    for email in emails.iterator(chunk_size=NOTIFICATION_BATCH_SIZE):
+        batch.append(email)
+        if len(batch) == NOTIFICATION_BATCH_SIZE:
+            send_mail_batch.delay(course_title, batch)
+            batches_count += 1
+            batch = []
+    if batch:
+        send_mail_batch.delay(course_title, batch)
+        batches_count += 1
+    return f'Запланировано пачек писем: {batches_count}'
+
+
+@shared_task
+def send_mail_batch(course_title, recipients):
+    """Отправляет уведомления об обновлении курса пачке получателей через одно SMTP-соединение"""
 
-    course = Course.objects.get(id=course_id)
-    subscriptions = Subscription.objects.filter(course=course)
-    for subscription in subscriptions:
-        send_mail('Новое обновление', f'Вышло обновление курса {course.title}.',
-                  EMAIL_HOST_USER, [subscription.user.email])
+    messages = [
+        EmailMessage('Новое обновление', f'Вышло обновление курса {course_title}.', EMAIL_HOST_USER, [email])
+        for email in recipients
+    ]
+    with get_connection() as connection:
+        return connection.send_messages(messages)
@@ -1,16 +1,42 @@
+import io
+import json
+from unittest.mock import patch
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.serializers import ValidationError
 from rest_framework.test import APITestCase
 
+from config.celery import app
+from lms.benchmarks import compare_results
+from lms.cache import SUBSCRIPTIONS, get_cache_stats, get_cached_ids, user_resource
+from lms.metrics import QueryRecorder, get_metrics, reset_metrics
 from lms.models import Course, Lesson, Subscription
+from lms.services import get_subscribed_course_ids, subscribe, unsubscribe
+from lms.tasks import get_notification_stats, schedule_course_update_notification, send_mail_about_update
+from lms.transfer import export_jsonl, import_jsonl
+from lms.validators import ExternalLinksValidator
 from users.models import User
 
 
+def data_queries(queries):
+    """SQL-запросы без управления транзакцией (SAVEPOINT / RELEASE SAVEPOINT)"""
+
+    return [query for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+
+
 class LessonTestCase(APITestCase):
     """Тестирование CRUD операций для уроков (Lesson)"""
 
     def setUp(self):
         """Настройка тестовых данных перед каждым тестом"""
+        cache.clear()
         self.user = User.objects.create_user(email='test_user@sky.pro', password='testpass')
         self.course = Course.objects.create(title='Тестовый курс', description='Описание курса', owner=self.user)
         self.lesson = Lesson.objects.create(title='Тестовый урок', description='Описание урока', course=self.course,
@@ -113,6 +139,7 @@ class SubscriptionTestCase(APITestCase):
     def setUp(self):
         """Настройка тестовых данных перед каждым тестом"""
 
+        cache.clear()
         self.user = User.objects.create_user(
             email='user@sky.pro',
             password='123test'
@@ -154,3 +181,908 @@ class SubscriptionTestCase(APITestCase):
         self.assertFalse(
             Subscription.objects.filter(user=self.user, course=self.course).exists()
         )
+
+    def test_subscription_toggle_missing_course(self):
+        """Тест переключения подписки на несуществующий курс"""
+
+        response = self.client.post(reverse('lms:subscriptions'), {'course_id': 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(reverse('lms:subscriptions'), {'course_id': 10 ** 6}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_subscribe_idempotent(self):
+        """Тест идемпотентной подписки: повторный запрос не создает дубликат и не вызывает ошибку"""
+
+        url = reverse('lms:course_subscription', args=(self.course.id,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Блокировка курса (с проверкой существования), чтение подписок пользователя, INSERT и UPDATE счетчика
+        # выражением F() - без пересчета всех подписок курса
+        self.assertEqual(len(data_queries(queries)), 4)
+        self.assertFalse(any('COUNT' in query['sql'] for query in queries))
+
+        self.assertEqual(self.client.put(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(Subscription.objects.filter(user=self.user, course=self.course).count(), 1)
+        self.assertEqual(
+            self.client.put(reverse('lms:course_subscription', args=(10 ** 6,))).status_code,
+            status.HTTP_404_NOT_FOUND
+        )
+
+    def test_unsubscribe_idempotent(self):
+        """Тест идемпотентной отписки одним запросом DELETE"""
+
+        Subscription.objects.create(user=self.user, course=self.course)
+        url = reverse('lms:course_subscription', args=(self.course.id,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        # Блокировка курса, чтение подписок пользователя, выборка и DELETE удаляемых подписок
+        # (у подписок есть обработчик post_delete) и UPDATE счетчика выражением F()
+        self.assertEqual(len(data_queries(queries)), 5)
+        self.assertFalse(any('COUNT' in query['sql'] for query in queries))
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_subscription_batch(self):
+        """Тест пакетной подписки и отписки"""
+
+        courses = [self.course] + [Course.objects.create(title=f'Курс {number}') for number in range(2)]
+        course_ids = [course.id for course in courses]
+        Subscription.objects.create(user=self.user, course=self.course)
+        url = reverse('lms:subscriptions_batch')
+
+        response = self.client.put(url, {'course_ids': course_ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Subscription.objects.filter(user=self.user).count(), 3)
+
+        response = self.client.put(url, {'course_ids': [courses[1].id, 10 ** 6]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.delete(url, {'course_ids': course_ids[:2]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Subscription.objects.values_list('course_id', flat=True)), [courses[2].id])
+
+    def test_unsubscribe_invalidates_cache(self):
+        """Тест сброса кеша курсов при отписке"""
+
+        Subscription.objects.create(user=self.user, course=self.course)
+        url = reverse('lms:courses-detail', args=(self.course.pk,))
+        self.assertTrue(self.client.get(url).json()['is_subscribed'])
+        self.client.delete(reverse('lms:course_subscription', args=(self.course.id,)))
+        self.assertFalse(self.client.get(url).json()['is_subscribed'])
+
+
+class CourseQueryCountTestCase(APITestCase):
+    """Тестирование количества SQL-запросов при получении курсов"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        cache.clear()
+        self.user = User.objects.create_user(email='owner@sky.pro', password='testpass')
+        for number in range(6):
+            course = Course.objects.create(title=f'Курс {number}', owner=self.user)
+            for lesson_number in range(3):
+                Lesson.objects.create(title=f'Урок {lesson_number}', course=course, owner=self.user)
+            if number % 2:
+                Subscription.objects.create(user=self.user, course=course)
+        self.client.force_authenticate(user=self.user)
+
+    def get_queries_count(self, url, params=None):
+        """Выполняет GET-запрос и возвращает количество выполненных SQL-запросов"""
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def test_course_list_queries_do_not_depend_on_page_size(self):
+        """Тест постоянного количества запросов для списка курсов при разном размере страницы"""
+
+        url = reverse('lms:courses-list')
+        # Первый запрос прогревает кеш ролей пользователя
+        self.get_queries_count(url)
+        small_page = self.get_queries_count(url, {'page_size': 1})
+        large_page = self.get_queries_count(url, {'page_size': 6})
+        self.assertEqual(small_page, large_page)
+
+    def test_course_list_data(self):
+        """Тест корректности счетчиков и признака подписки в списке курсов"""
+
+        url = reverse('lms:courses-list')
+        response = self.client.get(url, {'page_size': 6})
+        results = response.json()['results']
+        self.assertEqual([course['lessons_count'] for course in results], [3] * 6)
+        self.assertEqual([len(course['lessons']) for course in results], [3] * 6)
+        self.assertEqual([course['is_subscribed'] for course in results], [False, True] * 3)
+
+    def test_course_retrieve_queries(self):
+        """Тест количества запросов при получении деталей курса"""
+
+        first, second = Course.objects.order_by('id')[:2]
+        url = reverse('lms:courses-detail', args=(first.pk,))
+        # Загрузка ролей пользователя, оплаченных курсов, курс, уроки одним запросом и множество подписок пользователя
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertEqual(response.json()['lessons_count'], 3)
+
+        # Роли, доступы и подписки уже в кеше: только курс и его уроки
+        url = reverse('lms:courses-detail', args=(second.pk,))
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertTrue(response.json()['is_subscribed'])
+
+
+class SubscriptionCacheTestCase(APITestCase):
+    """Тестирование кеша множества подписок пользователя"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        cache.clear()
+        self.user = User.objects.create_user(email='subscriber@sky.pro', password='testpass')
+        self.other = User.objects.create_user(email='other@sky.pro', password='testpass')
+        self.courses = [Course.objects.create(title=f'Курс {number}', owner=self.user) for number in range(3)]
+
+    def test_cached_after_first_load(self):
+        """Тест загрузки множества подписок из БД только при первом обращении"""
+
+        subscribe(self.user, [self.courses[0].id])
+        with self.assertNumQueries(1):
+            self.assertEqual(get_subscribed_course_ids(self.user.pk), {self.courses[0].id})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_subscribed_course_ids(self.user.pk), {self.courses[0].id})
+
+    def test_invalidated_per_user(self):
+        """Тест сброса кеша только у пользователя, изменившего подписки"""
+
+        get_subscribed_course_ids(self.user.pk)
+        get_subscribed_course_ids(self.other.pk)
+        subscribe(self.user, [course.id for course in self.courses])
+        unsubscribe(self.user, [self.courses[1].id])
+        Subscription.objects.create(user=self.other, course=self.courses[2])
+
+        self.assertEqual(get_subscribed_course_ids(self.user.pk), {self.courses[0].id, self.courses[2].id})
+        self.assertEqual(get_subscribed_course_ids(self.other.pk), {self.courses[2].id})
+
+    def test_stale_load_during_subscribe(self):
+        """Тест гонки: множество загружено из БД до подписки, а сохранено в кеш после нее.
+        Устаревшее множество сохраняется со старой версией и не используется"""
+
+        course_id = self.courses[0].id
+        resource = user_resource(SUBSCRIPTIONS, self.user.pk)
+
+        def stale_loader():
+            # Конкурентный запрос подписывается, пока этот запрос читает подписки из БД
+            subscribe(self.user, [course_id])
+            return []
+
+        self.assertEqual(get_cached_ids(resource, stale_loader), frozenset())
+        self.assertEqual(get_subscribed_course_ids(self.user.pk), {course_id})
+
+    def test_stale_load_before_commit(self):
+        """Тест гонки: множество загружено после подписки, но до фиксации транзакции (без новой подписки).
+        Повторный сброс версии после фиксации делает его недействительным"""
+
+        course_id = self.courses[0].id
+        resource = user_resource(SUBSCRIPTIONS, self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            subscribe(self.user, [course_id])
+            # Конкурентный запрос еще не видит незафиксированную подписку
+            self.assertEqual(get_cached_ids(resource, list), frozenset())
+        self.assertEqual(get_subscribed_course_ids(self.user.pk), {course_id})
+
+    def test_concurrent_subscribe_unsubscribe(self):
+        """Тест чередования подписки и отписки с чтением кеша между ними"""
+
+        course_id = self.courses[0].id
+        for _ in range(3):
+            subscribe(self.user, [course_id])
+            subscribe(self.user, [course_id])
+            self.assertEqual(get_subscribed_course_ids(self.user.pk), {course_id})
+            unsubscribe(self.user, [course_id])
+            unsubscribe(self.user, [course_id])
+            self.assertEqual(get_subscribed_course_ids(self.user.pk), frozenset())
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_course_list_uses_cached_subscriptions(self):
+        """Тест отображения признака подписки для списка курсов без запросов к подпискам"""
+
+        subscribe(self.user, [self.courses[1].id])
+        self.client.force_authenticate(user=self.user)
+        url = reverse('lms:courses-list')
+        get_subscribed_course_ids(self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            results = self.client.get(url).json()['results']
+        self.assertEqual([course['is_subscribed'] for course in results], [False, True, False])
+        self.assertFalse(any('lms_subscription' in query['sql'] for query in queries.captured_queries))
+
+
+class CourseCountersTestCase(APITestCase):
+    """Тестирование счетчиков уроков и подписчиков курса"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        cache.clear()
+        self.user = User.objects.create_user(email='counters@sky.pro', password='testpass')
+        self.courses = [Course.objects.create(title=f'Курс {number}', owner=self.user) for number in range(3)]
+
+    def assertCounters(self, course, lessons_count, subscribers_count):
+        """Проверяет сохраненные счетчики курса"""
+
+        course.refresh_from_db()
+        self.assertEqual((course.lessons_count, course.subscribers_count), (lessons_count, subscribers_count))
+
+    def test_course_save_keeps_counters(self):
+        """Тест сохранения загруженного ранее курса: счетчики, измененные после загрузки, не затираются"""
+
+        course = Course.objects.get(pk=self.courses[0].pk)
+        Lesson.objects.create(title='Урок', course=course)
+        course.title = 'Новое название'
+        course.save()
+        self.assertCounters(course, 1, 0)
+        self.assertEqual(course.title, 'Новое название')
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.patch(reverse('lms:courses-detail', args=(course.pk,)), {'title': 'Курс'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['lessons_count'], 1)
+
+    def test_lessons_count(self):
+        """Тест изменения счетчика уроков при создании, переносе и удалении урока"""
+
+        first, second, _ = self.courses
+        lessons = [Lesson.objects.create(title=f'Урок {number}', course=first) for number in range(3)]
+        self.assertCounters(first, 3, 0)
+
+        lesson = Lesson.objects.get(pk=lessons[0].pk)
+        lesson.course = second
+        lesson.save()
+        lesson.save()
+        self.assertCounters(first, 2, 0)
+        self.assertCounters(second, 1, 0)
+
+        lessons[1].delete()
+        Lesson.objects.filter(pk=lessons[2].pk).delete()
+        self.assertCounters(first, 0, 0)
+
+    def test_bulk_lessons_count(self):
+        """Тест счетчика уроков при пакетном создании"""
+
+        self.client.force_authenticate(user=self.user)
+        lessons = [{'title': f'Урок {number}'} for number in range(5)]
+        response = self.client.post(reverse('lms:lessons_bulk'), {'course': self.courses[0].id, 'lessons': lessons},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertCounters(self.courses[0], 5, 0)
+
+    def test_bulk_delete_lessons_count(self):
+        """Тест счетчика уроков при пакетном удалении: количество запросов не зависит от количества уроков"""
+
+        self.client.force_authenticate(user=self.user)
+        course = self.courses[0]
+        lessons = Lesson.objects.bulk_create([Lesson(title=f'Урок {number}', course=course, owner=self.user)
+                                              for number in range(10)])
+        Course.objects.filter(pk=course.pk).update(lessons_count=10)
+
+        query_counts = []
+        for batch in (lessons[:2], lessons[2:]):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.delete(reverse('lms:lessons_bulk'),
+                                              {'course': course.id, 'ids': [lesson.id for lesson in batch]},
+                                              format='json')
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+            query_counts.append(len(data_queries(queries)))
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertCounters(course, 0, 0)
+
+    def test_subscribers_count(self):
+        """Тест счетчика подписчиков при подписке, отписке и удалении пользователя"""
+
+        course_ids = [course.id for course in self.courses]
+        other = User.objects.create_user(email='other@sky.pro', password='testpass')
+        subscribe(self.user, course_ids)
+        subscribe(self.user, course_ids)
+        Subscription.objects.create(user=other, course=self.courses[0])
+        self.assertCounters(self.courses[0], 0, 2)
+        self.assertCounters(self.courses[1], 0, 1)
+
+        unsubscribe(self.user, course_ids[:2])
+        self.assertCounters(self.courses[0], 0, 1)
+        self.assertCounters(self.courses[1], 0, 0)
+        self.assertCounters(self.courses[2], 0, 1)
+
+        other.delete()
+        self.assertCounters(self.courses[0], 0, 0)
+
+    def test_subscription_direct_delete(self):
+        """Тест удаления подписки в обход сервиса: счетчик уменьшается, кеш подписок пользователя сбрасывается"""
+
+        course = self.courses[0]
+        subscription = Subscription.objects.create(user=self.user, course=course)
+        Subscription.objects.create(user=self.user, course=self.courses[1])
+        self.assertEqual(get_subscribed_course_ids(self.user.pk), {course.pk, self.courses[1].pk})
+
+        subscription.delete()
+        self.assertCounters(course, 0, 0)
+        self.assertEqual(get_subscribed_course_ids(self.user.pk), {self.courses[1].pk})
+
+        Subscription.objects.filter(user=self.user).delete()
+        self.assertCounters(self.courses[1], 0, 0)
+        self.assertEqual(get_subscribed_course_ids(self.user.pk), set())
+
+    def test_subscribers_count_in_cached_courses(self):
+        """Тест кеша курсов: подписка другого пользователя сразу отражается в счетчике закешированного курса"""
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('lms:courses-detail', args=(self.courses[0].pk,))
+        self.assertEqual(self.client.get(url).json()['subscribers_count'], 0)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        other = User.objects.create_user(email='other@sky.pro', password='testpass')
+        with self.captureOnCommitCallbacks(execute=True):
+            subscribe(other, [self.courses[0].pk])
+        response = self.client.get(url)
+        self.assertEqual((response['X-Cache'], response.json()['subscribers_count']), ('MISS', 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            unsubscribe(other, [self.courses[0].pk])
+        self.assertEqual(self.client.get(url).json()['subscribers_count'], 0)
+
+    def test_course_cascade_delete(self):
+        """Тест удаления курса с уроками: уроки удаляются каскадно без обновления счетчика удаляемого курса"""
+
+        course = self.courses[0]
+        for number in range(3):
+            Lesson.objects.create(title=f'Урок {number}', course=course)
+        with CaptureQueriesContext(connection) as queries:
+            course.delete()
+        self.assertFalse(Lesson.objects.exists())
+        self.assertFalse(any('lessons_count' in query['sql'] for query in queries))
+
+    def test_ordering_by_popularity(self):
+        """Тест сортировки списка курсов по количеству подписчиков"""
+
+        users = [User.objects.create_user(email=f'user{number}@sky.pro', password='testpass') for number in range(2)]
+        for user in users:
+            subscribe(user, [self.courses[2].id])
+        subscribe(users[0], [self.courses[1].id])
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('lms:courses-list'), {'ordering': '-subscribers_count,id'})
+        results = response.json()['results']
+        self.assertEqual([course['id'] for course in results], [course.id for course in reversed(self.courses)])
+        self.assertEqual([course['subscribers_count'] for course in results], [2, 1, 0])
+
+    def test_repair_command(self):
+        """Тест пересчета расходящихся счетчиков командой repair_course_counters"""
+
+        Lesson.objects.create(title='Урок', course=self.courses[0])
+        Subscription.objects.create(user=self.user, course=self.courses[1])
+        Course.objects.filter(pk=self.courses[0].pk).update(lessons_count=10)
+        Course.objects.filter(pk=self.courses[1].pk).update(subscribers_count=0)
+        Course.objects.filter(pk=self.courses[2].pk).update(lessons_count=5, subscribers_count=5)
+
+        out = io.StringIO()
+        call_command('repair_course_counters', batch_size=2, stdout=out)
+        self.assertIn('Успешно исправлены счетчики 3 курсов', out.getvalue())
+        self.assertCounters(self.courses[0], 1, 0)
+        self.assertCounters(self.courses[1], 0, 1)
+        self.assertCounters(self.courses[2], 0, 0)
+
+        out = io.StringIO()
+        call_command('repair_course_counters', stdout=out)
+        self.assertIn('Успешно исправлены счетчики 0 курсов', out.getvalue())
+
+
+class ResponseCacheTestCase(APITestCase):
+    """Тестирование кеширования ответов курсов и уроков"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        cache.clear()
+        self.user = User.objects.create_user(email='cache@sky.pro', password='testpass')
+        self.other_user = User.objects.create_user(email='other@sky.pro', password='testpass')
+        self.course = Course.objects.create(title='Тестовый курс', owner=self.user)
+        self.lesson = Lesson.objects.create(title='Тестовый урок', course=self.course, owner=self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def test_lesson_list_cache_hit(self):
+        """Тест повторного ответа из кеша без обращения к БД"""
+
+        url = reverse('lms:lessons_list')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['results'][0]['title'], self.lesson.title)
+        self.assertEqual(get_cache_stats(), {'hits': 1, 'misses': 1})
+
+    def test_cache_keyed_by_page_params(self):
+        """Тест раздельного кеширования страниц с разными параметрами пагинации"""
+
+        url = reverse('lms:courses-list')
+        self.client.get(url, {'page_size': 1})
+        self.assertEqual(self.client.get(url, {'page_size': 2})['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url, {'page_size': 1})['X-Cache'], 'HIT')
+
+    def test_cache_keyed_by_user_scope(self):
+        """Тест раздельного кеширования для разных пользователей"""
+
+        url = reverse('lms:lessons_list')
+        self.client.get(url)
+        self.client.force_authenticate(user=self.other_user)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['count'], 0)
+
+    def test_cache_invalidated_on_lesson_change(self):
+        """Тест сброса кеша курсов и уроков при изменении урока"""
+
+        lessons_url = reverse('lms:lessons_retrieve', args=(self.lesson.pk,))
+        course_url = reverse('lms:courses-detail', args=(self.course.pk,))
+        self.client.get(lessons_url)
+        self.client.get(course_url)
+
+        self.lesson.title = 'Обновленный урок'
+        self.lesson.save()
+
+        response = self.client.get(lessons_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['title'], 'Обновленный урок')
+        response = self.client.get(course_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['lessons'][0]['title'], 'Обновленный урок')
+
+    def test_cache_invalidated_on_subscription_change(self):
+        """Тест сброса кеша курсов при подписке на курс"""
+
+        url = reverse('lms:courses-detail', args=(self.course.pk,))
+        self.assertFalse(self.client.get(url).json()['is_subscribed'])
+        Subscription.objects.create(user=self.user, course=self.course)
+        self.assertTrue(self.client.get(url).json()['is_subscribed'])
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class CourseUpdateMailTestCase(APITestCase):
+    """Тестирование рассылки уведомлений об обновлении курса"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        self.always_eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        owner = User.objects.create_user(email='owner@sky.pro', password='testpass')
+        self.course = Course.objects.create(title='Тестовый курс', owner=owner)
+        for number in range(5):
+            user = User.objects.create_user(email=f'subscriber{number}@sky.pro', password='testpass')
+            Subscription.objects.create(user=user, course=self.course)
+
+    def tearDown(self):
+        """Восстановление настроек Celery после теста"""
+
+        app.conf.task_always_eager = self.always_eager
+
+    def test_send_mail_about_update(self):
+        """Тест отправки писем всем подписчикам пачками"""
+
+        with patch('lms.tasks.NOTIFICATION_BATCH_SIZE', 2), self.assertNumQueries(2):
+            result = send_mail_about_update(self.course.id)
+
+        self.assertEqual(result, 'Запланировано пачек писем: 3')
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            [f'subscriber{number}@sky.pro' for number in range(5)]
+        )
+        self.assertIn(self.course.title, mail.outbox[0].body)
+
+    def test_send_mail_about_update_missing_course(self):
+        """Тест рассылки для несуществующего курса"""
+
+        self.assertEqual(send_mail_about_update(0), 'Курс не найден')
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class CourseUpdateNotificationTestCase(APITestCase):
+    """Тестирование объединения уведомлений при частых обновлениях курса"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        cache.clear()
+        self.user = User.objects.create_user(email='author@sky.pro', password='testpass')
+        self.course = Course.objects.create(title='Тестовый курс', owner=self.user)
+        self.client.force_authenticate(user=self.user)
+
+    @patch('lms.tasks.send_mail_about_update.apply_async')
+    def test_updates_coalesced(self, apply_async):
+        """Тест объединения нескольких обновлений курса в одну рассылку"""
+
+        url = reverse('lms:courses-detail', args=(self.course.pk,))
+        for number in range(3):
+            response = self.client.patch(url, {'title': f'Курс {number}'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.args[0], (self.course.id,))
+        self.assertEqual(get_notification_stats(), {'scheduled': 1, 'coalesced': 2})
+
+    @patch('lms.tasks.send_mail_about_update.apply_async')
+    def test_new_notification_after_sending(self, apply_async):
+        """Тест планирования новой рассылки после выполнения предыдущей"""
+
+        self.assertTrue(schedule_course_update_notification(self.course.id))
+        self.assertFalse(schedule_course_update_notification(self.course.id))
+        send_mail_about_update(self.course.id)
+        self.assertTrue(schedule_course_update_notification(self.course.id))
+        self.assertEqual(apply_async.call_count, 2)
+
+
+class PaginationTestCase(APITestCase):
+    """Тестирование режимов пагинации списков"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        cache.clear()
+        self.user = User.objects.create_user(email='pagination@sky.pro', password='testpass')
+        self.course = Course.objects.create(title='Тестовый курс', owner=self.user)
+        self.lessons = [
+            Lesson.objects.create(title=f'Урок {number}', course=self.course, owner=self.user)
+            for number in range(5)
+        ]
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('lms:lessons_list')
+
+    def test_page_pagination_by_default(self):
+        """Тест постраничной пагинации по умолчанию"""
+
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(len(data['results']), 4)
+
+    def test_page_pagination_without_count(self):
+        """Тест постраничной пагинации без подсчета общего количества"""
+
+        data = self.client.get(self.url, {'count': 'false', 'page': 2}).json()
+        self.assertNotIn('count', data)
+        self.assertIsNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+        self.assertEqual([lesson['id'] for lesson in data['results']], [self.lessons[4].id])
+
+    def test_page_out_of_range(self):
+        """Тест страницы за пределами списка: 404 в обоих режимах (с подсчетом и без), первая страница пустого
+        списка существует"""
+
+        for params in ({'page': 50}, {'page': 50, 'count': 'false'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_404_NOT_FOUND)
+        Lesson.objects.all().delete()
+        data = self.client.get(self.url, {'count': 'false'}).json()
+        self.assertEqual(data['results'], [])
+
+    def test_cursor_pagination(self):
+        """Тест курсорной пагинации, выбранной параметром запроса"""
+
+        data = self.client.get(self.url, {'pagination': 'cursor', 'page_size': 3}).json()
+        self.assertNotIn('count', data)
+        self.assertEqual([lesson['id'] for lesson in data['results']], [lesson.id for lesson in self.lessons[:3]])
+
+        data = self.client.get(data['next']).json()
+        self.assertEqual([lesson['id'] for lesson in data['results']], [lesson.id for lesson in self.lessons[3:]])
+        self.assertIsNone(data['next'])
+
+    def test_unpaginated_mode_not_allowed(self):
+        """Тест вывода без пагинации: недоступен контроллерам без атрибута allow_unpaginated"""
+
+        data = self.client.get(self.url, {'pagination': 'none'}).json()
+        self.assertEqual(len(data['results']), 4)
+
+
+class LessonBulkTestCase(APITestCase):
+    """Тестирование пакетного создания, обновления и удаления уроков"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        cache.clear()
+        self.user = User.objects.create_user(email='bulk@sky.pro', password='testpass')
+        self.course = Course.objects.create(title='Тестовый курс', owner=self.user)
+        self.lessons = [
+            Lesson.objects.create(title=f'Урок {number}', course=self.course, owner=self.user)
+            for number in range(3)
+        ]
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('lms:lessons_bulk')
+
+    def test_bulk_create(self):
+        """Тест пакетного создания уроков с постоянным количеством запросов"""
+
+        lessons = [{'title': f'Новый урок {number}', 'description': 'https://youtu.be/1'} for number in range(20)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'course': self.course.id, 'lessons': lessons}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.json()), 20)
+        self.assertEqual(Lesson.objects.filter(course=self.course, owner=self.user).count(), 23)
+        self.assertLess(len(queries), 10)
+
+    def test_bulk_create_errors(self):
+        """Тест ошибок по индексам уроков: при ошибке ничего не сохраняется"""
+
+        lessons = [
+            {'title': 'Урок'},
+            {'description': 'Без названия'},
+            {'title': 'Урок', 'description': 'https://example.com'},
+        ]
+        response = self.client.post(self.url, {'course': self.course.id, 'lessons': lessons}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.json()['lessons']), {'1', '2'})
+        self.assertEqual(Lesson.objects.count(), 3)
+
+    def test_bulk_create_foreign_course(self):
+        """Тест запрета пакетного создания уроков в чужом курсе"""
+
+        other = User.objects.create_user(email='other@sky.pro', password='testpass')
+        course = Course.objects.create(title='Чужой курс', owner=other)
+        response = self.client.post(self.url, {'course': course.id, 'lessons': [{'title': 'Урок'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_bulk_update(self):
+        """Тест пакетного обновления уроков"""
+
+        lessons = [{'id': lesson.id, 'title': f'Обновленный урок {lesson.id}'} for lesson in self.lessons[:2]]
+        response = self.client.patch(self.url, {'course': self.course.id, 'lessons': lessons}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            list(Lesson.objects.order_by('id').values_list('title', flat=True)),
+            [f'Обновленный урок {self.lessons[0].id}', f'Обновленный урок {self.lessons[1].id}', 'Урок 2'],
+        )
+
+    def test_bulk_update_unknown_lesson(self):
+        """Тест ошибки пакетного обновления урока не из этого курса"""
+
+        lessons = [{'id': self.lessons[0].id, 'title': 'Урок'}, {'id': 0, 'title': 'Урок'}]
+        response = self.client.patch(self.url, {'course': self.course.id, 'lessons': lessons}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(response.json()['lessons']), ['1'])
+        self.assertEqual(Lesson.objects.get(pk=self.lessons[0].id).title, 'Урок 0')
+
+    def test_bulk_delete(self):
+        """Тест пакетного удаления уроков"""
+
+        ids = [lesson.id for lesson in self.lessons[:2]]
+        response = self.client.delete(self.url, {'course': self.course.id, 'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Lesson.objects.values_list('id', flat=True)), [self.lessons[2].id])
+
+        response = self.client.delete(self.url, {'course': self.course.id, 'ids': [self.lessons[0].id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_non_object_body(self):
+        """Тест пакетных запросов с телом-списком вместо объекта: ошибка 400, а не 500"""
+
+        for method in (self.client.post, self.client.patch, self.client.delete):
+            response = method(self.url, [self.lessons[0].id], format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_invalidates_cache(self):
+        """Тест сброса кеша списка уроков после пакетного создания"""
+
+        list_url = reverse('lms:lessons_list')
+        self.client.get(list_url)
+        self.client.post(self.url, {'course': self.course.id, 'lessons': [{'title': 'Новый урок'}]}, format='json')
+        self.assertEqual(self.client.get(list_url).json()['count'], 4)
+
+
+class CourseTransferTestCase(APITestCase):
+    """Тестирование экспорта и импорта курсов в формате JSON Lines"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        cache.clear()
+        self.owner = User.objects.create_user(email='owner@sky.pro', password='testpass')
+        self.subscriber = User.objects.create_user(email='subscriber@sky.pro', password='testpass')
+        self.courses = [Course.objects.create(title=f'Курс {number}', owner=self.owner) for number in range(2)]
+        for course in self.courses:
+            for number in range(3):
+                Lesson.objects.create(title=f'{course.title}: урок {number}', course=course, owner=self.owner,
+                                      video_url='https://youtu.be/1')
+        Subscription.objects.create(user=self.subscriber, course=self.courses[1])
+
+    def test_export(self):
+        """Тест экспорта: одна запись на строку, курсы раньше уроков и подписок"""
+
+        records = [json.loads(line) for line in export_jsonl()]
+        self.assertEqual([record['type'] for record in records], ['course'] * 2 + ['lesson'] * 6 + ['subscription'])
+        self.assertEqual(records[2]['course'], self.courses[0].id)
+        self.assertEqual(records[2]['owner_email'], 'owner@sky.pro')
+        self.assertEqual(records[-1], {'type': 'subscription', 'course': self.courses[1].id,
+                                       'user_email': 'subscriber@sky.pro'})
+
+    def test_import_remaps_courses(self):
+        """Тест импорта с пересчетом ссылок на новые курсы (пачками по 2 объекта)"""
+
+        lines = list(export_jsonl())
+        counts = import_jsonl(lines, batch_size=2)
+        self.assertEqual(counts, {'course': 2, 'lesson': 6, 'subscription': 1, 'skipped': 0})
+
+        imported = Course.objects.exclude(id__in=[course.id for course in self.courses]).order_by('id')
+        self.assertEqual([course.title for course in imported], ['Курс 0', 'Курс 1'])
+        self.assertEqual(
+            list(Lesson.objects.filter(course=imported[1]).values_list('title', flat=True).order_by('id')),
+            ['Курс 1: урок 0', 'Курс 1: урок 1', 'Курс 1: урок 2'],
+        )
+        self.assertTrue(Subscription.objects.filter(user=self.subscriber, course=imported[1]).exists())
+        self.assertEqual(imported[0].owner, self.owner)
+        self.assertEqual([(course.lessons_count, course.subscribers_count) for course in imported], [(3, 0), (3, 1)])
+
+    def test_import_invalid_line(self):
+        """Тест отмены импорта при некорректной строке"""
+
+        lines = list(export_jsonl()) + ['{"type": "unknown"}\n']
+        with self.assertRaises(ValueError):
+            import_jsonl(lines)
+        self.assertEqual(Course.objects.count(), 2)
+
+    def test_export_endpoint(self):
+        """Тест потокового экспорта для администратора"""
+
+        url = reverse('lms:courses_export')
+        self.client.force_authenticate(user=self.owner)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        admin = User.objects.create_user(email='admin@sky.pro', password='testpass', is_staff=True)
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(url, {'course': self.courses[1].id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(records), 5)
+        self.assertEqual(records[0]['id'], self.courses[1].id)
+
+
+class BenchmarkCompareTestCase(SimpleTestCase):
+    """Тестирование сравнения результатов замеров с базовыми"""
+
+    def test_compare_results(self):
+        """Тест поиска регрессий задержки (выше порога) и количества SQL-запросов"""
+
+        baseline = {
+            'courses_list': {'p50': 10, 'p95': 20, 'queries': 3},
+            'lessons_list': {'p50': 10, 'p95': 20, 'queries': 2},
+        }
+        results = {
+            'courses_list': {'p50': 11.5, 'p95': 30, 'queries': 3},
+            'lessons_list': {'p50': 5, 'p95': 10, 'queries': 3},
+            'payments_list': {'p50': 100, 'p95': 100, 'queries': 10},
+        }
+        self.assertEqual(compare_results(results, baseline, threshold=20), [
+            ('courses_list', 'p95', 20, 30),
+            ('lessons_list', 'queries', 2, 3),
+        ])
+
+
+@patch('lms.middleware.LMS_METRICS_SAMPLE_RATE', 1.0)
+class QueryMetricsTestCase(APITestCase):
+    """Тестирование сбора метрик SQL-запросов по эндпоинтам"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        cache.clear()
+        reset_metrics()
+        self.user = User.objects.create_user(email='metrics@sky.pro', password='testpass')
+        self.client.force_authenticate(user=self.user)
+
+    def test_query_recorder_duplicates(self):
+        """Тест подсчета запросов и повторов одного и того же SQL"""
+
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for pk in range(3):
+                list(User.objects.filter(pk=pk))
+            Course.objects.count()
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(recorder.duplicates, 2)
+
+    def test_metrics_recorded_per_endpoint(self):
+        """Тест метрик эндпоинта и заголовка Server-Timing"""
+
+        response = self.client.get(reverse('lms:lessons_list'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.client.get(reverse('lms:lessons_list'))
+
+        metrics = get_metrics()[('lms:lessons_list', 'GET')]
+        self.assertEqual(metrics['requests'], 2)
+        self.assertGreater(metrics['queries'], 0)
+        self.assertEqual(sum(metrics['buckets']), 2)
+
+    @patch('lms.views.LMS_METRICS_TOKEN', 'secret')
+    def test_metrics_endpoint(self):
+        """Тест эндпоинта метрик в формате Prometheus с доступом по токену"""
+
+        self.client.get(reverse('lms:lessons_list'))
+        url = reverse('lms:metrics')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = response.content.decode()
+        self.assertIn('# TYPE lms_db_queries_total counter', content)
+        self.assertIn('lms_http_request_duration_seconds_count{view="lms:lessons_list",method="GET"} 1', content)
+
+    def test_metrics_endpoint_disabled_without_token(self):
+        """Тест отключенного эндпоинта метрик без настроенного токена"""
+
+        self.assertEqual(self.client.get(reverse('lms:metrics')).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ExternalLinksValidatorTestCase(SimpleTestCase):
+    """Тестирование проверки сторонних ссылок в описании"""
+
+    def setUp(self):
+        """Настройка валидатора перед каждым тестом"""
+
+        self.validator = ExternalLinksValidator(field='description')
+
+    def assertAllowed(self, text):
+        self.validator({'description': text})
+
+    def assertForbidden(self, text):
+        with self.assertRaises(ValidationError):
+            self.validator({'description': text})
+
+    def test_youtube_links_allowed(self):
+        """Тест разрешенных ссылок на YouTube и его поддомены"""
+
+        self.assertAllowed('Видео: https://youtube.com/watch?v=1, https://www.youtube.com/watch?v=2 '
+                           '(https://m.youtube.com/watch?v=3) [https://youtu.be/4] HTTPS://WWW.YOUTUBE.COM:443/5')
+
+    def test_text_without_links_allowed(self):
+        """Тест текста без ссылок и пустого поля"""
+
+        self.assertAllowed('Описание без ссылок')
+        self.assertEqual(self.validator({'description': None}), 'Поле пустое или не строка')
+
+    def test_external_links_forbidden(self):
+        """Тест запрещенных сторонних ссылок"""
+
+        self.assertForbidden('https://youtube.com/watch?v=1 и http://example.com')
+        self.assertForbidden('HTTP://EXAMPLE.COM')
+
+    def test_lookalike_domains_forbidden(self):
+        """Тест запрещенных доменов, лишь содержащих разрешенный домен"""
+
+        self.assertForbidden('https://evil-youtube.com.attacker.net/watch')
+        self.assertForbidden('https://youtube.com.attacker.net/watch')
+        self.assertForbidden('https://notyoutube.com/watch')
+        self.assertForbidden('https://youtube.com@attacker.net/watch')
+
+    def test_backslash_bypass_forbidden(self):
+        """Тест ссылок с обратной косой чертой: браузер считает ее разделителем пути и открывает evil.com"""
+
+        self.assertForbidden('https://evil.com\\@youtube.com/x')
+        self.assertForbidden('https://evil.com\\.youtube.com')
+
+    def test_invalid_host_forbidden(self):
+        """Тест хостов с недопустимыми символами"""
+
+        self.assertForbidden('https://evil.com%2f.youtube.com/x')
+        self.assertForbidden('https://[::1]/x')
+
+    def test_allowed_domains_configurable(self):
+        """Тест настройки списка разрешенных доменов"""
+
+        validator = ExternalLinksValidator(field='description', allowed_domains=['vimeo.com'])
+        validator({'description': 'https://player.vimeo.com/video/1'})
+        with self.assertRaises(ValidationError):
+            validator({'description': 'https://youtube.com/watch?v=1'})
+
+    def test_invalid_value(self):
+        """Тест некорректного формата данных"""
+
+        with self.assertRaises(ValidationError):
+            self.validator('https://example.com')
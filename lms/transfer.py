@@ -0,0 +1,171 @@
+import json
+
+from django.db import transaction
+from django.db.models import F
+
+from config.settings import LMS_TRANSFER_BATCH_SIZE
+from lms.cache import COURSES, LESSONS, bump_cache_version
+from lms.models import Course, Lesson, Subscription
+from lms.services import invalidate_subscriptions, recount_course_counters
+from users.models import User
+
+
+# Поля, переносимые между окружениями. Идентификаторы Stripe не переносятся: они принадлежат аккаунту Stripe
+# исходного окружения. Пользователи (владельцы и подписчики) переносятся по email
+COURSE_FIELDS = ('id', 'title', 'description', 'price', 'preview')
+LESSON_FIELDS = ('id', 'course_id', 'title', 'description', 'price', 'preview', 'video_url')
+
+
+def export_records(course_ids=None, chunk_size=LMS_TRANSFER_BATCH_SIZE):
+    """Генератор записей для экспорта: сначала курсы, затем уроки, затем подписки.
+    Строки читаются из БД итератором порциями по chunk_size, поэтому память не зависит от объема данных.
+    Email пользователей получается в том же запросе (join), без дополнительных запросов на запись"""
+
+    courses = Course.objects.order_by('id')
+    lessons = Lesson.objects.order_by('id')
+    subscriptions = Subscription.objects.order_by('id')
+    if course_ids is not None:
+        courses = courses.filter(id__in=course_ids)
+        lessons = lessons.filter(course_id__in=course_ids)
+        subscriptions = subscriptions.filter(course_id__in=course_ids)
+
+    for row in courses.values(*COURSE_FIELDS, owner_email=F('owner__email')).iterator(chunk_size=chunk_size):
+        yield {'type': 'course', **row}
+    for row in lessons.values(*LESSON_FIELDS, owner_email=F('owner__email')).iterator(chunk_size=chunk_size):
+        row['course'] = row.pop('course_id')
+        yield {'type': 'lesson', **row}
+    for row in subscriptions.values('course_id', user_email=F('user__email')).iterator(chunk_size=chunk_size):
+        yield {'type': 'subscription', 'course': row['course_id'], 'user_email': row['user_email']}
+
+
+def export_jsonl(course_ids=None, chunk_size=LMS_TRANSFER_BATCH_SIZE):
+    """Генератор строк JSON Lines (по одной записи на строку) для экспорта курсов"""
+
+    for record in export_records(course_ids, chunk_size):
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+class CourseImporter:
+    """Импорт курсов, уроков и подписок из записей формата export_records.
+    Записи накапливаются пачками и сохраняются через bulk_create. Идентификаторы курсов из файла
+    сопоставляются с созданными курсами, пользователи находятся по email одним запросом на пачку.
+    В памяти хранятся только эти соответствия, а не сами уроки и подписки"""
+
+    def __init__(self, batch_size=LMS_TRANSFER_BATCH_SIZE):
+        """Конструктор класса CourseImporter"""
+
+        self.batch_size = batch_size
+        self.course_ids = {}
+        self.user_ids = {}
+        self.counts = {'course': 0, 'lesson': 0, 'subscription': 0, 'skipped': 0}
+
+    def get_user_ids(self, emails):
+        """Возвращает соответствие email -> id пользователя, загружая неизвестные email одним запросом"""
+
+        unknown = {email for email in emails if email and email not in self.user_ids}
+        if unknown:
+            found = dict(User.objects.filter(email__in=unknown).values_list('email', 'id'))
+            for email in unknown:
+                self.user_ids[email] = found.get(email)
+        return self.user_ids
+
+    def import_courses(self, records):
+        """Создает курсы пачки и запоминает соответствие id из файла -> новый id"""
+
+        user_ids = self.get_user_ids(record.get('owner_email') for record in records)
+        courses = Course.objects.bulk_create(
+            Course(title=record['title'], description=record.get('description'), price=record.get('price', 0),
+                   preview=record.get('preview') or None, owner_id=user_ids.get(record.get('owner_email')))
+            for record in records
+        )
+        for record, course in zip(records, courses):
+            self.course_ids[record['id']] = course.id
+        self.counts['course'] += len(courses)
+
+    def import_lessons(self, records):
+        """Создает уроки пачки, заменяя id курса из файла на id созданного курса"""
+
+        user_ids = self.get_user_ids(record.get('owner_email') for record in records)
+        lessons = []
+        for record in records:
+            course_id = self.course_ids.get(record['course'])
+            if course_id is None:
+                self.counts['skipped'] += 1
+                continue
+            lessons.append(Lesson(
+                course_id=course_id, title=record['title'], description=record.get('description'),
+                price=record.get('price', 0), preview=record.get('preview') or None,
+                video_url=record.get('video_url'), owner_id=user_ids.get(record.get('owner_email')),
+            ))
+        self.counts['lesson'] += len(Lesson.objects.bulk_create(lessons))
+
+    def import_subscriptions(self, records):
+        """Создает подписки пачки. Подписки несуществующих пользователей пропускаются"""
+
+        user_ids = self.get_user_ids(record.get('user_email') for record in records)
+        subscriptions = []
+        for record in records:
+            course_id = self.course_ids.get(record['course'])
+            user_id = user_ids.get(record.get('user_email'))
+            if course_id is None or user_id is None:
+                self.counts['skipped'] += 1
+                continue
+            subscriptions.append(Subscription(course_id=course_id, user_id=user_id))
+        Subscription.objects.bulk_create(subscriptions, ignore_conflicts=True)
+        invalidate_subscriptions(*{subscription.user_id for subscription in subscriptions})
+        self.counts['subscription'] += len(subscriptions)
+
+    def run(self, records):
+        """Импортирует записи в одной транзакции. Записи одного типа идут подряд (как в экспорте),
+        пачка сохраняется при заполнении или при смене типа записи, поэтому курсы всегда сохраняются раньше
+        ссылающихся на них уроков и подписок. Возвращает количество созданных объектов по типам"""
+
+        handlers = {
+            'course': self.import_courses,
+            'lesson': self.import_lessons,
+            'subscription': self.import_subscriptions,
+        }
+        with transaction.atomic():
+            batch, batch_type = [], None
+            for record in records:
+                record_type = record.get('type') if isinstance(record, dict) else None
+                if record_type not in handlers:
+                    raise ValueError(f'Неизвестный тип записи: {record_type}')
+                if batch and (record_type != batch_type or len(batch) >= self.batch_size):
+                    handlers[batch_type](batch)
+                    batch = []
+                batch_type = record_type
+                batch.append(record)
+            if batch:
+                handlers[batch_type](batch)
+            self.recount_courses()
+            # Пакетные запросы не отправляют сигналы моделей, поэтому кеш сбрасывается явно
+            bump_cache_version(COURSES, LESSONS)
+        return self.counts
+
+    def recount_courses(self):
+        """Заполняет счетчики уроков и подписчиков созданных курсов (пачками по batch_size курсов):
+        уроки и подписки создаются через bulk_create, без сигналов, изменяющих счетчики"""
+
+        course_ids = list(self.course_ids.values())
+        for start in range(0, len(course_ids), self.batch_size):
+            recount_course_counters(Course.objects.filter(pk__in=course_ids[start:start + self.batch_size]))
+
+
+def read_jsonl(lines):
+    """Генератор записей из строк JSON Lines. Пустые строки пропускаются"""
+
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as error:
+            raise ValueError(f'Строка {number}: некорректный JSON ({error.msg})')
+
+
+def import_jsonl(lines, batch_size=LMS_TRANSFER_BATCH_SIZE):
+    """Импортирует курсы из строк JSON Lines (файл читается построчно). Возвращает количество созданных объектов"""
+
+    return CourseImporter(batch_size).run(read_jsonl(lines))
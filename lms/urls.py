@@ -1,8 +1,9 @@
 from django.urls import path
 from rest_framework.routers import SimpleRouter
 
-from lms.views import (CourseViewSet, LessonListApiView, LessonUpdateApiView, LessonCreateApiView,
-                       LessonDestroyApiView, LessonRetrieveApiView, SubscriptionAPIView)
+from lms.views import (CourseViewSet, CourseExportAPIView, CourseSubscriptionAPIView, LessonListApiView,
+                       LessonUpdateApiView, LessonCreateApiView, LessonDestroyApiView, LessonRetrieveApiView,
+                       LessonBulkApiView, QueryMetricsAPIView, SubscriptionAPIView, SubscriptionBatchAPIView)
 from lms.apps import LmsConfig
 
 
@@ -12,12 +13,17 @@ router = SimpleRouter()
 router.register('courses', CourseViewSet, basename='courses')
 
 urlpatterns = [
+    path("courses/export/", CourseExportAPIView.as_view(), name="courses_export"),
     path("lessons/", LessonListApiView.as_view(), name="lessons_list"),
     path("lessons/<int:pk>/", LessonRetrieveApiView.as_view(), name="lessons_retrieve"),
     path("lessons/create/", LessonCreateApiView.as_view(), name="lessons_create"),
     path("lessons/<int:pk>/destroy/", LessonDestroyApiView.as_view(), name="lessons_destroy"),
     path("lessons/<int:pk>/update/", LessonUpdateApiView.as_view(), name="lessons_update"),
+    path("lessons/bulk/", LessonBulkApiView.as_view(), name="lessons_bulk"),
     path('subscriptions/', SubscriptionAPIView.as_view(), name='subscriptions'),
+    path('subscriptions/batch/', SubscriptionBatchAPIView.as_view(), name='subscriptions_batch'),
+    path('courses/<int:course_id>/subscription/', CourseSubscriptionAPIView.as_view(), name='course_subscription'),
+    path('metrics/', QueryMetricsAPIView.as_view(), name='metrics'),
 ]
 
 urlpatterns += router.urls
@@ -1,16 +1,57 @@
 import re
-from urllib.parse import urlparse
+
 from rest_framework.serializers import ValidationError
 
+from config.settings import LMS_ALLOWED_LINK_DOMAINS
+
+
+# Ссылка http(s) и ее authority (хост с необязательными userinfo и портом). Шаблон без вложенных
+# квантификаторов компилируется один раз и проходит текст за линейное время. Обратная косая черта
+# завершает authority, как и '/': браузеры считают '\' разделителем пути
+URL_PATTERN = re.compile(r'https?://([^\s/\\?#)\]]*)', re.IGNORECASE)
+# Допустимый хост: доменное имя (буквы, цифры, точки, дефисы) или IPv6-адрес в квадратных скобках
+HOST_PATTERN = re.compile(r'[a-z0-9.-]+|\[[0-9a-f:.]+\]')
+
+
+def get_host(authority):
+    """Извлекает хост из authority ссылки: отбрасывает userinfo ('user@'), порт и завершающую точку.
+    Возвращает None, если хост содержит недопустимые символы"""
+
+    host = authority.rpartition('@')[2]
+    if host.startswith('['):
+        host = host[:host.find(']') + 1]
+    else:
+        host = host.partition(':')[0]
+    host = host.rstrip('.').lower()
+    if not HOST_PATTERN.fullmatch(host):
+        return None
+    return host
+
 
 class ExternalLinksValidator:
     """Класс для валидации содержимого текстового поля, в котором проходит проверка на присутствие сторонних ссылок
-    и запрета на них, кроме ссылки на 'youtube.com'"""
+    и запрета на них, кроме ссылок на разрешенные домены (по умолчанию настройка LMS_ALLOWED_LINK_DOMAINS:
+    'youtube.com' и 'youtu.be'). Разрешены сам домен и его поддомены (www.youtube.com, m.youtube.com),
+    но не домены, лишь содержащие разрешенный (evil-youtube.com, youtube.com.attacker.net)"""
 
-    def __init__(self, field):
+    def __init__(self, field, allowed_domains=None):
         """Конструктор класса ExternalLinksValidator"""
 
         self.field = field
+        if allowed_domains is None:
+            allowed_domains = LMS_ALLOWED_LINK_DOMAINS
+        self.allowed_domains = frozenset(domain.lower() for domain in allowed_domains)
+
+    def is_allowed_host(self, host):
+        """Проверяет, совпадает ли хост с разрешенным доменом или является его поддоменом.
+        Проверяются только суффиксы хоста по границам меток: 'm.youtube.com' -> 'youtube.com' -> 'com'"""
+
+        while host not in self.allowed_domains:
+            dot = host.find('.')
+            if dot == -1:
+                return False
+            host = host[dot + 1:]
+        return True
 
     def __call__(self, value):
         """Вызываемый метод для проверки наличия ссылок в тексте поля"""
@@ -24,17 +65,10 @@ class ExternalLinksValidator:
         if not text or not isinstance(text, str):
             return 'Поле пустое или не строка'
 
-        # Проверяем, содержит ли текст URL, ищем все ссылки в text
-        urls = re.findall(r'https?://[^\s)\]]+', text)
-        # С помощью urlparse, разбиваем ссылку на компоненты и забираем сетевую локацию netloc
-        for url in urls:
-            parsed = urlparse(url)
-            netloc = parsed.netloc.lower()
-            # Разрешаем только YouTube-ссылки
-            if not any(
-                domain in netloc
-                for domain in ("youtube.com", "youtu.be", "www.youtube.com", "m.youtube.com")
-            ):
+        # Проходим по ссылкам в тексте и останавливаемся на первой запрещенной
+        for match in URL_PATTERN.finditer(text):
+            host = get_host(match.group(1))
+            if host is None or not self.is_allowed_host(host):
                 raise ValidationError(
                     "Запрещено использовать сторонние ссылки, кроме YouTube."
                 )
@@ -1,33 +1,77 @@
+import hmac
+
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import status
-from rest_framework.exceptions import PermissionDenied
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.generics import CreateAPIView, ListAPIView, RetrieveAPIView, UpdateAPIView, DestroyAPIView
 
-from lms.models import Course, Lesson, Subscription
-from lms.paginations import CustomPagination
-from lms.serializers import CourseSerializer, LessonSerializer
-from users.permissions import IsOwner, IsModerator
-from lms.tasks import send_mail_about_update
+from config.settings import LESSONS_BULK_MAX_SIZE, LMS_METRICS_TOKEN
+from lms.cache import (COURSES, ENTITLEMENTS, LESSONS, SUBSCRIPTIONS, CachedResponseMixin, bump_cache_version,
+                       get_cache_version, user_resource)
+from lms.metrics import render_prometheus
+from lms.models import Course, Lesson
+from lms.paginations import SwitchablePagination
+from lms.serializers import (CourseSerializer, LessonBulkSerializer, LessonSerializer, SubscriptionBatchSerializer,
+                             SubscriptionToggleSerializer)
+from lms.services import delete_lessons, get_subscribed_course_ids, subscribe, unsubscribe
+from users.entitlements import get_entitlements
+from users.permissions import HasEntitlement, IsOwner, IsModerator
+from users.roles import is_moderator
+from lms.tasks import schedule_course_update_notification
+from lms.transfer import export_jsonl
 
 
-class CourseViewSet(ModelViewSet):
+class CourseViewSet(CachedResponseMixin, ModelViewSet):
     """Контроллер для работы с объектами Course (курса).
     Переопределен метод perform_create для сохранения в поле 'owner' текущего пользователя.
-    Разрешен показ только курсов созданных текущим пользователем. Добавлена пагинация для вывода списка курсов"""
+    Разрешен показ только курсов созданных текущим пользователем. Добавлена пагинация для вывода списка курсов.
+    Ответы list/retrieve кешируются. Список сортируется по популярности без агрегации при чтении
+    (/courses/?ordering=-subscribers_count,id - счетчики хранятся в полях курса)"""
     serializer_class = CourseSerializer
-    pagination_class = CustomPagination
+    pagination_class = SwitchablePagination
+    pagination_mode = 'page'
+    ordering_fields = ['id', 'title', 'price', 'lessons_count', 'subscribers_count']
+    cache_resource = COURSES
+
+    def get_cache_scope(self):
+        """Курс содержит персональное поле 'is_subscribed', а список включает оплаченные курсы, поэтому кеш курсов
+        всегда персональный и включает версии подписок и доступов пользователя: оплата сбрасывает только кеш
+        этого пользователя. Подписка изменяет и общий счетчик подписчиков курса, поэтому сбрасывает кеш курсов
+        всех пользователей (lms.services.change_subscribers_count)"""
+        user_id = self.request.user.pk
+        subscriptions = get_cache_version(user_resource(SUBSCRIPTIONS, user_id))
+        entitlements = get_cache_version(user_resource(ENTITLEMENTS, user_id))
+        return f'{super().get_cache_scope()}:{user_id}:{subscriptions}:{entitlements}'
+
+    def get_serializer_context(self):
+        """Добавляет в контекст множество курсов, на которые подписан пользователь (одно чтение из кеша на запрос)"""
+        context = super().get_serializer_context()
+        if self.request.user.is_authenticated:
+            context['subscribed_course_ids'] = get_subscribed_course_ids(self.request.user.pk)
+        return context
 
     def get_queryset(self):
         """Возвращает все курсы если пользователь в группе 'Модераторы',
-        иначе возвращает только созданные пользователем курсы"""
+        иначе возвращает созданные пользователем курсы, а для просмотра (list, retrieve) - еще и оплаченные.
+        Оплаченные курсы берутся из кеша доступов пользователя (фильтр по id, без join таблицы платежей).
+        Количество уроков и подписчиков хранится в полях курса, уроки подгружаются одним дополнительным
+        запросом (prefetch). Признак подписки берется из кеша подписок пользователя"""
         user = self.request.user
-        if user.groups.filter(name='Модераторы'):
-            return Course.objects.all()
-        return Course.objects.filter(owner=user)
+        queryset = Course.objects.prefetch_related(
+            Prefetch('lessons', queryset=Lesson.objects.order_by('id'))
+        ).order_by('id')
+        if is_moderator(user):
+            return queryset
+        if self.action in ('list', 'retrieve'):
+            return queryset.filter(Q(owner=user) | Q(pk__in=get_entitlements(user.pk).courses))
+        return queryset.filter(owner=user)
 
     def get_permissions(self):
         """Настраиваем права в зависимости от действия"""
@@ -41,15 +85,16 @@ class CourseViewSet(ModelViewSet):
 
     def perform_create(self, serializer):
         """Автоматически назначаем текущего пользователя владельцем"""
-        if self.request.user.groups.filter(name='Модераторы').exists():
+        if is_moderator(self.request.user):
             raise PermissionDenied("Модераторы не могут создавать курсы")
         serializer.save(owner=self.request.user)
 
     def perform_update(self, serializer):
-        """При обновлении курса отправляем уведомления подписчикам."""
+        """При обновлении курса отправляем уведомления подписчикам.
+        Частые обновления одного курса объединяются в одну отложенную рассылку"""
         instance = serializer.save()
-        # Запускаем асинхронную задачу Celery для рассылки писем
-        send_mail_about_update.delay(instance.id)
+        # Планируем асинхронную задачу Celery для рассылки писем
+        schedule_course_update_notification(instance.id)
 
     def perform_destroy(self, instance):
         """Удаление с проверкой прав"""
@@ -58,6 +103,24 @@ class CourseViewSet(ModelViewSet):
         instance.delete()
 
 
+class CourseExportAPIView(APIView):
+    """Экспорт курсов с уроками и подписками в формате JSON Lines для администраторов (формат команды
+    export_courses). Ответ формируется потоково, строки читаются из БД порциями.
+    Параметр запроса course (можно указать несколько раз) ограничивает экспорт выбранными курсами"""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            course_ids = [int(course_id) for course_id in request.query_params.getlist('course')] or None
+        except ValueError:
+            raise ValidationError({'course': ['Укажите id курса']})
+
+        response = StreamingHttpResponse(export_jsonl(course_ids), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="courses.jsonl"'
+        return response
+
+
 class LessonCreateApiView(CreateAPIView):
     """Контроллер для создания объекта Lesson (урок)
     с автоматическим назначением поля 'owner' текущим пользователем"""
@@ -66,35 +129,39 @@ class LessonCreateApiView(CreateAPIView):
 
     def perform_create(self, serializer):
         """Автоматически назначаем текущего пользователя владельцем"""
-        if self.request.user.groups.filter(name='Модераторы').exists():
+        if is_moderator(self.request.user):
             raise PermissionDenied("Модераторы не могут создавать уроки")
         serializer.save(owner=self.request.user)
 
 
-class LessonListApiView(ListAPIView):
+class LessonListApiView(CachedResponseMixin, ListAPIView):
     """Просмотр списка уроков (свои для пользователей, все для модераторов).
-    Добавлена пагинация для вывода списка курсов"""
+    Добавлена пагинация для вывода списка курсов. Ответы кешируются"""
     serializer_class = LessonSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = CustomPagination
+    pagination_class = SwitchablePagination
+    pagination_mode = 'page'
+    cache_resource = LESSONS
 
     def get_queryset(self):
         user = self.request.user
-        if user.groups.filter(name='Модераторы').exists():
-            return Lesson.objects.all()
-        return Lesson.objects.filter(owner=user)
+        if is_moderator(user):
+            return Lesson.objects.order_by('id')
+        return Lesson.objects.filter(owner=user).order_by('id')
 
 
-class LessonRetrieveApiView(RetrieveAPIView):
-    """Контроллер для просмотра деталей выбранного урока, созданного текущим пользователем"""
+class LessonRetrieveApiView(CachedResponseMixin, RetrieveAPIView):
+    """Контроллер для просмотра деталей выбранного урока, созданного или оплаченного (вместе с курсом или отдельно)
+    текущим пользователем. Ответы кешируются"""
     serializer_class = LessonSerializer
-    permission_classes = [IsAuthenticated & (IsOwner | IsModerator)]
+    permission_classes = [IsAuthenticated & (IsOwner | IsModerator | HasEntitlement)]
+    cache_resource = LESSONS
 
     def get_queryset(self):
         user = self.request.user
-        if user.groups.filter(name='Модераторы').exists():
+        if is_moderator(user):
             return Lesson.objects.all()
-        return Lesson.objects.filter(owner=user)
+        return Lesson.objects.filter(Q(owner=user) | get_entitlements(user.pk).lessons_filter())
 
 
 class LessonUpdateApiView(UpdateAPIView):
@@ -104,7 +171,7 @@ class LessonUpdateApiView(UpdateAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        if user.groups.filter(name='Модераторы').exists():
+        if is_moderator(user):
             return Lesson.objects.all()
         return Lesson.objects.filter(owner=user)
 
@@ -118,30 +185,157 @@ class LessonDestroyApiView(DestroyAPIView):
         return Lesson.objects.filter(owner=self.request.user)
 
 
+class LessonBulkApiView(APIView):
+    """Контроллер для пакетной работы с уроками одного курса:
+        - POST {"course": id, "lessons": [...]}: создание уроков (только владелец курса)
+        - PATCH {"course": id, "lessons": [{"id": ..., ...}, ...]}: частичное обновление уроков
+          (свои уроки для пользователей, все уроки курса для модераторов)
+        - DELETE {"course": id, "ids": [...]}: удаление своих уроков курса
+    Уроки проверяются вместе, изменения сохраняются одним запросом в одной транзакции.
+    При ошибке хотя бы в одном уроке ничего не сохраняется, а ошибки возвращаются по индексам уроков"""
+
+    permission_classes = [IsAuthenticated]
+
+    def get_course_id(self):
+        """Возвращает id курса из тела запроса"""
+        course_id = self.request.data.get('course') if isinstance(self.request.data, dict) else None
+        try:
+            return int(course_id)
+        except (TypeError, ValueError):
+            raise ValidationError({'course': ['Укажите id курса']})
+
+    def get_serializer(self, *args, **kwargs):
+        return LessonBulkSerializer(*args, many=True, max_length=LESSONS_BULK_MAX_SIZE,
+                                    context={'request': self.request, 'view': self}, **kwargs)
+
+    @staticmethod
+    def get_errors(serializer):
+        """Ошибки пакета в виде словаря {индекс урока: ошибки}, только для уроков с ошибками.
+        Ошибки всего пакета (например, превышение размера) возвращаются как есть"""
+        errors = serializer.errors
+        if isinstance(errors, list):
+            return {index: item for index, item in enumerate(errors) if item}
+        return errors
+
+    def save(self, serializer, response_status, **kwargs):
+        """Сохраняет пакет уроков в одной транзакции. Пакетные запросы не отправляют сигналы моделей,
+        поэтому кеш курсов и уроков сбрасывается явно"""
+        if not serializer.is_valid():
+            return Response({'lessons': self.get_errors(serializer)}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            serializer.save(**kwargs)
+            bump_cache_version(COURSES, LESSONS)
+        return Response(serializer.data, status=response_status)
+
+    def post(self, request, *args, **kwargs):
+        """Пакетное создание уроков курса, владельцем уроков назначается текущий пользователь"""
+        if is_moderator(request.user):
+            raise PermissionDenied("Модераторы не могут создавать уроки")
+        course = get_object_or_404(Course.objects.only('id'), pk=self.get_course_id(), owner=request.user)
+        serializer = self.get_serializer(data=request.data.get('lessons'))
+        return self.save(serializer, status.HTTP_201_CREATED, course=course, owner=request.user)
+
+    def patch(self, request, *args, **kwargs):
+        """Пакетное частичное обновление уроков курса. Все обновляемые уроки загружаются одним запросом"""
+        queryset = Lesson.objects.filter(course_id=self.get_course_id())
+        if not is_moderator(request.user):
+            queryset = queryset.filter(owner=request.user)
+        data = request.data.get('lessons')
+        ids = [item.get('id') for item in data if isinstance(item, dict)] if isinstance(data, list) else []
+        lessons = queryset.in_bulk([lesson_id for lesson_id in ids if isinstance(lesson_id, int)])
+        serializer = self.get_serializer(lessons, data=data, partial=True)
+        return self.save(serializer, status.HTTP_200_OK)
+
+    def delete(self, request, *args, **kwargs):
+        """Пакетное удаление своих уроков курса. Счетчик уроков курса изменяется одним запросом"""
+        # get_course_id проверяет, что тело запроса - объект, до чтения из него списка id
+        course_id = self.get_course_id()
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not all(isinstance(lesson_id, int) for lesson_id in ids):
+            raise ValidationError({'ids': ['Укажите список id уроков']})
+        queryset = Lesson.objects.filter(course_id=course_id, owner=request.user, pk__in=ids)
+        with transaction.atomic():
+            missing = set(ids) - set(queryset.values_list('pk', flat=True))
+            if missing:
+                raise ValidationError({'ids': [f'Уроки не найдены: {sorted(missing)}']})
+            delete_lessons(queryset)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class QueryMetricsAPIView(APIView):
+    """Внутренний эндпоинт метрик эндпоинтов в формате Prometheus (см. QueryMetricsMiddleware).
+    Доступен только с заголовком 'Authorization: Bearer <LMS_METRICS_TOKEN>', без настроенного токена отключен"""
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        if not LMS_METRICS_TOKEN:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {LMS_METRICS_TOKEN}'):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class SubscriptionAPIView(APIView):
-    """Контроллер для управления подписками на обновления для пользователя"""
+    """Контроллер для управления подписками на обновления для пользователя (переключение подписки)"""
 
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
-        """Метод post реализует логику управления подписками пользователей на курсы"""
-
-        # Получаем данные текущего пользователя, id курса из тела запроса и находим курс или возвращаем 404
-        user = request.user
-        course_id = request.data.get('course_id')
-        course = get_object_or_404(Course, id=course_id)
-
-        # Пытаемся найти подписку для данного пользователя и курса или создать ее
-        subscription, created = Subscription.objects.get_or_create(
-            user=user,
-            course=course
-        )
-
-        # Если подписка не была создана (существует), удаляем ее. Если создана, выводим сообщение о создании подписки
-        if not created:
-            subscription.delete()
+        """Метод post переключает подписку пользователя на курс: удаляет существующую или создает новую.
+        Отписка выполняется одним запросом DELETE, подписка - INSERT ... ON CONFLICT DO NOTHING,
+        поэтому одновременные запросы не приводят к ошибке уникальности"""
+
+        serializer = SubscriptionToggleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        course_id = serializer.validated_data['course_id']
+
+        # Если подписка была удалена, сообщаем об отписке. Иначе создаем подписку (404, если курса нет)
+        if unsubscribe(request.user, [course_id]):
             message = 'Подписка удалена'
+        elif subscribe(request.user, [course_id]):
+            raise NotFound('Курс не найден')
         else:
             message = 'Подписка добавлена'
 
         return Response({"message": message}, status=status.HTTP_200_OK)
+
+
+class CourseSubscriptionAPIView(APIView):
+    """Идемпотентная подписка на курс (PUT) и отписка от него (DELETE).
+    Повторные запросы не меняют результат и не приводят к ошибкам"""
+
+    permission_classes = [IsAuthenticated]
+
+    def put(self, request, course_id, *args, **kwargs):
+        if subscribe(request.user, [course_id]):
+            raise NotFound('Курс не найден')
+        return Response({'course_id': course_id, 'subscribed': True}, status=status.HTTP_200_OK)
+
+    def delete(self, request, course_id, *args, **kwargs):
+        unsubscribe(request.user, [course_id])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class SubscriptionBatchAPIView(APIView):
+    """Идемпотентная пакетная подписка (PUT) и отписка (DELETE) для списка курсов {"course_ids": [...]}.
+    Подписка создается, только если существуют все курсы из списка"""
+
+    permission_classes = [IsAuthenticated]
+
+    def get_course_ids(self):
+        serializer = SubscriptionBatchSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['course_ids']
+
+    def put(self, request, *args, **kwargs):
+        course_ids = self.get_course_ids()
+        missing = subscribe(request.user, course_ids)
+        if missing:
+            raise NotFound(f'Курсы не найдены: {sorted(missing)}')
+        return Response({'course_ids': sorted(set(course_ids)), 'subscribed': True}, status=status.HTTP_200_OK)
+
+    def delete(self, request, *args, **kwargs):
+        unsubscribe(request.user, self.get_course_ids())
+        return Response(status=status.HTTP_204_NO_CONTENT)
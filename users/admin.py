@@ -45,8 +45,8 @@ class CustomUserAdmin(UserAdmin):
 
 class PaymentAdmin(admin.ModelAdmin):
     """Кастомный класс для отображения платежей (Payment) в админке"""
-    list_display = ('user', 'amount', 'payment_method', 'payment_date')
-    list_filter = ('payment_method', 'course', 'lesson')
+    list_display = ('user', 'amount', 'payment_method', 'status', 'payment_date')
+    list_filter = ('status', 'payment_method', 'course', 'lesson')
     search_fields = ('user__email', 'amount')
 
 
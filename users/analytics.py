@@ -0,0 +1,107 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from users.models import Payment, PaymentDailyRollup
+
+
+def _day_start(day):
+    """Начало дня в текущем часовом поясе"""
+
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def rebuild_payment_rollups(date_from, date_to):
+    """Пересчитывает ежедневные сводки оплаченных платежей за период [date_from, date_to] (включительно).
+    Сводки за период удаляются и строятся заново одним агрегирующим запросом по диапазону payment_date,
+    поэтому пересчет идемпотентен. Платежи в других статусах (незавершенные и неудачные сессии оплаты)
+    в выручку не входят. Возвращает количество созданных строк сводки"""
+
+    payments = Payment.objects.filter(
+        payment_date__gte=_day_start(date_from),
+        payment_date__lt=_day_start(date_to + timedelta(days=1)),
+        status=Payment.STATUS_PAID,
+    )
+    rows = payments.annotate(
+        date=TruncDate('payment_date'),
+    ).values(
+        'date', 'course_id', 'lesson_id', 'payment_method',
+    ).annotate(
+        payments_count=Count('id'),
+        amount_total=Sum('amount'),
+        payers_count=Count('user_id', distinct=True),
+    ).order_by()
+
+    with transaction.atomic():
+        PaymentDailyRollup.objects.filter(date__range=(date_from, date_to)).delete()
+        created = PaymentDailyRollup.objects.bulk_create(
+            [PaymentDailyRollup(**row) for row in rows],
+            batch_size=1000,
+        )
+    return len(created)
+
+
+def rebuild_payment_rollups_for(payments):
+    """Пересчитывает сводки за дни платежей (например, после изменения их статусов).
+    Подряд идущие дни пересчитываются одним периодом"""
+
+    days = sorted({timezone.localdate(payment.payment_date) for payment in payments})
+    start = None
+    for index, day in enumerate(days):
+        if start is None:
+            start = day
+        if index + 1 == len(days) or days[index + 1] - day > timedelta(days=1):
+            rebuild_payment_rollups(start, day)
+            start = None
+
+
+def get_revenue_report(date_from, date_to, period='day', group_by=None):
+    """Выручка по сводкам за период с группировкой по дню или месяцу
+    и (опционально) по курсу, уроку или способу оплаты"""
+
+    fields = ['period']
+    if group_by:
+        fields.append(f'{group_by}_id' if group_by in ('course', 'lesson') else group_by)
+    return list(
+        PaymentDailyRollup.objects.filter(
+            date__range=(date_from, date_to),
+        ).annotate(
+            period=TruncMonth('date') if period == 'month' else F('date'),
+        ).values(
+            *fields,
+        ).annotate(
+            payments_count=Sum('payments_count'),
+            amount_total=Sum('amount_total'),
+        ).order_by(*fields)
+    )
+
+
+def get_top_courses(date_from, date_to, limit=5):
+    """Курсы с наибольшей выручкой за период"""
+
+    return list(
+        PaymentDailyRollup.objects.filter(
+            date__range=(date_from, date_to),
+            course__isnull=False,
+        ).values(
+            'course_id', 'course__title',
+        ).annotate(
+            payments_count=Sum('payments_count'),
+            amount_total=Sum('amount_total'),
+        ).order_by('-amount_total')[:limit]
+    )
+
+
+def get_paying_users_count(date_from, date_to):
+    """Количество уникальных плательщиков (по оплаченным платежам) за период.
+    Уникальность между днями нельзя получить из дневных сводок, поэтому счетчик считается по платежам,
+    но только в диапазоне дат (по индексу payment_date), без просмотра всей истории"""
+
+    return Payment.objects.filter(
+        payment_date__gte=_day_start(date_from),
+        payment_date__lt=_day_start(date_to + timedelta(days=1)),
+        status=Payment.STATUS_PAID,
+    ).values('user_id').distinct().count()
@@ -0,0 +1,82 @@
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from config.settings import AUTH_USER_CACHE_TIMEOUT
+from users.models import User
+from users.revocation import get_revocation_keys, is_token_revoked
+from users.roles import ROLES_CACHE_KEY
+
+
+AUTH_USER_CACHE_KEY = 'users:auth:{user_id}'
+# Поля пользователя, которые хранятся в кеше аутентификации. Остальные поля загружаются из БД при обращении
+# (как отложенные поля queryset.only). Порядок полей - как в модели (этого требует Model.from_db)
+AUTH_USER_FIELDS = ('id', 'is_superuser', 'is_staff', 'is_active', 'email')
+
+
+def get_auth_cache_keys(user_id):
+    """Ключи кеша с полями и ролями пользователя"""
+
+    return [AUTH_USER_CACHE_KEY.format(user_id=user_id), ROLES_CACHE_KEY.format(user_id=user_id)]
+
+
+def get_cached_user(user_id, cached=None):
+    """Возвращает пользователя с полями AUTH_USER_FIELDS из кеша (при промахе - из БД) или None, если пользователя нет.
+    Поля пользователя и его роли читаются из кеша одним запросом (get_many), поэтому проверка роли модератора
+    в контроллерах тоже не обращается к БД. cached - уже прочитанные значения ключей get_auth_cache_keys"""
+
+    user_key, roles_key = get_auth_cache_keys(user_id)
+    if cached is None:
+        cached = cache.get_many([user_key, roles_key])
+    values = cached.get(user_key)
+    if values is None:
+        values = User.objects.filter(pk=user_id).values_list(*AUTH_USER_FIELDS).first()
+        if values is None:
+            return None
+        cache.set(user_key, values, AUTH_USER_CACHE_TIMEOUT)
+
+    user = User.from_db(DEFAULT_DB_ALIAS, AUTH_USER_FIELDS, values)
+    if roles_key in cached:
+        user.__dict__['roles'] = cached[roles_key]
+    return user
+
+
+def invalidate_cached_users(user_ids):
+    """Удаляет пользователей из кеша аутентификации. Удаление повторяется после фиксации транзакции,
+    чтобы пользователь, загруженный конкурентным запросом до фиксации изменений, не остался в кеше"""
+
+    keys = [AUTH_USER_CACHE_KEY.format(user_id=user_id) for user_id in user_ids]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """Аутентификация по JWT, получающая пользователя из кеша (get_cached_user) вместо запроса к users_user
+    на каждый запрос. Кеш сбрасывается при сохранении и удалении пользователя и при его блокировке
+    (users.signals, users.tasks.deactivate_users), а хранится не дольше AUTH_USER_CACHE_TIMEOUT секунд.
+    Отзыв токена (users.revocation) проверяется тем же обращением к кешу, что и получение пользователя.
+    При включенной проверке смены пароля (CHECK_REVOKE_TOKEN) нужен хеш пароля, который не кешируется,
+    поэтому пользователь загружается из БД как в JWTAuthentication"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        cached = cache.get_many([*get_auth_cache_keys(user_id), *get_revocation_keys(validated_token)])
+        if is_token_revoked(validated_token, cached):
+            raise AuthenticationFailed(_('Token is revoked'), code='token_revoked')
+        if api_settings.CHECK_REVOKE_TOKEN or api_settings.USER_ID_FIELD != 'id':
+            return super().get_user(validated_token)
+
+        user = get_cached_user(user_id, cached)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
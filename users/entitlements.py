@@ -0,0 +1,98 @@
+from typing import NamedTuple
+
+from django.db.models import Q
+
+from config.settings import ENTITLEMENTS_CACHE_TIMEOUT
+from lms.cache import ENTITLEMENTS, bump_cache_version, get_cached_value, user_resource
+from users.models import Entitlement, Payment
+
+
+class Entitlements(NamedTuple):
+    """Оплаченные пользователем курсы и уроки (множества id). Проверка доступа не обращается к БД"""
+
+    courses: frozenset
+    lessons: frozenset
+
+    def has_course(self, course_id):
+        """Проверяет доступ к курсу"""
+
+        return course_id in self.courses
+
+    def has_lesson(self, lesson):
+        """Проверяет доступ к уроку: оплачен сам урок или его курс"""
+
+        return lesson.pk in self.lessons or lesson.course_id in self.courses
+
+    def allows(self, obj):
+        """Проверяет доступ к курсу или уроку"""
+
+        if hasattr(obj, 'course_id'):
+            return self.has_lesson(obj)
+        return self.has_course(obj.pk)
+
+    def lessons_filter(self):
+        """Условие queryset уроков, доступных пользователю по оплате (по id, без join таблицы платежей)"""
+
+        return Q(pk__in=self.lessons) | Q(course_id__in=self.courses)
+
+
+def load_entitlements(user_id):
+    """Загружает оплаченные пользователем курсы и уроки одним запросом"""
+
+    courses, lessons = set(), set()
+    for course_id, lesson_id in Entitlement.objects.filter(user_id=user_id).values_list('course_id', 'lesson_id'):
+        if course_id is not None:
+            courses.add(course_id)
+        else:
+            lessons.add(lesson_id)
+    return Entitlements(frozenset(courses), frozenset(lessons))
+
+
+def get_entitlements(user_id):
+    """Оплаченные пользователем курсы и уроки. Хранятся в кеше и загружаются из БД только после выдачи
+    пользователю нового доступа (или вытеснения из кеша)"""
+
+    return get_cached_value(user_resource(ENTITLEMENTS, user_id), lambda: load_entitlements(user_id),
+                            ENTITLEMENTS_CACHE_TIMEOUT)
+
+
+def invalidate_entitlements(*user_ids):
+    """Сбрасывает кеш доступов пользователей"""
+
+    bump_cache_version(*(user_resource(ENTITLEMENTS, user_id) for user_id in user_ids))
+
+
+def grant_entitlements(payments):
+    """Выдает доступы по оплаченным платежам одним запросом INSERT ... ON CONFLICT DO NOTHING:
+    повторная оплата того же курса (урока) не создает дубликат. Платежи в других статусах и платежи
+    без курса и урока пропускаются. Возвращает количество обработанных платежей"""
+
+    entitlements = [
+        Entitlement(user_id=payment.user_id, course_id=payment.course_id,
+                    lesson_id=None if payment.course_id else payment.lesson_id, payment_id=payment.pk)
+        for payment in payments
+        if payment.status == Payment.STATUS_PAID and (payment.course_id or payment.lesson_id)
+    ]
+    if entitlements:
+        Entitlement.objects.bulk_create(entitlements, ignore_conflicts=True)
+        invalidate_entitlements(*{entitlement.user_id for entitlement in entitlements})
+    return len(entitlements)
+
+
+def backfill_entitlements(batch_size):
+    """Выдает доступы по всем оплаченным платежам (например, после пакетной вставки платежей без сигналов).
+    Платежи читаются итератором, доступы создаются пачками по batch_size. Возвращает количество созданных доступов"""
+
+    payments = Payment.objects.filter(status=Payment.STATUS_PAID).filter(
+        Q(course__isnull=False) | Q(lesson__isnull=False)
+    ).only('id', 'user_id', 'course_id', 'lesson_id', 'status').order_by('id')
+
+    before = Entitlement.objects.count()
+    batch = []
+    for payment in payments.iterator(chunk_size=batch_size):
+        batch.append(payment)
+        if len(batch) >= batch_size:
+            grant_entitlements(batch)
+            batch = []
+    grant_entitlements(batch)
+    return Entitlement.objects.count() - before
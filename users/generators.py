@@ -0,0 +1,182 @@
+import csv
+import io
+import random
+from array import array
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.utils import timezone
+
+from lms.models import Course, Lesson, Subscription
+from users.models import Payment, User
+
+
+@contextmanager
+def historical_payment_dates():
+    """Отключает auto_now_add у Payment.payment_date, чтобы bulk_create сохранил сгенерированные даты платежей
+    (иначе все платежи получат текущую дату)"""
+
+    field = Payment._meta.get_field('payment_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def zipf_cum_weights(count, exponent):
+    """Накопленные веса распределения Ципфа: элемент с рангом r выбирается с вероятностью ~ 1 / r ** exponent.
+    Используются в random.choices, где выбор по накопленным весам выполняется двоичным поиском"""
+
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def load_ids(queryset, chunk_size=10000):
+    """Загружает id объектов в компактный массив (8 байт на id), а не в список объектов Python"""
+
+    return array('q', queryset.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size))
+
+
+class DatasetGenerator:
+    """Генератор синтетических данных для нагрузочного тестирования: пользователи, курсы, уроки, подписки и платежи.
+    Данные детерминированы: при одинаковом seed и одинаковом исходном состоянии БД генерируются те же строки.
+    Популярность курсов (подписки и покупки) распределена по закону Ципфа: немногие курсы получают большую часть
+    подписок и платежей, как в реальных данных.
+    Строки создаются генераторами и вставляются пачками через bulk_create, а самые объемные таблицы (уроки и платежи)
+    при use_copy=True - через COPY PostgreSQL. Память не зависит от количества строк, кроме массивов id"""
+
+    def __init__(self, seed=0, batch_size=5000, use_copy=False, skew=1.1, days=365, email_domain='load.test'):
+        """Конструктор класса DatasetGenerator"""
+
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.use_copy = use_copy
+        self.skew = skew
+        self.days = days
+        self.email_domain = email_domain
+        # Даты отсчитываются от начала текущего дня, а не от текущего момента, чтобы повторный запуск с тем же seed
+        # давал те же даты
+        self.end = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def random_date(self):
+        """Случайная дата за self.days дней до начала текущего дня"""
+
+        return self.end - timedelta(seconds=self.random.randrange(1, self.days * 24 * 60 * 60 + 1))
+
+    def insert(self, model, fields, rows, copy=False, ignore_conflicts=False):
+        """Вставляет строки (кортежи значений полей fields) пачками по batch_size. Возвращает количество строк"""
+
+        total = 0
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return total
+            if copy:
+                self.copy(model, fields, batch)
+            else:
+                model.objects.bulk_create([model(**dict(zip(fields, row))) for row in batch],
+                                          ignore_conflicts=ignore_conflicts)
+            total += len(batch)
+
+    def copy(self, model, fields, batch):
+        """Вставляет пачку строк командой COPY ... FROM STDIN (формат CSV). Поддерживаются psycopg2 и psycopg 3"""
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in batch:
+            writer.writerow(['' if value is None else value for value in row])
+        columns = ', '.join(connection.ops.quote_name(model._meta.get_field(field).column) for field in fields)
+        sql = f'COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)'
+
+        with connection.cursor() as cursor:
+            raw_cursor = cursor.cursor
+            buffer.seek(0)
+            if hasattr(raw_cursor, 'copy_expert'):
+                raw_cursor.copy_expert(sql, buffer)
+            else:
+                with raw_cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+
+    def generate_users(self, count, password):
+        """Создает пользователей с email вида user<N>@<email_domain>. Пароль хешируется один раз для всех"""
+
+        password_hash = make_password(password)
+        start = User.objects.filter(email__endswith=f'@{self.email_domain}').count()
+        rows = (
+            (f'user{number}@{self.email_domain}', password_hash, self.random_date())
+            for number in range(start, start + count)
+        )
+        return self.insert(User, ('email', 'password', 'date_joined'), rows)
+
+    def generate_courses(self, count, user_ids):
+        """Создает курсы со случайными владельцами и ценой"""
+
+        rows = (
+            (f'Курс {number}', f'Описание курса {number}', self.random.randrange(10, 151) * 1000,
+             self.random.choice(user_ids))
+            for number in range(count)
+        )
+        return self.insert(Course, ('title', 'description', 'price', 'owner_id'), rows)
+
+    def generate_lessons(self, count, course_owners):
+        """Создает уроки, случайно распределенные по курсам. Владелец урока - владелец курса"""
+
+        course_ids = array('q', course_owners)
+
+        def rows():
+            for number in range(count):
+                course_id = self.random.choice(course_ids)
+                yield (course_id, f'Урок {number}', f'Видео урока: https://youtu.be/{number}',
+                       self.random.randrange(5, 101) * 100, course_owners[course_id])
+
+        fields = ('course_id', 'title', 'description', 'price', 'owner_id')
+        return self.insert(Lesson, fields, rows(), copy=self.use_copy)
+
+    def popular_courses(self, course_ids, count):
+        """Генератор id курсов с распределением популярности по Ципфу. Ранги популярности назначаются курсам
+        случайно (но детерминированно), а курсы выбираются пачками, чтобы не хранить всю выборку в памяти"""
+
+        ranked = array('q', course_ids)
+        self.random.shuffle(ranked)
+        cum_weights = zipf_cum_weights(len(ranked), self.skew)
+        while count > 0:
+            size = min(count, self.batch_size)
+            yield from self.random.choices(ranked, cum_weights=cum_weights, k=size)
+            count -= size
+
+    def generate_subscriptions(self, count, user_ids, course_ids):
+        """Создает подписки на популярные курсы. Повторные пары (пользователь, курс) пропускаются,
+        поэтому подписок может быть создано меньше, чем запрошено"""
+
+        before = Subscription.objects.count()
+        rows = ((self.random.choice(user_ids), course_id) for course_id in self.popular_courses(course_ids, count))
+        self.insert(Subscription, ('user_id', 'course_id'), rows, ignore_conflicts=True)
+        return Subscription.objects.count() - before
+
+    def generate_payments(self, count, user_ids, course_ids, lesson_ids, lesson_share=0.3):
+        """Создает платежи за последние self.days дней: доля lesson_share - покупки уроков, остальные - покупки
+        курсов с распределением популярности по Ципфу. Большинство платежей оплачены, часть в других статусах"""
+
+        methods = [method for method, _ in Payment.PAYMENT_METHOD_CHOICES]
+        statuses = [Payment.STATUS_PAID, Payment.STATUS_OPEN, Payment.STATUS_FAILED, Payment.STATUS_EXPIRED]
+        status_weights = [85, 5, 4, 6]
+        if not lesson_ids:
+            lesson_share = 0
+
+        def rows():
+            for course_id in self.popular_courses(course_ids, count):
+                lesson_id = None
+                if self.random.random() < lesson_share:
+                    course_id, lesson_id = None, self.random.choice(lesson_ids)
+                    amount = self.random.randrange(5, 101) * 100
+                else:
+                    amount = self.random.randrange(10, 151) * 1000
+                yield (self.random.choice(user_ids), self.random_date(), course_id, lesson_id, amount,
+                       self.random.choice(methods), self.random.choices(statuses, status_weights)[0])
+
+        fields = ('user_id', 'payment_date', 'course_id', 'lesson_id', 'amount', 'payment_method', 'status')
+        with historical_payment_dates():
+            return self.insert(Payment, fields, rows(), copy=self.use_copy)
@@ -0,0 +1,43 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from users.analytics import rebuild_payment_rollups
+from users.models import Payment
+
+
+class Command(BaseCommand):
+    help = 'Заполняет ежедневные сводки платежей за период, обрабатывая его частями по несколько дней'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', type=date.fromisoformat,
+                            help='Начало периода (YYYY-MM-DD), по умолчанию дата первого платежа')
+        parser.add_argument('--date-to', type=date.fromisoformat,
+                            help='Конец периода (YYYY-MM-DD), по умолчанию дата последнего платежа')
+        parser.add_argument('--chunk-days', type=int, default=7, help='Количество дней в одной порции')
+
+    def handle(self, *args, **options):
+        bounds = Payment.objects.aggregate(first=Min('payment_date'), last=Max('payment_date'))
+        if bounds['first'] is None:
+            self.stdout.write(self.style.WARNING('Платежей нет, сводки не созданы'))
+            return
+
+        date_from = options['date_from'] or timezone.localdate(bounds['first'])
+        date_to = options['date_to'] or timezone.localdate(bounds['last'])
+        if date_from > date_to:
+            raise CommandError('Дата начала периода должна быть не позже даты окончания')
+        if options['chunk_days'] < 1:
+            raise CommandError('Размер порции должен быть не меньше одного дня')
+
+        total = 0
+        chunk_start = date_from
+        while chunk_start <= date_to:
+            chunk_end = min(chunk_start + timedelta(days=options['chunk_days'] - 1), date_to)
+            count = rebuild_payment_rollups(chunk_start, chunk_end)
+            total += count
+            self.stdout.write(f'{chunk_start} - {chunk_end}: {count} строк сводки')
+            chunk_start = chunk_end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f'Успешно создано {total} строк сводки платежей'))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from lms.benchmarks import format_stats, measure
+from users.authentication import CachedJWTAuthentication, invalidate_cached_users
+from users.models import User
+from users.roles import invalidate_user_roles
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает накладные расходы аутентификации по JWT: загрузка пользователя и его ролей из БД '
+            '(JWTAuthentication) и из кеша (CachedJWTAuthentication). Замеряется разбор токена, получение '
+            'пользователя и проверка роли модератора, как в контроллерах')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='Email пользователя, от имени которого выполняются запросы')
+        parser.add_argument('--iterations', type=int, default=1000, help='Количество замеров')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options['email']).first() if options['email'] else User.objects.first()
+        if user is None:
+            raise CommandError('Не найден пользователь для выполнения запросов')
+
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        invalidate_cached_users([user.pk])
+        invalidate_user_roles([user.pk])
+
+        for name, authentication in (
+            ('JWTAuthentication (БД)', JWTAuthentication()),
+            ('CachedJWTAuthentication (кеш)', CachedJWTAuthentication()),
+        ):
+            def authenticate():
+                authenticated_user, _ = authentication.authenticate(request)
+                return authenticated_user.is_moderator
+
+            stats = measure(authenticate, options['iterations'], warmup=1)
+            with CaptureQueriesContext(connection) as queries:
+                authenticate()
+            self.stdout.write(f'{format_stats(name, stats)}, SQL-запросов на запрос: {len(queries)}')
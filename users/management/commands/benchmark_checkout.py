@@ -0,0 +1,42 @@
+from unittest.mock import patch
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from lms.benchmarks import format_stats, measure
+from lms.models import Course
+from users import services
+from users.services import StripeStubClient
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает задержку подготовки оплаты в Stripe: создание продукта, цены и сессии при каждой покупке '
+            'и повторное использование сохраненных продукта и цены (через локальную заглушку Stripe)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency', type=float, default=150, help='Имитируемая задержка вызова Stripe, мс')
+        parser.add_argument('--iterations', type=int, default=20, help='Количество замеров')
+
+    def handle(self, *args, **options):
+        course = Course.objects.first()
+        if course is None:
+            raise CommandError('Необходимо сначала создать курс')
+
+        client = StripeStubClient(latency=options['latency'] / 1000)
+
+        def checkout_without_reuse():
+            product = services.create_stripe_product({'name': course.title, 'description': course.title})
+            price = services.create_stripe_price(course.price, product)
+            services.create_stripe_sessions(price.id)
+
+        def checkout_with_reuse():
+            services.create_stripe_sessions(services.get_stripe_price_id(course, 'course'))
+
+        # Идентификаторы Stripe, сохраненные в курсе во время замера, откатываются
+        with patch.object(services, 'stripe_client', client), transaction.atomic():
+            without_reuse = measure(checkout_without_reuse, options['iterations'])
+            with_reuse = measure(checkout_with_reuse, options['iterations'], warmup=1)
+            transaction.set_rollback(True)
+
+        self.stdout.write(format_stats('Продукт + цена + сессия', without_reuse))
+        self.stdout.write(format_stats('Сохраненная цена + сессия', with_reuse))
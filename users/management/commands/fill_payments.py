@@ -1,75 +1,82 @@
-from django.core.management.base import BaseCommand
+import time
 
-from users.models import Payment, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from lms.cache import COURSES, LESSONS, bump_cache_version
 from lms.models import Course, Lesson
+from lms.services import repair_course_counters
+from users.entitlements import backfill_entitlements
+from users.generators import DatasetGenerator, load_ids
+from users.models import User
 
 
 class Command(BaseCommand):
-    help = 'Fill Payment table with test data'
+    help = ('Генерирует синтетические данные для нагрузочного тестирования: пользователей, курсы, уроки, подписки '
+            'и платежи в заданных объемах. Данные детерминированы (--seed), вставляются пачками через bulk_create, '
+            'уроки и платежи - при необходимости через COPY PostgreSQL (--copy). '
+            'Пример: fill_payments --users 100000 --courses 10000 --lessons 1000000 --subscriptions 1000000 '
+            '--payments 10000000 --copy')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=0, help='Количество новых пользователей')
+        parser.add_argument('--courses', type=int, default=0, help='Количество новых курсов')
+        parser.add_argument('--lessons', type=int, default=0, help='Количество новых уроков')
+        parser.add_argument('--subscriptions', type=int, default=0, help='Количество новых подписок (не более)')
+        parser.add_argument('--payments', type=int, default=1000, help='Количество новых платежей')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора случайных чисел')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Количество строк в одной вставке')
+        parser.add_argument('--copy', action='store_true', help='Вставлять уроки и платежи командой COPY PostgreSQL')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель распределения Ципфа для популярности курсов (0 - равномерно)')
+        parser.add_argument('--days', type=int, default=365, help='Период дат платежей и регистраций, дней')
+        parser.add_argument('--password', default='loadtest', help='Пароль создаваемых пользователей')
 
     def handle(self, *args, **options):
-        users = User.objects.all()
-        courses = Course.objects.all()
-        lessons = Lesson.objects.all()
+        if options['batch_size'] < 1 or options['days'] < 1:
+            raise CommandError('Размер пачки и период должны быть не меньше 1')
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('Вставка через COPY доступна только для PostgreSQL')
+
+        generator = DatasetGenerator(seed=options['seed'], batch_size=options['batch_size'], use_copy=options['copy'],
+                                     skew=options['skew'], days=options['days'])
+
+        if options['users']:
+            self.run('пользователей', generator.generate_users, options['users'], options['password'])
+        user_ids = load_ids(User.objects.all())
+        if not user_ids and any(options[name] for name in ('courses', 'subscriptions', 'payments')):
+            raise CommandError('Необходимо сначала создать пользователей (--users)')
 
-        if not users or not courses or not lessons:
-            self.stdout.write(self.style.ERROR('Необходимо сначала создать пользователей, курсы и уроки'))
-            return
+        if options['courses']:
+            self.run('курсов', generator.generate_courses, options['courses'], user_ids)
+        course_ids = load_ids(Course.objects.all())
+        if not course_ids and any(options[name] for name in ('lessons', 'subscriptions', 'payments')):
+            raise CommandError('Необходимо сначала создать курсы (--courses)')
 
-        payments_data = [
-            {
-                'user_id': 1,
-                'course_id': 2,
-                'lesson_id': None,
-                'amount': 90000,
-                'payment_method': 'cash',
-                'payment_date': '2023-11-21T15:30:00Z'
-            },
-            {
-                'user_id': 2,
-                'course_id': 2,
-                'lesson_id': None,
-                'amount': 90000,
-                'payment_method': 'transfer',
-                'payment_date': '2023-11-21T17:30:00Z'
-            },
-            {
-                'user_id': 3,
-                'course_id': None,
-                'lesson_id': 3,
-                'amount': 3000,
-                'payment_method': 'cash',
-                'payment_date': '2023-11-20T11:30:00Z'
-            },
-            {
-                'user_id': 4,
-                'course_id': None,
-                'lesson_id': 1,
-                'amount': 6000,
-                'payment_method': 'transfer',
-                'payment_date': '2023-10-21T10:50:00Z'
-            },
-            {
-                'user_id': 4,
-                'course_id': 3,
-                'lesson_id': None,
-                'amount': 70000,
-                'payment_method': 'cash',
-                'payment_date': '2023-11-28T19:30:00Z'
-            },
-            {
-                'user_id': 4,
-                'course_id': 1,
-                'lesson_id': None,
-                'amount': 120000,
-                'payment_method': 'transfer',
-                'payment_date': '2023-11-03T16:00:00Z'
-            },
-        ]
+        if options['lessons']:
+            course_owners = dict(Course.objects.values_list('id', 'owner_id').iterator(chunk_size=10000))
+            self.run('уроков', generator.generate_lessons, options['lessons'], course_owners)
+        if options['subscriptions']:
+            self.run('подписок', generator.generate_subscriptions, options['subscriptions'], user_ids, course_ids)
+        if options['payments']:
+            lesson_ids = load_ids(Lesson.objects.all())
+            self.run('платежей', generator.generate_payments, options['payments'], user_ids, course_ids, lesson_ids)
+            self.run('доступов по оплаченным платежам', backfill_entitlements, options['batch_size'])
 
-        created_count = 0
-        for data in payments_data:
-            Payment.objects.create(**data)
-            created_count += 1
+        # Пакетная вставка не отправляет сигналы моделей, поэтому счетчики курсов пересчитываются,
+        # а кеш сбрасывается явно
+        if options['lessons'] or options['subscriptions']:
+            fixed = sum(count for _, _, count in repair_course_counters(options['batch_size']))
+            self.stdout.write(f'Пересчитаны счетчики уроков и подписчиков {fixed} курсов')
+        bump_cache_version(COURSES, LESSONS)
+        if options['payments']:
+            self.stdout.write('Для отчетов по платежам пересчитайте сводки: python manage.py backfill_payment_rollups')
 
-        self.stdout.write(self.style.SUCCESS(f'Успешно создано {created_count} платежей'))
+    def run(self, name, generate, *args):
+        """Выполняет генерацию и выводит количество созданных строк и скорость вставки"""
+        start = time.perf_counter()
+        count = generate(*args)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Успешно создано {count} {name} за {elapsed:.1f} с ({count / max(elapsed, 1e-9):.0f} строк/с)'
+        ))
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:18
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индексы создаются без блокировки записи в таблицу (CREATE INDEX CONCURRENTLY), вне транзакции
+    atomic = False
+
+    dependencies = [
+        ('lms', '0004_course_price_lesson_price'),
+        ('users', '0005_alter_payment_payment_method'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='payment',
+            index=models.Index(fields=['-payment_date'], name='payment_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='payment',
+            index=models.Index(fields=['course', '-payment_date'], name='payment_course_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='payment',
+            index=models.Index(fields=['lesson', '-payment_date'], name='payment_lesson_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='payment',
+            index=models.Index(fields=['payment_method', '-payment_date'], name='payment_method_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='payment',
+            index=models.Index(fields=['user', '-payment_date'], name='payment_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0004_course_price_lesson_price'),
+        ('users', '0006_payment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('payment_method', models.CharField(blank=True, choices=[('cash', 'Наличные'), ('transfer', 'Перевод на счет')], max_length=20, null=True, verbose_name='Способ оплаты')),
+                ('payments_count', models.PositiveIntegerField(verbose_name='Количество платежей')),
+                ('amount_total', models.PositiveBigIntegerField(verbose_name='Сумма платежей')),
+                ('payers_count', models.PositiveIntegerField(verbose_name='Количество плательщиков')),
+                ('course', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='lms.course', verbose_name='Оплаченный курс')),
+                ('lesson', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='lms.lesson', verbose_name='Оплаченный урок')),
+            ],
+            options={
+                'verbose_name': 'Сводка платежей за день',
+                'verbose_name_plural': 'Сводки платежей за день',
+                'indexes': [models.Index(fields=['date'], name='rollup_date_idx'), models.Index(fields=['course', 'date'], name='rollup_course_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:22
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def mark_existing_payments_paid(apps, schema_editor):
+    """Отмечает оплаченными существующие платежи без сессии Stripe (наличные и переводы, записанные до
+    введения статусов). Платежи с сессией Stripe остаются в статусе 'open' до события Stripe"""
+    Payment = apps.get_model('users', 'Payment')
+    Payment.objects.filter(Q(session_id__isnull=True) | Q(session_id='')).update(status='paid')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_paymentdailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Создается сессия оплаты'), ('open', 'Ожидает оплаты'), ('failed', 'Ошибка создания сессии оплаты')], default='open', max_length=20, verbose_name='Статус платежа'),
+        ),
+        migrations.RunPython(mark_existing_payments_paid, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_payment_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='session_id',
+            field=models.CharField(blank=True, db_index=True, help_text='Укажите id сессии', max_length=255, null=True, verbose_name='ID сессии'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Создается сессия оплаты'), ('open', 'Ожидает оплаты'), ('paid', 'Оплачен'), ('failed', 'Ошибка оплаты'), ('expired', 'Сессия оплаты истекла')], default='open', max_length=20, verbose_name='Статус платежа'),
+        ),
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True, verbose_name='ID события')),
+                ('event_type', models.CharField(max_length=100, verbose_name='Тип события')),
+                ('payload', models.JSONField(verbose_name='Содержимое события')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата получения')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата обработки')),
+            ],
+            options={
+                'verbose_name': 'Событие Stripe',
+                'verbose_name_plural': 'События Stripe',
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['received_at'], name='stripe_event_unprocessed_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def grant_paid_entitlements(apps, schema_editor):
+    """Выдает доступы по существующим оплаченным платежам"""
+    Payment = apps.get_model('users', 'Payment')
+    Entitlement = apps.get_model('users', 'Entitlement')
+
+    payments = Payment.objects.filter(status='paid').exclude(course__isnull=True, lesson__isnull=True).order_by('id')
+    batch = []
+    for payment in payments.values('id', 'user_id', 'course_id', 'lesson_id').iterator(chunk_size=2000):
+        batch.append(Entitlement(user_id=payment['user_id'], course_id=payment['course_id'],
+                                 lesson_id=None if payment['course_id'] else payment['lesson_id'],
+                                 payment_id=payment['id']))
+        if len(batch) >= 2000:
+            Entitlement.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Entitlement.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0006_course_counters'),
+        ('users', '0009_stripe_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Entitlement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granted_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата выдачи')),
+                ('course', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lms.course', verbose_name='Курс')),
+                ('lesson', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lms.lesson', verbose_name='Урок')),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='users.payment', verbose_name='Платеж')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entitlements', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Доступ',
+                'verbose_name_plural': 'Доступы',
+                'constraints': [models.CheckConstraint(condition=models.Q(('course__isnull', True), ('lesson__isnull', True), _connector='XOR'), name='entitlement_course_xor_lesson'), models.UniqueConstraint(condition=models.Q(('course__isnull', False)), fields=('user', 'course'), name='entitlement_user_course_uniq'), models.UniqueConstraint(condition=models.Q(('lesson__isnull', False)), fields=('user', 'lesson'), name='entitlement_user_lesson_uniq')],
+            },
+        ),
+        migrations.RunPython(grant_paid_entitlements, migrations.RunPython.noop),
+    ]
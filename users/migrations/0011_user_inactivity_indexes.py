@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:59
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индексы создаются без блокировки записи в таблицу (CREATE INDEX CONCURRENTLY), вне транзакции
+    atomic = False
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0010_entitlement'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['last_login'], name='user_active_last_login_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True), ('last_login__isnull', True)), fields=['date_joined'], name='user_active_never_login_idx'),
+        ),
+    ]
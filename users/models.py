@@ -1,8 +1,10 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils.functional import cached_property
 
 from lms.models import Course, Lesson
 from users.managers import UserManager
+from users.roles import MODERATORS_GROUP, get_user_roles
 
 
 class User(AbstractUser):
@@ -37,10 +39,31 @@ class User(AbstractUser):
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
+        # Частичные индексы под поиск неактивных пользователей (users.tasks.deactivate_users): содержат только
+        # активных пользователей, поэтому заблокированные не увеличивают индекс
+        indexes = [
+            models.Index(fields=['last_login'],
+                         condition=models.Q(is_active=True),
+                         name='user_active_last_login_idx'),
+            models.Index(fields=['date_joined'],
+                         condition=models.Q(is_active=True, last_login__isnull=True),
+                         name='user_active_never_login_idx'),
+        ]
 
     def __str__(self):
         return f'Пользователь {self.email}'
 
+    @cached_property
+    def roles(self):
+        """Названия групп пользователя. Вычисляются один раз для экземпляра (т.е. один раз за запрос)
+        и берутся из кеша, поэтому повторные проверки роли не обращаются к БД"""
+        return get_user_roles(self.pk)
+
+    @property
+    def is_moderator(self):
+        """Проверяет, входит ли пользователь в группу 'Модераторы'"""
+        return MODERATORS_GROUP in self.roles
+
 
 class Payment(models.Model):
     """Модель платежа. Связана с моделями Course (обучающего курса), Lesson (урок), User (пользователь)
@@ -50,12 +73,25 @@ class Payment(models.Model):
         - course: поле внешнего ключа для связи с моделью Course
         - lesson: поле внешнего ключа для связи с моделью Lesson
         - amount: поле суммы платежа
-        - payment_method: поле выбора для метода оплаты (Наличные или Перевод на счет)"""
+        - payment_method: поле выбора для метода оплаты (Наличные или Перевод на счет)
+        - status: поле статуса платежа (создание сессии оплаты, ожидание оплаты, оплачен, ошибка, истек)"""
 
     PAYMENT_METHOD_CHOICES = [
         ('cash', 'Наличные'),
         ('transfer', 'Перевод на счет'),
     ]
+    STATUS_PENDING = 'pending'
+    STATUS_OPEN = 'open'
+    STATUS_PAID = 'paid'
+    STATUS_FAILED = 'failed'
+    STATUS_EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Создается сессия оплаты'),
+        (STATUS_OPEN, 'Ожидает оплаты'),
+        (STATUS_PAID, 'Оплачен'),
+        (STATUS_FAILED, 'Ошибка оплаты'),
+        (STATUS_EXPIRED, 'Сессия оплаты истекла'),
+    ]
     user = models.ForeignKey(User,
                              on_delete=models.CASCADE,
                              verbose_name='Пользователь',
@@ -82,6 +118,7 @@ class Payment(models.Model):
     session_id = models.CharField(max_length=255,
                                   blank=True,
                                   null=True,
+                                  db_index=True,
                                   verbose_name='ID сессии',
                                   help_text='Укажите id сессии')
     link = models.URLField(max_length=400,
@@ -90,10 +127,153 @@ class Payment(models.Model):
                            verbose_name='Ссылка на оплату',
                            help_text='Укажите ссылку на оплату'
                            )
+    status = models.CharField(max_length=20,
+                              choices=STATUS_CHOICES,
+                              default=STATUS_OPEN,
+                              verbose_name='Статус платежа')
 
     class Meta:
         verbose_name = 'Платеж'
         verbose_name_plural = 'Платежи'
+        # Составные индексы под фильтры PaymentViewSet с сортировкой по дате (новые сначала)
+        indexes = [
+            models.Index(fields=['-payment_date'], name='payment_date_idx'),
+            models.Index(fields=['course', '-payment_date'], name='payment_course_date_idx'),
+            models.Index(fields=['lesson', '-payment_date'], name='payment_lesson_date_idx'),
+            models.Index(fields=['payment_method', '-payment_date'], name='payment_method_date_idx'),
+            models.Index(fields=['user', '-payment_date'], name='payment_user_date_idx'),
+        ]
 
     def __str__(self):
         return f'Платеж {self.user.email} на сумму {self.amount}'
+
+
+class Entitlement(models.Model):
+    """Модель права доступа пользователя к оплаченному курсу или уроку. Создается при оплате платежа
+    (см. users.entitlements) и позволяет проверять доступ без просмотра истории платежей. Поля:
+        - user: пользователь, получивший доступ
+        - course: оплаченный курс (доступ ко всем урокам курса)
+        - lesson: оплаченный урок
+        - payment: платеж, по которому выдан доступ
+        - granted_at: дата выдачи доступа
+    Заполнено ровно одно из полей course и lesson. Доступ к объекту выдается один раз"""
+
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             verbose_name='Пользователь',
+                             related_name='entitlements')
+    course = models.ForeignKey(Course,
+                               on_delete=models.CASCADE,
+                               verbose_name='Курс',
+                               null=True,
+                               blank=True,
+                               related_name='+')
+    lesson = models.ForeignKey(Lesson,
+                               on_delete=models.CASCADE,
+                               verbose_name='Урок',
+                               null=True,
+                               blank=True,
+                               related_name='+')
+    payment = models.ForeignKey(Payment,
+                                on_delete=models.SET_NULL,
+                                verbose_name='Платеж',
+                                null=True,
+                                blank=True,
+                                related_name='+')
+    granted_at = models.DateTimeField(auto_now_add=True,
+                                      verbose_name='Дата выдачи')
+
+    class Meta:
+        verbose_name = 'Доступ'
+        verbose_name_plural = 'Доступы'
+        constraints = [
+            models.CheckConstraint(condition=models.Q(course__isnull=True) ^ models.Q(lesson__isnull=True),
+                                   name='entitlement_course_xor_lesson'),
+            models.UniqueConstraint(fields=['user', 'course'], condition=models.Q(course__isnull=False),
+                                    name='entitlement_user_course_uniq'),
+            models.UniqueConstraint(fields=['user', 'lesson'], condition=models.Q(lesson__isnull=False),
+                                    name='entitlement_user_lesson_uniq'),
+        ]
+
+    def __str__(self):
+        target = f'курсу {self.course_id}' if self.course_id else f'уроку {self.lesson_id}'
+        return f'Доступ пользователя {self.user_id} к {target}'
+
+
+class StripeEvent(models.Model):
+    """Модель события Stripe, полученного через вебхук. Хранит событие до обработки в полях:
+        - event_id: уникальный id события в Stripe (повторная доставка события не создает дубликат)
+        - event_type: тип события
+        - payload: содержимое события
+        - received_at: дата получения
+        - processed_at: дата обработки (пусто для необработанных событий)"""
+
+    event_id = models.CharField(max_length=255,
+                                unique=True,
+                                verbose_name='ID события')
+    event_type = models.CharField(max_length=100,
+                                  verbose_name='Тип события')
+    payload = models.JSONField(verbose_name='Содержимое события')
+    received_at = models.DateTimeField(auto_now_add=True,
+                                       verbose_name='Дата получения')
+    processed_at = models.DateTimeField(null=True,
+                                        blank=True,
+                                        verbose_name='Дата обработки')
+
+    class Meta:
+        verbose_name = 'Событие Stripe'
+        verbose_name_plural = 'События Stripe'
+        indexes = [
+            models.Index(fields=['received_at'],
+                         condition=models.Q(processed_at__isnull=True),
+                         name='stripe_event_unprocessed_idx'),
+        ]
+
+    def __str__(self):
+        return f'Событие Stripe {self.event_id} ({self.event_type})'
+
+
+class PaymentDailyRollup(models.Model):
+    """Модель ежедневной сводки платежей для аналитики. Строка содержит итоги за день
+    в разрезе курса, урока и способа оплаты:
+        - date: дата платежей
+        - course: оплаченный курс
+        - lesson: оплаченный урок
+        - payment_method: способ оплаты
+        - payments_count: количество платежей
+        - amount_total: сумма платежей
+        - payers_count: количество уникальных плательщиков
+    Заполняется периодической задачей rollup_payments и командой backfill_payment_rollups"""
+
+    date = models.DateField(verbose_name='Дата')
+    course = models.ForeignKey(Course,
+                               on_delete=models.SET_NULL,
+                               verbose_name='Оплаченный курс',
+                               null=True,
+                               blank=True,
+                               related_name='+')
+    lesson = models.ForeignKey(Lesson,
+                               on_delete=models.SET_NULL,
+                               verbose_name='Оплаченный урок',
+                               null=True,
+                               blank=True,
+                               related_name='+')
+    payment_method = models.CharField(max_length=20,
+                                      null=True,
+                                      blank=True,
+                                      choices=Payment.PAYMENT_METHOD_CHOICES,
+                                      verbose_name='Способ оплаты')
+    payments_count = models.PositiveIntegerField(verbose_name='Количество платежей')
+    amount_total = models.PositiveBigIntegerField(verbose_name='Сумма платежей')
+    payers_count = models.PositiveIntegerField(verbose_name='Количество плательщиков')
+
+    class Meta:
+        verbose_name = 'Сводка платежей за день'
+        verbose_name_plural = 'Сводки платежей за день'
+        indexes = [
+            models.Index(fields=['date'], name='rollup_date_idx'),
+            models.Index(fields=['course', 'date'], name='rollup_course_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'Сводка платежей за {self.date}'
@@ -1,17 +1,20 @@
 from rest_framework.permissions import BasePermission
 
+from users.entitlements import get_entitlements
+from users.roles import is_moderator
+
 
 class IsOwner(BasePermission):
     """Проверяет, является ли пользователь владельцем объекта"""
     def has_object_permission(self, request, view, obj):
-        return obj.owner == request.user
+        # Сравнение по id не загружает владельца из БД
+        return obj.owner_id == request.user.pk
 
 
 class IsModerator(BasePermission):
     """Проверяет, является ли пользователь модератором"""
     def has_permission(self, request, view):
-        return request.user.is_authenticated and \
-               request.user.groups.filter(name='Модераторы').exists()
+        return is_moderator(request.user)
 
 
 class IsOwnerOrReadOnly(BasePermission):
@@ -20,3 +23,10 @@ class IsOwnerOrReadOnly(BasePermission):
         if request.method in ['GET', 'HEAD', 'OPTIONS']:
             return True
         return obj == request.user
+
+
+class HasEntitlement(BasePermission):
+    """Проверяет, оплатил ли пользователь курс или урок (урок доступен и при оплате его курса).
+    Оплаченные курсы и уроки берутся из кеша (users.entitlements), без запросов к платежам"""
+    def has_object_permission(self, request, view, obj):
+        return request.user.is_authenticated and get_entitlements(request.user.pk).allows(obj)
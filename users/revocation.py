@@ -0,0 +1,49 @@
+import time
+
+from django.core.cache import cache
+from rest_framework_simplejwt.settings import api_settings
+
+
+REVOKED_USER_KEY = 'users:revoked:user:{user_id}'
+REVOKED_TOKEN_KEY = 'users:revoked:token:{jti}'
+
+
+def get_revocation_keys(token):
+    """Ключи кеша, по которым проверяется отзыв токена: отзыв всех токенов пользователя и отзыв самого токена"""
+
+    return [
+        REVOKED_USER_KEY.format(user_id=token.get(api_settings.USER_ID_CLAIM)),
+        REVOKED_TOKEN_KEY.format(jti=token.get(api_settings.JTI_CLAIM)),
+    ]
+
+
+def is_token_revoked(token, cached):
+    """Проверяет отзыв токена по значениям кеша cached (результат cache.get_many с ключами get_revocation_keys).
+    Токен отозван, если отозван он сам или если он выпущен раньше отзыва токенов пользователя.
+    iat и отметка отзыва хранятся с точностью до секунды: токен, выпущенный в ту же секунду, что и отзыв, действует"""
+
+    user_key, token_key = get_revocation_keys(token)
+    if token_key in cached:
+        return True
+    revoked_at = cached.get(user_key)
+    return revoked_at is not None and token.get('iat', 0) < revoked_at
+
+
+def revoke_users(user_ids):
+    """Отзывает все выпущенные токены пользователей одним запросом к кешу (set_many).
+    Отметка хранится, пока не истечет самый долгоживущий токен (refresh)"""
+
+    # Целые секунды, как у iat токена: иначе токен, выпущенный сразу после отзыва, считался бы отозванным
+    revoked_at = int(time.time())
+    timeout = int(max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME).total_seconds())
+    keys = {REVOKED_USER_KEY.format(user_id=user_id): revoked_at for user_id in user_ids}
+    if keys:
+        cache.set_many(keys, timeout)
+
+
+def revoke_token(token):
+    """Отзывает токен по jti. Отметка хранится до истечения срока действия токена"""
+
+    timeout = int(token.get('exp', 0) - time.time())
+    if timeout > 0:
+        cache.set(REVOKED_TOKEN_KEY.format(jti=token.get(api_settings.JTI_CLAIM)), True, timeout)
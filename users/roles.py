@@ -0,0 +1,33 @@
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+
+from config.settings import USER_ROLES_CACHE_TIMEOUT
+
+
+MODERATORS_GROUP = 'Модераторы'
+ROLES_CACHE_KEY = 'users:roles:{user_id}'
+
+
+def get_user_roles(user_id):
+    """Возвращает множество названий групп (ролей) пользователя.
+    Сначала ищет роли в кеше (Redis), при промахе получает их из БД и сохраняет в кеш"""
+
+    key = ROLES_CACHE_KEY.format(user_id=user_id)
+    roles = cache.get(key)
+    if roles is None:
+        roles = frozenset(Group.objects.filter(user__id=user_id).values_list('name', flat=True))
+        cache.set(key, roles, USER_ROLES_CACHE_TIMEOUT)
+    return roles
+
+
+def invalidate_user_roles(user_ids):
+    """Удаляет из кеша роли указанных пользователей"""
+
+    cache.delete_many([ROLES_CACHE_KEY.format(user_id=user_id) for user_id in user_ids])
+
+
+def is_moderator(user):
+    """Проверяет, входит ли пользователь в группу 'Модераторы'.
+    Для анонимного пользователя всегда возвращает False"""
+
+    return user.is_authenticated and user.is_moderator
@@ -1,6 +1,15 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 
 from users.models import User, Payment
+from users.revocation import get_revocation_keys, is_token_revoked
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -34,7 +43,8 @@ class UserSerializer(serializers.ModelSerializer):
 class PaymentSerializer(serializers.ModelSerializer):
     """Сериализатор для получения платежа (Payment).
     Включает основные данные платежа. Отображает все поля.
-    Для полей 'user', 'date', 'stripe_session_id', 'payment_url' устанавливает режим только для чтения"""
+    Для полей 'user', 'date', 'stripe_session_id', 'payment_url' устанавливает режим только для чтения,
+    для курса, урока и суммы - после создания платежа"""
 
     class Meta:
         model = Payment
@@ -43,20 +53,44 @@ class PaymentSerializer(serializers.ModelSerializer):
             'user',
             'date',
             'stripe_session_id',
-            'payment_url'
+            'payment_url',
+            'status'
         )
+        # Поля, которые нельзя изменить у созданного платежа: по ним выдается доступ к курсу (уроку)
+        update_read_only_fields = ('course', 'lesson', 'amount')
+
+    def get_extra_kwargs(self):
+        """Делает поля update_read_only_fields доступными только для чтения при изменении платежа"""
+
+        extra_kwargs = super().get_extra_kwargs()
+        if self.instance is not None:
+            for field in self.Meta.update_read_only_fields:
+                extra_kwargs[field] = {**extra_kwargs.get(field, {}), 'read_only': True}
+        return extra_kwargs
+
+
+class PaymentStatusSerializer(serializers.ModelSerializer):
+    """Сериализатор статуса платежа: статус создания сессии оплаты и ссылка на оплату"""
+
+    class Meta:
+        model = Payment
+        fields = ['id', 'status', 'link']
+        read_only_fields = fields
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
-    """Полный сериализатор профиля для владельца"""
+    """Полный сериализатор профиля для владельца со сводкой по оплаченным платежам.
+    Поля сводки - аннотации queryset (UserProfileViewSet.get_queryset), история платежей
+    выводится отдельным эндпоинтом с пагинацией"""
+
+    payments_count = serializers.IntegerField(read_only=True)
+    total_spent = serializers.IntegerField(read_only=True)
+    last_payment_date = serializers.DateTimeField(read_only=True)
 
     class Meta:
         model = User
-        fields = ['id', 'email', 'avatar', 'phone_number', 'city', 'date_joined', 'payments']
-        extra_kwargs = {
-            'password': {'write_only': True},
-            'payments': {'read_only': True}
-        }
+        fields = ['id', 'email', 'avatar', 'phone_number', 'city', 'date_joined',
+                  'payments_count', 'total_spent', 'last_payment_date']
 
 
 class UserProfileUpdateSerializer(serializers.ModelSerializer):
@@ -79,3 +113,59 @@ class PublicProfileSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'email', 'avatar', 'city']
         read_only_fields = fields
+
+
+class PaymentAnalyticsQuerySerializer(serializers.Serializer):
+    """Сериализатор параметров запроса отчета по платежам"""
+
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    period = serializers.ChoiceField(choices=['day', 'month'], default='day')
+    group_by = serializers.ChoiceField(choices=['course', 'lesson', 'payment_method'], required=False)
+    top = serializers.IntegerField(min_value=1, max_value=50, default=5)
+
+    def validate(self, attrs):
+        """По умолчанию отчет строится за последние 30 дней"""
+
+        attrs.setdefault('date_to', timezone.localdate())
+        attrs.setdefault('date_from', attrs['date_to'] - timedelta(days=30))
+        if attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError('Дата начала периода должна быть не позже даты окончания')
+        return attrs
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """Сериализатор обновления access-токена (настройка SIMPLE_JWT['TOKEN_REFRESH_SERIALIZER']).
+    Отозванный refresh-токен (выход из системы, блокировка или удаление пользователя, см. users.revocation)
+    отклоняется по кешу, до загрузки пользователя из БД. Токен удаленного пользователя, выпущенный в секунду
+    отзыва (см. is_token_revoked), отклоняется как токен неактивного пользователя"""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if is_token_revoked(refresh, cache.get_many(get_revocation_keys(refresh))):
+            raise AuthenticationFailed('Токен отозван', 'token_revoked')
+        try:
+            return super().validate(attrs)
+        except User.DoesNotExist:
+            # simplejwt 5.5 не обрабатывает отсутствие пользователя и пропускает исключение (ответ 500)
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    """Сериализатор параметров отзыва токенов:
+        - refresh: refresh-токен текущего пользователя, который нужно отозвать
+        - all: отозвать все выпущенные токены пользователя (выход на всех устройствах)"""
+
+    refresh = serializers.CharField(required=False)
+    all = serializers.BooleanField(default=False)
+
+    def validate_refresh(self, value):
+        """Проверяет refresh-токен и его принадлежность текущему пользователю"""
+        try:
+            token = RefreshToken(value)
+        except TokenError:
+            raise serializers.ValidationError('Некорректный refresh-токен')
+        # simplejwt хранит id пользователя в токене строкой
+        if str(token.get(api_settings.USER_ID_CLAIM)) != str(self.context['request'].user.pk):
+            raise serializers.ValidationError('Токен принадлежит другому пользователю')
+        return token
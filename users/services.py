@@ -1,14 +1,81 @@
+import time
+import uuid
+from types import SimpleNamespace
+
 import stripe
-from config.settings import STRIPE_API_KEY
+from config.settings import STRIPE_API_KEY, STRIPE_MAX_NETWORK_RETRIES, STRIPE_TIMEOUT, STRIPE_USE_STUB
 
 
 stripe.api_key = STRIPE_API_KEY
+stripe.max_network_retries = STRIPE_MAX_NETWORK_RETRIES
+stripe.default_http_client = stripe.RequestsClient(timeout=STRIPE_TIMEOUT)
+
+
+class StripeAPIClient:
+    """Клиент Stripe API. Таймаут и количество повторов запросов задаются настройками
+    STRIPE_TIMEOUT и STRIPE_MAX_NETWORK_RETRIES"""
+
+    def create_product(self, name, description):
+        return stripe.Product.create(name=name, description=description)
+
+    def modify_product(self, product_id, name, description):
+        return stripe.Product.modify(product_id, name=name, description=description)
+
+    def create_price(self, unit_amount, product_id):
+        return stripe.Price.create(currency="rub", unit_amount=unit_amount, product=product_id)
+
+    def create_session(self, price_id):
+        return stripe.checkout.Session.create(
+            success_url="http://127.0.0.1:8000/",
+            cancel_url="http://127.0.0.1:8000/",
+            line_items=[{
+                "price": price_id,
+                "quantity": 1,
+            }],
+            mode="payment",
+        )
+
+
+class StripeStubClient:
+    """Локальная заглушка Stripe для тестов и бенчмарков. Не обращается к сети, возвращает объекты
+    с уникальными id и может имитировать сетевую задержку каждого вызова (latency, в секундах).
+    Выполненные вызовы сохраняются в списке calls"""
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.calls = []
+
+    def _call(self, method, **fields):
+        self.calls.append(method)
+        if self.latency:
+            time.sleep(self.latency)
+        return SimpleNamespace(**fields)
+
+    @staticmethod
+    def _new_id(prefix):
+        return f'{prefix}_{uuid.uuid4().hex}'
+
+    def create_product(self, name, description):
+        return self._call('create_product', id=self._new_id('prod'), name=name, description=description)
+
+    def modify_product(self, product_id, name, description):
+        return self._call('modify_product', id=product_id, name=name, description=description)
+
+    def create_price(self, unit_amount, product_id):
+        return self._call('create_price', id=self._new_id('price'), unit_amount=unit_amount, product=product_id)
+
+    def create_session(self, price_id):
+        session_id = self._new_id('cs')
+        return self._call('create_session', id=session_id, url=f'https://checkout.stripe.com/c/pay/{session_id}')
+
+
+stripe_client = StripeStubClient() if STRIPE_USE_STUB else StripeAPIClient()
 
 
 def create_stripe_product(product_data):
     """Создает продукт в Stripe по полям 'name' и 'description'"""
 
-    return stripe.Product.create(
+    return stripe_client.create_product(
         name=product_data["name"],
         description=product_data.get("description", "")
     )
@@ -17,23 +84,40 @@ def create_stripe_product(product_data):
 def create_stripe_price(amount, product):
     """Создает цену в Stripe в рублях (в копейках) по полю id созданного продукта"""
 
-    return stripe.Price.create(
-        currency="rub",
-        unit_amount=int(amount * 100),
-        product=product.id,
-    )
+    return stripe_client.create_price(int(amount * 100), product.id)
 
 
-def create_stripe_sessions(price):
-    """Создает сессию оплаты в Stripe. Возвращает кортеж с id сессии и ссылкой на оплату"""
+def create_stripe_sessions(price_id):
+    """Создает сессию оплаты в Stripe по id цены. Возвращает кортеж с id сессии и ссылкой на оплату"""
 
-    session = stripe.checkout.Session.create(
-        success_url="http://127.0.0.1:8000/",
-        cancel_url="http://127.0.0.1:8000/",
-        line_items=[{
-            "price": price.id,
-            "quantity": 1,
-        }],
-        mode="payment",
-    )
+    session = stripe_client.create_session(price_id)
     return session.id, session.url
+
+
+def get_stripe_price_id(obj, obj_type):
+    """Возвращает id цены Stripe для курса или урока.
+    Продукт и цена создаются только при первой покупке и сохраняются в объекте; продукт обновляется
+    при изменении названия, а новая цена создается при изменении стоимости (цены в Stripe неизменяемы)"""
+
+    product_name = f"Курс: {obj.title}" if obj_type == 'course' else f"Урок: {obj.title}"
+    description = obj.description or product_name
+    changed = {}
+
+    if not obj.stripe_product_id:
+        product = create_stripe_product({"name": product_name, "description": description})
+        changed.update(stripe_product_id=product.id, stripe_product_name=product_name, stripe_price_id=None)
+    elif obj.stripe_product_name != product_name:
+        stripe_client.modify_product(obj.stripe_product_id, name=product_name, description=description)
+        changed.update(stripe_product_name=product_name)
+    for field, value in changed.items():
+        setattr(obj, field, value)
+
+    if not obj.stripe_price_id or obj.stripe_price_amount != obj.price:
+        price = create_stripe_price(obj.price, SimpleNamespace(id=obj.stripe_product_id))
+        obj.stripe_price_id = changed['stripe_price_id'] = price.id
+        obj.stripe_price_amount = changed['stripe_price_amount'] = obj.price
+
+    if changed:
+        # Обновление без save(): служебные поля Stripe не должны сбрасывать кеш курсов и уроков
+        type(obj).objects.filter(pk=obj.pk).update(**changed)
+    return obj.stripe_price_id
@@ -0,0 +1,75 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.authentication import invalidate_cached_users
+from users.entitlements import grant_entitlements
+from users.models import Payment, User
+from users.revocation import revoke_users
+from users.roles import invalidate_user_roles
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Удаляет пользователя из кеша аутентификации при изменении или удалении"""
+
+    invalidate_cached_users([instance.pk])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def revoke_user_tokens(sender, instance, signal, **kwargs):
+    """Отзывает выпущенные токены удаленного или заблокированного пользователя"""
+
+    if signal is post_delete or not instance.is_active:
+        revoke_users([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles_on_groups_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сбрасывает кеш ролей при изменении состава групп пользователя.
+    Изменение может прийти как со стороны пользователя (user.groups.add), так и со стороны группы
+    (group.user_set.add) - во втором случае instance является группой, а pk_set содержит id пользователей"""
+
+    if reverse:
+        if action == 'pre_clear':
+            # После очистки состав группы уже неизвестен, поэтому собираем пользователей заранее
+            invalidate_user_roles(instance.user_set.values_list('pk', flat=True))
+        elif action in ('post_add', 'post_remove'):
+            invalidate_user_roles(pk_set)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        instance.__dict__.pop('roles', None)
+        invalidate_user_roles([instance.pk])
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_roles_on_group_change(sender, instance, **kwargs):
+    """Сбрасывает кеш ролей всех участников группы при ее переименовании или удалении"""
+
+    invalidate_user_roles(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_init, sender=Payment)
+def remember_payment_status(sender, instance, **kwargs):
+    """Запоминает статус загруженного платежа, чтобы выдавать доступ только при переходе в статус 'paid'.
+    Значение берется из __dict__: при отложенном поле status обращение к атрибуту выполнило бы запрос"""
+
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Payment)
+def grant_payment_entitlement(sender, instance, created, raw=False, **kwargs):
+    """Выдает доступ к курсу (уроку) при создании оплаченного платежа или переходе платежа в статус 'paid'.
+    Повторное сохранение уже оплаченного платежа доступ не выдает: иначе изменение курса (урока)
+    оплаченного платежа открывало бы доступ к другому курсу.
+    Статусы платежей по событиям Stripe обновляются пакетно без сигналов (users.tasks.process_stripe_events),
+    доступы по ним выдаются там же"""
+
+    previous = instance._loaded_status
+    instance._loaded_status = instance.__dict__.get('status')
+    if raw or instance.status != Payment.STATUS_PAID:
+        return
+    if created or previous not in (None, Payment.STATUS_PAID):
+        grant_entitlements([instance])
@@ -1,21 +1,187 @@
+import logging
+import time
+
+import stripe
 from celery import shared_task
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 from datetime import timedelta
 
+from config.settings import (DEACTIVATE_USERS_BATCH_SIZE, DEACTIVATE_USERS_INACTIVE_DAYS, DEACTIVATE_USERS_PAUSE,
+                             STRIPE_EVENTS_BATCH_SIZE)
+from users.analytics import rebuild_payment_rollups, rebuild_payment_rollups_for
+from users.authentication import invalidate_cached_users
+from users.entitlements import grant_entitlements
+from users.models import Payment, StripeEvent
+from users.revocation import revoke_users
+from users.services import create_stripe_sessions, get_stripe_price_id
+
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
+# Прогресс блокировки неактивных пользователей (для продолжения после падения воркера)
+DEACTIVATION_CHECKPOINT_KEY = 'users:deactivate_users:checkpoint'
+DEACTIVATION_CHECKPOINT_TIMEOUT = 60 * 60 * 24
+
+# Статус платежа, который устанавливает событие Stripe о сессии оплаты
+STRIPE_EVENT_STATUSES = {
+    'checkout.session.completed': Payment.STATUS_PAID,
+    'checkout.session.async_payment_succeeded': Payment.STATUS_PAID,
+    'checkout.session.async_payment_failed': Payment.STATUS_FAILED,
+    'checkout.session.expired': Payment.STATUS_EXPIRED,
+}
 
-@shared_task
-def deactivate_users():
-    """Блокировка пользователей, не заходивших более месяца"""
 
-    month_ago = timezone.now() - timedelta(days=30)
-    inactive_users = User.objects.filter(
-        last_login__lt=month_ago,
-        is_active=True
+def get_inactive_users(cutoff):
+    """Активные пользователи, не заходившие с даты cutoff. Пользователи, которые ни разу не входили,
+    считаются неактивными, если зарегистрировались до cutoff"""
+
+    return User.objects.filter(is_active=True).filter(
+        Q(last_login__lt=cutoff) | Q(last_login__isnull=True, date_joined__lt=cutoff)
     )
 
-    count = inactive_users.update(is_active=False)
-    return f'Заблокировано {count} неактивных пользователей'
+
+def get_deactivation_progress():
+    """Состояние выполняющейся (или прерванной) блокировки неактивных пользователей: дата, с которой пользователи
+    считаются неактивными ('cutoff'), id последнего обработанного пользователя ('last_pk') и количество
+    заблокированных ('deactivated'). None, если блокировка не выполняется"""
+
+    return cache.get(DEACTIVATION_CHECKPOINT_KEY)
+
+
+@shared_task
+def deactivate_users(batch_size=DEACTIVATE_USERS_BATCH_SIZE, pause=DEACTIVATE_USERS_PAUSE):
+    """Блокировка пользователей, не заходивших более DEACTIVATE_USERS_INACTIVE_DAYS дней.
+    Пользователи обрабатываются пачками по batch_size в порядке id: каждая пачка блокируется отдельным коротким
+    запросом UPDATE (строки не блокируются надолго), между пачками выдерживается пауза pause секунд.
+    После каждой пачки прогресс сохраняется в кеш, поэтому после падения воркера задача продолжает работу
+    с места остановки с той же датой неактивности"""
+
+    checkpoint = cache.get(DEACTIVATION_CHECKPOINT_KEY)
+    if checkpoint is None:
+        cutoff = timezone.now() - timedelta(days=DEACTIVATE_USERS_INACTIVE_DAYS)
+        checkpoint = {'cutoff': cutoff, 'last_pk': 0, 'deactivated': 0}
+    inactive_users = get_inactive_users(checkpoint['cutoff'])
+
+    while True:
+        batch = inactive_users.filter(pk__gt=checkpoint['last_pk']).order_by('pk')
+        user_ids = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not user_ids:
+            break
+        # Условие неактивности проверяется повторно: пользователь мог войти после выборки пачки
+        checkpoint['deactivated'] += inactive_users.filter(pk__in=user_ids).update(is_active=False)
+        # update() не отправляет сигналы, поэтому пользователи пачки удаляются из кеша аутентификации,
+        # а их токены отзываются явно (одним запросом к кешу на пачку)
+        invalidate_cached_users(user_ids)
+        revoke_users(user_ids)
+        checkpoint['last_pk'] = user_ids[-1]
+        cache.set(DEACTIVATION_CHECKPOINT_KEY, checkpoint, DEACTIVATION_CHECKPOINT_TIMEOUT)
+        logger.info('Блокировка неактивных пользователей: обработаны id до %s, заблокировано %s',
+                    checkpoint['last_pk'], checkpoint['deactivated'])
+        if len(user_ids) < batch_size:
+            break
+        time.sleep(pause)
+
+    cache.delete(DEACTIVATION_CHECKPOINT_KEY)
+    return f"Заблокировано {checkpoint['deactivated']} неактивных пользователей"
+
+
+@shared_task
+def rollup_payments():
+    """Обновляет ежедневные сводки платежей за вчера и сегодня.
+    Вчерашний день пересчитывается, чтобы учесть платежи, записанные около полуночи"""
+
+    today = timezone.localdate()
+    count = rebuild_payment_rollups(today - timedelta(days=1), today)
+    return f'Обновлено {count} строк сводки платежей'
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=10)
+def create_checkout_session(self, payment_id):
+    """Создает сессию оплаты Stripe для платежа в статусе 'pending' и сохраняет в платеж ее id и ссылку.
+    При ошибке Stripe задача повторяется, после исчерпания повторов платеж получает статус 'failed'.
+    Платеж, курс (урок) которого удален до создания сессии, тоже получает статус 'failed'"""
+
+    payment = Payment.objects.select_related('course', 'lesson').filter(pk=payment_id).first()
+    if payment is None:
+        return f'Платеж {payment_id} не найден'
+    if payment.status != Payment.STATUS_PENDING:
+        return f'Платеж {payment_id} уже обработан'
+
+    obj, obj_type = (payment.course, 'course') if payment.course_id else (payment.lesson, 'lesson')
+    if obj is None:
+        Payment.objects.filter(pk=payment_id).update(status=Payment.STATUS_FAILED)
+        return f'Оплачиваемый курс (урок) платежа {payment_id} удален'
+    try:
+        session_id, payment_url = create_stripe_sessions(get_stripe_price_id(obj, obj_type))
+    except stripe.StripeError as exc:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=exc)
+        Payment.objects.filter(pk=payment_id).update(status=Payment.STATUS_FAILED)
+        return f'Не удалось создать сессию оплаты для платежа {payment_id}'
+
+    Payment.objects.filter(pk=payment_id).update(session_id=session_id, link=payment_url, status=Payment.STATUS_OPEN)
+    return f'Создана сессия оплаты для платежа {payment_id}'
+
+
+def get_session_statuses(events):
+    """Возвращает словарь {id сессии оплаты: новый статус платежа} по списку событий Stripe.
+    Для одной сессии побеждает последнее событие; завершенная сессия с отложенной оплатой
+    (payment_status != 'paid') статус не меняет - его установит событие async_payment_*"""
+
+    statuses = {}
+    for event in events:
+        status = STRIPE_EVENT_STATUSES.get(event.event_type)
+        session = event.payload.get('data', {}).get('object', {})
+        if status is None or not session.get('id'):
+            continue
+        if event.event_type == 'checkout.session.completed' and session.get('payment_status') != 'paid':
+            continue
+        statuses[session['id']] = status
+    return statuses
+
+
+@shared_task
+def process_stripe_events():
+    """Обрабатывает полученные вебхуком события Stripe пачками по STRIPE_EVENTS_BATCH_SIZE.
+    Дубликаты событий отсекаются уникальным event_id при сохранении, а статусы платежей пачки
+    обновляются одним bulk_update по индексированному полю session_id. Доступы по платежам, перешедшим
+    в статус 'paid', выдаются одним запросом, а сводки платежей пересчитываются за дни платежей,
+    статус которых перешел в 'paid' или из него"""
+
+    processed = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                StripeEvent.objects.select_for_update(skip_locked=True).filter(
+                    processed_at__isnull=True,
+                ).order_by('received_at', 'id')[:STRIPE_EVENTS_BATCH_SIZE]
+            )
+            if not events:
+                break
+
+            statuses = get_session_statuses(events)
+            payments = list(Payment.objects.filter(session_id__in=statuses).only(
+                'id', 'session_id', 'status', 'user_id', 'course_id', 'lesson_id', 'payment_date',
+            ))
+            paid, revenue_changed = [], []
+            for payment in payments:
+                new_status = statuses[payment.session_id]
+                if payment.status != new_status and Payment.STATUS_PAID in (payment.status, new_status):
+                    revenue_changed.append(payment)
+                    if new_status == Payment.STATUS_PAID:
+                        paid.append(payment)
+                payment.status = new_status
+            Payment.objects.bulk_update(payments, ['status'])
+            grant_entitlements(paid)
+            rebuild_payment_rollups_for(revenue_changed)
+            StripeEvent.objects.filter(pk__in=[event.pk for event in events]).update(processed_at=timezone.now())
+
+        processed += len(events)
+        if len(events) < STRIPE_EVENTS_BATCH_SIZE:
+            break
+    return f'Обработано {processed} событий Stripe'
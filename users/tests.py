@@ -1,3 +1,925 @@
-# from django.test import TestCase
+import hashlib
+import hmac
+import io
+import json
+import time
+from datetime import date, datetime, timedelta
+from importlib import import_module
+from pathlib import Path
+from unittest.mock import patch
 
-# Create your tests here.
+import stripe
+from django.apps import apps as django_apps
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from lms.models import Course, Lesson, Subscription
+from users.analytics import rebuild_payment_rollups
+from users.authentication import get_cached_user
+from users.entitlements import get_entitlements
+from users.models import Entitlement, Payment, PaymentDailyRollup, StripeEvent, User
+from users.services import StripeStubClient
+from users.tasks import create_checkout_session, deactivate_users, get_deactivation_progress, process_stripe_events
+from users.roles import MODERATORS_GROUP
+
+
+class DeactivateUsersTestCase(APITestCase):
+    """Тестирование пакетной блокировки неактивных пользователей"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        cache.clear()
+        now = timezone.now()
+        old, recent = now - timedelta(days=40), now - timedelta(days=1)
+        self.inactive = [
+            User.objects.create_user(email=f'inactive{number}@sky.pro', password='testpass', last_login=old)
+            for number in range(3)
+        ]
+        self.never_logged_in = User.objects.create_user(email='never@sky.pro', password='testpass', date_joined=old)
+        self.active = [
+            User.objects.create_user(email='active@sky.pro', password='testpass', last_login=recent),
+            User.objects.create_user(email='new@sky.pro', password='testpass', date_joined=recent),
+            User.objects.create_user(email='blocked@sky.pro', password='testpass', last_login=old, is_active=False),
+        ]
+
+    def get_active_emails(self):
+        return set(User.objects.filter(is_active=True).values_list('email', flat=True))
+
+    def test_deactivate_in_batches(self):
+        """Тест блокировки пачками: количество запросов зависит от количества пачек, а не пользователей"""
+
+        # Две пачки (выборка id и UPDATE) и пустая выборка, завершающая обход
+        with self.assertNumQueries(5):
+            result = deactivate_users(batch_size=2, pause=0)
+        self.assertEqual(result, 'Заблокировано 4 неактивных пользователей')
+        self.assertEqual(self.get_active_emails(), {'active@sky.pro', 'new@sky.pro'})
+        self.assertIsNone(get_deactivation_progress())
+
+    def test_resume_after_crash(self):
+        """Тест продолжения блокировки с сохраненного места и с сохраненной датой неактивности"""
+
+        checkpoint = {'cutoff': timezone.now() - timedelta(days=30), 'last_pk': self.inactive[1].pk, 'deactivated': 2}
+        cache.set('users:deactivate_users:checkpoint', checkpoint)
+
+        self.assertEqual(deactivate_users(pause=0), 'Заблокировано 4 неактивных пользователей')
+        # Пользователи до сохраненного id уже обработаны прерванным запуском
+        self.assertEqual(self.get_active_emails(), {'inactive0@sky.pro', 'inactive1@sky.pro', 'active@sky.pro',
+                                                    'new@sky.pro'})
+
+    def test_progress_saved_between_batches(self):
+        """Тест сохранения прогресса после каждой пачки"""
+
+        progress = []
+        with patch('users.tasks.time.sleep', side_effect=lambda pause: progress.append(get_deactivation_progress())):
+            deactivate_users(batch_size=1, pause=1)
+        self.assertEqual([item['deactivated'] for item in progress], [1, 2, 3, 4])
+        self.assertEqual(progress[0]['last_pk'], self.inactive[0].pk)
+
+
+class CachedJWTAuthenticationTestCase(APITestCase):
+    """Тестирование аутентификации по JWT с пользователем из кеша"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        cache.clear()
+        self.user = User.objects.create_user(email='jwt@sky.pro', password='testpass',
+                                             last_login=timezone.now() - timedelta(days=40))
+        self.course = Course.objects.create(title='Тестовый курс', owner=self.user)
+        self.lesson = Lesson.objects.create(title='Тестовый урок', course=self.course, owner=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.url = reverse('lms:lessons_retrieve', args=(self.lesson.pk,))
+
+    def test_authenticated_get_without_queries(self):
+        """Тест повторного запроса без SQL-запросов: пользователь и роли из кеша, ответ из кеша ответов"""
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_cached_user_fields(self):
+        """Тест пользователя из кеша: основные поля без запросов, остальные загружаются при обращении"""
+
+        self.assertIsNotNone(get_cached_user(self.user.pk))
+        with self.assertNumQueries(0):
+            user = get_cached_user(self.user.pk)
+            self.assertEqual((user.pk, user.email, user.is_active), (self.user.pk, 'jwt@sky.pro', True))
+        with self.assertNumQueries(1):
+            self.assertIsNotNone(user.last_login)
+        self.assertIsNone(get_cached_user(10 ** 6))
+
+    def test_cache_invalidated_on_user_save(self):
+        """Тест сброса кеша при изменении пользователя"""
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cache_invalidated_on_deactivation(self):
+        """Тест сброса кеша при пакетной блокировке неактивных пользователей"""
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        deactivate_users(pause=0)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_benchmark_auth_command(self):
+        """Тест команды сравнения аутентификации с загрузкой пользователя из БД и из кеша"""
+
+        out = io.StringIO()
+        call_command('benchmark_auth', iterations=5, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertIn('SQL-запросов на запрос: 1', lines[0])
+        self.assertIn('SQL-запросов на запрос: 0', lines[1])
+
+
+class TokenRevocationTestCase(APITestCase):
+    """Тестирование отзыва токенов"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        cache.clear()
+        # Отзыв происходит через секунду после выпуска токенов: токены, выпущенные в секунду отзыва, действуют
+        revocation_time = patch('users.revocation.time.time', side_effect=lambda now=time.time: now() + 1)
+        revocation_time.start()
+        self.addCleanup(revocation_time.stop)
+        self.user = User.objects.create_user(email='revoke@sky.pro', password='testpass',
+                                             last_login=timezone.now() - timedelta(days=40))
+        self.refresh = RefreshToken.for_user(self.user)
+        self.url = reverse('users:payments-list')
+
+    def get_with_token(self, token):
+        return self.client.get(self.url, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def refresh_access(self, refresh):
+        return self.client.post(reverse('users:token_refresh'), {'refresh': str(refresh)})
+
+    def test_deactivation_revokes_tokens(self):
+        """Тест отзыва токенов пакетной блокировкой: кеш пользователя прогрет, но токены отклоняются сразу"""
+
+        access = self.refresh.access_token
+        self.assertEqual(self.get_with_token(access).status_code, status.HTTP_200_OK)
+        with patch('users.tasks.invalidate_cached_users'):
+            deactivate_users(pause=0)
+        self.assertEqual(self.get_with_token(access).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.refresh_access(self.refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user_refresh_rejected(self):
+        """Тест отклонения refresh-токена удаленного пользователя"""
+
+        self.user.delete()
+        self.assertEqual(self.refresh_access(self.refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user_refresh_issued_in_revocation_second(self):
+        """Тест refresh-токена удаленного пользователя, выпущенного в секунду отзыва: 401 вместо ошибки сервера"""
+
+        user_id = self.user.pk
+        self.user.delete()
+        cache.set(f'users:revoked:user:{user_id}', self.refresh['iat'])
+        self.assertEqual(self.refresh_access(self.refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_tokens_issued_after_revocation(self):
+        """Тест токенов, выпущенных после отзыва: они действуют"""
+
+        cache.set(f'users:revoked:user:{self.user.pk}', int(time.time()) - 10)
+        access = self.refresh.access_token
+        self.get_with_token(access)
+        with self.assertNumQueries(1):
+            # Пользователь и отзыв проверяются по кешу одним обращением: к БД - только запрос платежей
+            self.assertEqual(self.get_with_token(access).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.refresh_access(self.refresh).status_code, status.HTTP_200_OK)
+
+    def test_tokens_issued_in_revocation_second(self):
+        """Тест границы отзыва: токен, выпущенный в секунду отзыва, действует, выпущенный раньше - отклоняется"""
+
+        access = self.refresh.access_token
+        cache.set(f'users:revoked:user:{self.user.pk}', access['iat'])
+        self.assertEqual(self.get_with_token(access).status_code, status.HTTP_200_OK)
+        cache.set(f'users:revoked:user:{self.user.pk}', access['iat'] + 1)
+        self.assertEqual(self.get_with_token(access).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_endpoint(self):
+        """Тест выхода из системы: текущий access-токен и переданный refresh-токен отзываются"""
+
+        access = self.refresh.access_token
+        other_refresh = RefreshToken.for_user(self.user)
+        response = self.client.post(reverse('users:token_revoke'), {'refresh': str(self.refresh)},
+                                    HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.get_with_token(access).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.refresh_access(self.refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+        # Другие сессии пользователя продолжают действовать
+        self.assertEqual(self.get_with_token(other_refresh.access_token).status_code, status.HTTP_200_OK)
+
+    def test_revoke_all(self):
+        """Тест выхода на всех устройствах: отзываются все токены пользователя"""
+
+        other_refresh = RefreshToken.for_user(self.user)
+        response = self.client.post(reverse('users:token_revoke'), {'all': True},
+                                    HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.get_with_token(other_refresh.access_token).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.refresh_access(other_refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_foreign_refresh(self):
+        """Тест запрета отзыва refresh-токена другого пользователя"""
+
+        other = User.objects.create_user(email='other@sky.pro', password='testpass')
+        response = self.client.post(reverse('users:token_revoke'), {'refresh': str(RefreshToken.for_user(other))},
+                                    HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class UserRolesTestCase(APITestCase):
+    """Тестирование кеширования ролей пользователя"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        cache.clear()
+        self.moderators = Group.objects.create(name=MODERATORS_GROUP)
+        self.user = User.objects.create_user(email='moderator@sky.pro', password='testpass')
+        self.owner = User.objects.create_user(email='owner@sky.pro', password='testpass')
+        self.course = Course.objects.create(title='Тестовый курс', owner=self.owner)
+        self.lesson = Lesson.objects.create(title='Тестовый урок', course=self.course, owner=self.owner)
+
+    def test_roles_cached_between_instances(self):
+        """Тест получения ролей из кеша без обращения к БД"""
+
+        self.user.groups.add(self.moderators)
+        self.assertTrue(self.user.is_moderator)
+
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.is_moderator)
+
+    def test_roles_invalidated_on_user_groups_change(self):
+        """Тест сброса кеша ролей при изменении групп со стороны пользователя"""
+
+        self.assertFalse(self.user.is_moderator)
+        self.user.groups.add(self.moderators)
+        self.assertTrue(self.user.is_moderator)
+        self.user.groups.clear()
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_moderator)
+
+    def test_roles_invalidated_on_group_members_change(self):
+        """Тест сброса кеша ролей при изменении участников со стороны группы"""
+
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_moderator)
+        self.moderators.user_set.add(self.user)
+        self.assertTrue(User.objects.get(pk=self.user.pk).is_moderator)
+        self.moderators.user_set.clear()
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_moderator)
+
+    def test_roles_invalidated_on_group_delete(self):
+        """Тест сброса кеша ролей при удалении группы"""
+
+        self.user.groups.add(self.moderators)
+        self.assertTrue(User.objects.get(pk=self.user.pk).is_moderator)
+        self.moderators.delete()
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_moderator)
+
+    def test_moderator_check_once_per_request(self):
+        """Тест однократной проверки роли модератора за запрос (права доступа и queryset)"""
+
+        self.user.groups.add(self.moderators)
+        # Прогреваем кеш ролей
+        self.assertTrue(User.objects.get(pk=self.user.pk).is_moderator)
+
+        self.client.force_authenticate(user=User.objects.get(pk=self.user.pk))
+        url = reverse('lms:lessons_retrieve', args=(self.lesson.pk,))
+        # Только загрузка урока: роли берутся из кеша
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class UserProfileTestCase(APITestCase):
+    """Тестирование профиля пользователя"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        self.user = User.objects.create_user(email='profile@sky.pro', password='testpass', phone_number='+79990000000')
+        self.other = User.objects.create_user(email='other@sky.pro', password='testpass')
+        self.course = Course.objects.create(title='Тестовый курс', owner=self.other)
+        for amount in (100, 200, 300, 400, 500):
+            Payment.objects.create(user=self.user, course=self.course, amount=amount, status=Payment.STATUS_PAID)
+        self.pending = Payment.objects.create(user=self.user, course=self.course, amount=1000)
+        self.client.force_authenticate(user=self.user)
+
+    def test_owner_profile_summary(self):
+        """Тест профиля владельца: полный сериализатор и сводка по оплаченным платежам одним запросом"""
+
+        with self.assertNumQueries(1):
+            data = self.client.get(reverse('users:user-profile-detail', args=[self.user.pk])).json()
+        self.assertEqual(data['phone_number'], '+79990000000')
+        self.assertEqual(data['payments_count'], 5)
+        self.assertEqual(data['total_spent'], 1500)
+        self.assertIsNotNone(data['last_payment_date'])
+        self.assertNotIn('payments', data)
+
+    def test_public_profile(self):
+        """Тест чужого профиля: только публичные поля, загружаются только они"""
+
+        with self.assertNumQueries(1) as queries:
+            data = self.client.get(reverse('users:user-profile-detail', args=[self.other.pk])).json()
+        self.assertEqual(set(data), {'id', 'email', 'avatar', 'city'})
+        self.assertNotIn('password', queries.captured_queries[0]['sql'])
+
+    def test_profile_list(self):
+        """Тест списка профилей: по умолчанию массив публичных полей, курсорная пагинация - по параметру"""
+
+        url = reverse('users:user-profile-list')
+        with self.assertNumQueries(1):
+            data = self.client.get(url).json()
+        self.assertEqual([profile['id'] for profile in data], [self.user.pk, self.other.pk])
+        self.assertNotIn('phone_number', data[0])
+
+        with self.assertNumQueries(1):
+            data = self.client.get(url, {'pagination': 'cursor'}).json()
+        self.assertNotIn('count', data)
+        self.assertEqual([profile['id'] for profile in data['results']], [self.user.pk, self.other.pk])
+
+    def test_payment_history(self):
+        """Тест истории платежей владельца: курсорная пагинация, новые сначала"""
+
+        url = reverse('users:user-profile-payments', args=[self.user.pk])
+        with self.assertNumQueries(1):
+            data = self.client.get(url).json()
+        self.assertEqual(data['results'][0]['id'], self.pending.pk)
+        self.assertEqual(len(data['results']), 4)
+        data = self.client.get(data['next']).json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertIsNone(data['next'])
+
+    def test_payment_history_forbidden(self):
+        """Тест запрета просмотра чужой истории платежей"""
+
+        response = self.client.get(reverse('users:user-profile-payments', args=[self.other.pk]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PaymentListTestCase(APITestCase):
+    """Тестирование списка платежей"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        self.user = User.objects.create_user(email='payer@sky.pro', password='testpass')
+        self.course = Course.objects.create(title='Тестовый курс', owner=self.user)
+        self.payments = [
+            Payment.objects.create(user=self.user, course=self.course, amount=number, payment_method='cash')
+            for number in range(6)
+        ]
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('users:payments-list')
+
+    def test_payment_list_cursor_pagination(self):
+        """Тест курсорной пагинации списка платежей, выбранной параметром запроса (новые сначала)"""
+
+        data = self.client.get(self.url, {'pagination': 'cursor'}).json()
+        self.assertNotIn('count', data)
+        self.assertEqual(len(data['results']), 4)
+        data = self.client.get(data['next']).json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertIsNone(data['next'])
+
+    def test_payment_list_page_pagination(self):
+        """Тест постраничной пагинации списка платежей, выбранной параметром запроса"""
+
+        data = self.client.get(self.url, {'pagination': 'page', 'course': self.course.pk}).json()
+        self.assertEqual(data['count'], 6)
+
+    def test_payment_list_unpaginated(self):
+        """Тест прежнего формата списка платежей (массив без пагинации) по умолчанию для обратной совместимости"""
+
+        expected = [payment.id for payment in reversed(self.payments)]
+        for params in ({}, {'pagination': 'none'}):
+            data = self.client.get(self.url, params).json()
+            self.assertEqual([payment['id'] for payment in data], expected)
+
+
+class PaymentIndexTestCase(APITestCase):
+    """Тестирование планов запросов списка платежей: фильтры с сортировкой по дате должны использовать индексы"""
+
+    def setUp(self):
+        """Настройка тестовых данных и параметров планировщика перед каждым тестом"""
+
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            self.skipTest('Проверка планов запросов поддерживается только для PostgreSQL и SQLite')
+        if connection.vendor == 'postgresql':
+            # На маленьких тестовых таблицах планировщик предпочитает полный просмотр и сортировку,
+            # поэтому запрещаем их, чтобы проверить, что подходящий индекс вообще существует
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_bitmapscan = off')
+                cursor.execute('SET LOCAL enable_sort = off')
+
+        self.user = User.objects.create_user(email='payer@sky.pro', password='testpass')
+        self.course = Course.objects.create(title='Тестовый курс', owner=self.user)
+        self.lesson = Lesson.objects.create(title='Тестовый урок', course=self.course, owner=self.user)
+        Payment.objects.create(user=self.user, course=self.course, amount=100, payment_method='cash')
+        Payment.objects.create(user=self.user, lesson=self.lesson, amount=10, payment_method='transfer')
+
+    def assertUsesIndex(self, queryset, index_name):
+        """Проверяет, что план запроса (первой страницы) использует указанный индекс"""
+
+        plan = queryset.order_by('-payment_date')[:10].explain()
+        self.assertIn(index_name, plan)
+
+    def test_payment_list_uses_date_index(self):
+        """Тест использования индекса по дате для списка без фильтров"""
+
+        self.assertUsesIndex(Payment.objects.all(), 'payment_date_idx')
+
+    def test_course_filter_uses_index(self):
+        """Тест использования индекса для фильтра по курсу"""
+
+        self.assertUsesIndex(Payment.objects.filter(course=self.course), 'payment_course_date_idx')
+
+    def test_lesson_filter_uses_index(self):
+        """Тест использования индекса для фильтра по уроку"""
+
+        self.assertUsesIndex(Payment.objects.filter(lesson=self.lesson), 'payment_lesson_date_idx')
+
+    def test_payment_method_filter_uses_index(self):
+        """Тест использования индекса для фильтра по способу оплаты"""
+
+        self.assertUsesIndex(Payment.objects.filter(payment_method='cash'), 'payment_method_date_idx')
+
+    def test_user_filter_uses_index(self):
+        """Тест использования индекса для платежей пользователя"""
+
+        self.assertUsesIndex(Payment.objects.filter(user=self.user), 'payment_user_date_idx')
+
+
+class PaymentAnalyticsTestCase(APITestCase):
+    """Тестирование ежедневных сводок и отчета по платежам"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        self.admin = User.objects.create_user(email='admin@sky.pro', password='testpass', is_staff=True)
+        self.user = User.objects.create_user(email='payer@sky.pro', password='testpass')
+        self.course = Course.objects.create(title='Курс', owner=self.admin)
+        self.other_course = Course.objects.create(title='Другой курс', owner=self.admin)
+        self.lesson = Lesson.objects.create(title='Урок', course=self.course, owner=self.admin)
+        self.create_payment(self.user, 100, 'cash', datetime(2025, 1, 10, 12), course=self.course)
+        self.create_payment(self.admin, 200, 'cash', datetime(2025, 1, 10, 15), course=self.course)
+        self.create_payment(self.user, 250, 'transfer', datetime(2025, 1, 11, 9), course=self.other_course)
+        self.create_payment(self.user, 50, 'transfer', datetime(2025, 2, 1, 9), lesson=self.lesson)
+        # Незавершенная сессия оплаты в выручку не входит
+        self.open_payment = self.create_payment(self.user, 1000, 'transfer', datetime(2025, 1, 10, 18),
+                                                course=self.course, status=Payment.STATUS_OPEN,
+                                                session_id='cs_test_open')
+        self.client.force_authenticate(user=self.admin)
+
+    def create_payment(self, user, amount, payment_method, payment_date, status=Payment.STATUS_PAID, **kwargs):
+        """Создает платеж с заданной датой (поле payment_date заполняется автоматически при создании)"""
+
+        payment = Payment.objects.create(user=user, amount=amount, payment_method=payment_method, status=status,
+                                         **kwargs)
+        Payment.objects.filter(pk=payment.pk).update(payment_date=timezone.make_aware(payment_date))
+        return payment
+
+    def test_rebuild_payment_rollups(self):
+        """Тест построения сводок и идемпотентности пересчета"""
+
+        self.assertEqual(rebuild_payment_rollups(date(2025, 1, 1), date(2025, 2, 28)), 3)
+        self.assertEqual(rebuild_payment_rollups(date(2025, 1, 1), date(2025, 2, 28)), 3)
+        rollup = PaymentDailyRollup.objects.get(date=date(2025, 1, 10))
+        self.assertEqual(
+            (rollup.course, rollup.payments_count, rollup.amount_total, rollup.payers_count),
+            (self.course, 2, 300, 2)
+        )
+
+    def test_stripe_event_updates_rollups(self):
+        """Тест пересчета сводки за день платежа, оплата которого подтверждена событием Stripe"""
+
+        rebuild_payment_rollups(date(2025, 1, 1), date(2025, 2, 28))
+        StripeEvent.objects.create(event_id='evt_open', event_type='checkout.session.completed', payload={
+            'data': {'object': {'id': 'cs_test_open', 'payment_status': 'paid'}},
+        })
+        process_stripe_events()
+        rollup = PaymentDailyRollup.objects.get(date=date(2025, 1, 10), payment_method='transfer')
+        self.assertEqual((rollup.course, rollup.amount_total), (self.course, 1000))
+        self.assertEqual(PaymentDailyRollup.objects.count(), 4)
+
+    def test_payment_analytics_report(self):
+        """Тест отчета по платежам с группировкой по месяцам и способу оплаты"""
+
+        rebuild_payment_rollups(date(2025, 1, 1), date(2025, 2, 28))
+        url = reverse('users:payment-analytics')
+        response = self.client.get(url, {
+            'date_from': '2025-01-01', 'date_to': '2025-02-28', 'period': 'month', 'group_by': 'payment_method'
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(
+            [(row['period'], row['payment_method'], row['amount_total']) for row in data['revenue']],
+            [('2025-01-01', 'cash', 300), ('2025-01-01', 'transfer', 250), ('2025-02-01', 'transfer', 50)]
+        )
+        self.assertEqual(
+            [(row['course_id'], row['amount_total']) for row in data['top_courses']],
+            [(self.course.pk, 300), (self.other_course.pk, 250)]
+        )
+        self.assertEqual(data['paying_users'], 2)
+
+    def test_payment_analytics_admin_only(self):
+        """Тест запрета доступа к отчету для обычных пользователей"""
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('users:payment-analytics'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PaymentCreateTestCase(APITestCase):
+    """Тестирование создания платежа с повторным использованием продукта и цены Stripe"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        self.stripe = StripeStubClient()
+        patcher = patch('users.services.stripe_client', self.stripe)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(email='buyer@sky.pro', password='testpass')
+        self.course = Course.objects.create(title='Курс', price=1000, owner=self.user)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('users:payment-course-create', args=(self.course.pk,))
+
+    def test_payment_create(self):
+        """Тест создания платежа: продукт, цена и сессия в Stripe"""
+
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        payment = Payment.objects.get()
+        self.assertEqual(response.json()['payment_url'], payment.link)
+        self.assertEqual(payment.amount, 1000)
+        self.assertEqual(self.stripe.calls, ['create_product', 'create_price', 'create_session'])
+
+    def test_product_and_price_reused(self):
+        """Тест повторного использования продукта и цены при следующей покупке"""
+
+        self.client.post(self.url)
+        self.client.post(self.url)
+        self.assertEqual(self.stripe.calls[3:], ['create_session'])
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.stripe_price_amount, 1000)
+
+    def test_product_and_price_refreshed(self):
+        """Тест обновления продукта и создания новой цены после изменения курса"""
+
+        self.client.post(self.url)
+        self.course.refresh_from_db()
+        old_price_id = self.course.stripe_price_id
+        Course.objects.filter(pk=self.course.pk).update(title='Новый курс', price=2000)
+
+        self.client.post(self.url)
+        self.assertEqual(self.stripe.calls[3:], ['modify_product', 'create_price', 'create_session'])
+        self.course.refresh_from_db()
+        self.assertNotEqual(self.course.stripe_price_id, old_price_id)
+        self.assertEqual(self.course.stripe_product_name, 'Курс: Новый курс')
+
+
+class AsyncPaymentCreateTestCase(APITestCase):
+    """Тестирование асинхронного создания сессии оплаты"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        self.stripe = StripeStubClient()
+        patcher = patch('users.services.stripe_client', self.stripe)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(email='buyer@sky.pro', password='testpass')
+        self.lesson = Lesson.objects.create(
+            title='Урок', price=500, owner=self.user,
+            course=Course.objects.create(title='Курс', owner=self.user)
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('users:payment-lesson-create', args=(self.lesson.pk,))
+
+    @patch('users.views.create_checkout_session.delay')
+    def test_async_payment_create(self, delay):
+        """Тест немедленного ответа 202 с сохранением платежа в статусе 'pending'"""
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{self.url}?async=true')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        payment = Payment.objects.get()
+        self.assertEqual(payment.status, Payment.STATUS_PENDING)
+        self.assertEqual(response.json()['payment_id'], payment.pk)
+        delay.assert_called_once_with(payment.pk)
+        self.assertEqual(self.stripe.calls, [])
+
+    def test_checkout_session_task(self):
+        """Тест создания сессии оплаты задачей и получения ссылки через эндпоинт статуса"""
+
+        with patch('users.views.create_checkout_session.delay'):
+            status_url = self.client.post(f'{self.url}?async=true').json()['status_url']
+        payment = Payment.objects.get()
+
+        create_checkout_session(payment.pk)
+
+        data = self.client.get(status_url).json()
+        self.assertEqual(data['status'], Payment.STATUS_OPEN)
+        self.assertTrue(data['link'].startswith('https://checkout.stripe.com/'))
+        self.assertEqual(self.stripe.calls, ['create_product', 'create_price', 'create_session'])
+
+    def test_checkout_session_task_failed(self):
+        """Тест статуса 'failed' после исчерпания повторов при ошибках Stripe"""
+
+        payment = Payment.objects.create(user=self.user, lesson=self.lesson, amount=500, status=Payment.STATUS_PENDING)
+        with patch.object(self.stripe, 'create_session', side_effect=stripe.APIConnectionError('timeout')):
+            create_checkout_session.apply(args=(payment.pk,))
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.STATUS_FAILED)
+
+    def test_checkout_session_task_deleted_object(self):
+        """Тест статуса 'failed' для платежа, урок которого удален до создания сессии, и удаленного платежа"""
+
+        payment = Payment.objects.create(user=self.user, lesson=self.lesson, amount=500, status=Payment.STATUS_PENDING)
+        self.lesson.delete()
+        create_checkout_session(payment.pk)
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.STATUS_FAILED)
+        self.assertEqual(self.stripe.calls, [])
+
+        payment_id = payment.pk
+        payment.delete()
+        self.assertEqual(create_checkout_session(payment_id), f'Платеж {payment_id} не найден')
+
+    def test_payment_status_only_for_owner(self):
+        """Тест недоступности статуса чужого платежа"""
+
+        other_user = User.objects.create_user(email='other@sky.pro', password='testpass')
+        payment = Payment.objects.create(user=other_user, lesson=self.lesson, amount=500)
+        response = self.client.get(reverse('users:payment-status', args=(payment.pk,)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+WEBHOOK_SECRET = 'whsec_test'
+
+
+@patch('users.views.STRIPE_WEBHOOK_SECRET', WEBHOOK_SECRET)
+class StripeWebhookTestCase(APITestCase):
+    """Тестирование приема и обработки событий Stripe на записанных событиях (без обращения к сети)"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        with open(Path(__file__).parent / 'test_data' / 'stripe_events.json', encoding='utf-8') as file:
+            self.events = json.load(file)
+        self.user = User.objects.create_user(email='buyer@sky.pro', password='testpass')
+        self.payments = {
+            session_id: Payment.objects.create(user=self.user, amount=100, session_id=session_id)
+            for session_id in ('cs_test_paid', 'cs_test_async', 'cs_test_expired', 'cs_test_other')
+        }
+        self.url = reverse('users:payment-webhook')
+
+    def post_event(self, event, secret=WEBHOOK_SECRET):
+        """Отправляет событие на вебхук с подписью, сформированной так же, как это делает Stripe"""
+
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+        return self.client.post(self.url, payload, content_type='application/json',
+                                HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}')
+
+    def get_status(self, session_id):
+        return Payment.objects.get(pk=self.payments[session_id].pk).status
+
+    @patch('users.views.process_stripe_events.delay')
+    def test_webhook_stores_events_once(self, delay):
+        """Тест сохранения событий без дубликатов при повторной доставке"""
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for event in self.events:
+                self.assertEqual(self.post_event(event).status_code, status.HTTP_200_OK)
+
+        self.assertEqual(StripeEvent.objects.count(), len(self.events) - 1)
+        self.assertEqual(delay.call_count, len(self.events))
+
+    def test_webhook_rejects_invalid_signature(self):
+        """Тест отклонения события с неверной подписью"""
+
+        response = self.post_event(self.events[0], secret='whsec_wrong')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    @patch('users.views.process_stripe_events.delay')
+    def test_process_stripe_events(self, delay):
+        """Тест пакетного обновления статусов платежей по событиям"""
+
+        for event in self.events:
+            self.post_event(event)
+
+        # Выборка событий, выборка платежей, bulk_update и отметка событий обработанными
+        # (плюс создание и освобождение точки сохранения транзакции) и пересчет сводки за день оплаченного платежа
+        # (удаление, агрегирующая выборка и вставка в своей точке сохранения)
+        with patch('users.tasks.STRIPE_EVENTS_BATCH_SIZE', 10), self.assertNumQueries(11):
+            self.assertEqual(process_stripe_events(), 'Обработано 5 событий Stripe')
+
+        self.assertEqual(self.get_status('cs_test_paid'), Payment.STATUS_PAID)
+        self.assertEqual(self.get_status('cs_test_async'), Payment.STATUS_FAILED)
+        self.assertEqual(self.get_status('cs_test_expired'), Payment.STATUS_EXPIRED)
+        self.assertEqual(self.get_status('cs_test_other'), Payment.STATUS_OPEN)
+        self.assertFalse(StripeEvent.objects.filter(processed_at__isnull=True).exists())
+        self.assertEqual(process_stripe_events(), 'Обработано 0 событий Stripe')
+
+    @patch('users.views.process_stripe_events.delay')
+    def test_process_stripe_events_in_batches(self, delay):
+        """Тест обработки событий несколькими пачками"""
+
+        for event in self.events:
+            self.post_event(event)
+
+        with patch('users.tasks.STRIPE_EVENTS_BATCH_SIZE', 2):
+            self.assertEqual(process_stripe_events(), 'Обработано 5 событий Stripe')
+        self.assertEqual(self.get_status('cs_test_async'), Payment.STATUS_FAILED)
+
+
+class EntitlementTestCase(APITestCase):
+    """Тестирование доступов к оплаченным курсам и урокам"""
+
+    def setUp(self):
+        """Настройка тестовых данных перед каждым тестом"""
+
+        cache.clear()
+        self.owner = User.objects.create_user(email='author@sky.pro', password='testpass')
+        self.user = User.objects.create_user(email='student@sky.pro', password='testpass')
+        self.course = Course.objects.create(title='Платный курс', price=1000, owner=self.owner)
+        self.other_course = Course.objects.create(title='Другой курс', price=1000, owner=self.owner)
+        self.lesson = Lesson.objects.create(title='Урок курса', course=self.course, owner=self.owner)
+        self.other_lesson = Lesson.objects.create(title='Урок другого курса', course=self.other_course,
+                                                  owner=self.owner)
+        self.client.force_authenticate(user=self.user)
+
+    def test_paid_payment_grants_entitlement(self):
+        """Тест выдачи доступа при оплате: неоплаченный платеж доступ не дает, повторная оплата не создает дубликат"""
+
+        payment = Payment.objects.create(user=self.user, course=self.course, amount=1000)
+        self.assertFalse(get_entitlements(self.user.pk).has_course(self.course.pk))
+
+        payment.status = Payment.STATUS_PAID
+        payment.save()
+        Payment.objects.create(user=self.user, course=self.course, amount=1000, status=Payment.STATUS_PAID)
+        Payment.objects.create(user=self.user, lesson=self.other_lesson, amount=100, status=Payment.STATUS_PAID)
+
+        self.assertEqual(Entitlement.objects.filter(user=self.user).count(), 2)
+        entitlements = get_entitlements(self.user.pk)
+        self.assertTrue(entitlements.allows(self.course))
+        self.assertTrue(entitlements.allows(self.lesson))
+        self.assertTrue(entitlements.allows(self.other_lesson))
+        self.assertFalse(entitlements.allows(self.other_course))
+
+    def test_entitlements_cached(self):
+        """Тест кеширования доступов: повторная проверка не обращается к БД"""
+
+        self.assertFalse(get_entitlements(self.user.pk).courses)
+        with self.assertNumQueries(0):
+            get_entitlements(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(user=self.user, course=self.course, amount=1000, status=Payment.STATUS_PAID)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_entitlements(self.user.pk).courses, {self.course.pk})
+
+    def test_stripe_event_grants_entitlement(self):
+        """Тест выдачи доступа при пакетной обработке событий Stripe"""
+
+        Payment.objects.create(user=self.user, course=self.course, amount=1000, session_id='cs_test_paid')
+        StripeEvent.objects.create(event_id='evt_1', event_type='checkout.session.completed', payload={
+            'data': {'object': {'id': 'cs_test_paid', 'payment_status': 'paid'}},
+        })
+        process_stripe_events()
+        self.assertTrue(get_entitlements(self.user.pk).has_course(self.course.pk))
+
+    def test_lesson_access(self):
+        """Тест просмотра урока оплаченного курса и запрета просмотра урока неоплаченного курса"""
+
+        Payment.objects.create(user=self.user, course=self.course, amount=1000, status=Payment.STATUS_PAID)
+        response = self.client.get(reverse('lms:lessons_retrieve', args=(self.lesson.pk,)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse('lms:lessons_retrieve', args=(self.other_lesson.pk,)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.patch(reverse('lms:lessons_update', args=(self.lesson.pk,)), {'title': 'Урок'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_course_access(self):
+        """Тест просмотра оплаченного курса: курс доступен для просмотра, но не для изменения"""
+
+        url = reverse('lms:courses-detail', args=(self.course.pk,))
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(user=self.user, course=self.course, amount=1000, status=Payment.STATUS_PAID)
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse('lms:courses-list'))
+        self.assertEqual([course['id'] for course in response.json()['results']], [self.course.pk])
+        self.assertEqual(self.client.patch(url, {'title': 'Курс'}).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_manual_payment_status(self):
+        """Тест платежей наличными и переводом, записанных через API: платеж пользователя ожидает подтверждения,
+        платеж администратора сразу оплачен. Подтверждение платежа выдает доступ"""
+
+        url = reverse('users:payments-list')
+        response = self.client.post(url, {'course': self.course.pk, 'amount': 1000, 'payment_method': 'cash'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        payment = Payment.objects.get(pk=response.json()['id'])
+        self.assertEqual((payment.user, payment.status), (self.user, Payment.STATUS_OPEN))
+        self.assertFalse(Entitlement.objects.exists())
+
+        payment.status = Payment.STATUS_PAID
+        payment.save()
+        self.assertTrue(Entitlement.objects.filter(user=self.user, course=self.course).exists())
+
+        admin = User.objects.create_user(email='admin@sky.pro', password='testpass', is_staff=True)
+        self.client.force_authenticate(user=admin)
+        response = self.client.post(url, {'lesson': self.lesson.pk, 'amount': 100, 'payment_method': 'transfer'})
+        self.assertEqual(response.json()['status'], Payment.STATUS_PAID)
+        self.assertTrue(Entitlement.objects.filter(user=admin, lesson=self.lesson).exists())
+
+    def test_status_backfill_migration(self):
+        """Тест миграции статусов: существующие платежи без сессии Stripe становятся оплаченными"""
+
+        manual = Payment.objects.create(user=self.user, course=self.course, amount=1000, payment_method='cash')
+        stripe_payment = Payment.objects.create(user=self.user, course=self.course, amount=1000, session_id='cs_1')
+        migration = import_module('users.migrations.0008_payment_status')
+        migration.mark_existing_payments_paid(django_apps, None)
+
+        manual.refresh_from_db()
+        stripe_payment.refresh_from_db()
+        self.assertEqual((manual.status, stripe_payment.status), (Payment.STATUS_PAID, Payment.STATUS_OPEN))
+
+    def test_paid_payment_change_grants_nothing(self):
+        """Тест изменения оплаченного платежа: курс, урок и сумму изменить нельзя,
+        а повторное сохранение оплаченного платежа не выдает доступ к другому курсу"""
+
+        payment = Payment.objects.create(user=self.user, lesson=self.other_lesson, amount=1,
+                                         status=Payment.STATUS_PAID)
+        response = self.client.patch(reverse('users:payments-detail', args=(payment.pk,)),
+                                     {'course': self.course.pk, 'lesson': None, 'amount': 1000}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        payment.refresh_from_db()
+        self.assertEqual((payment.course_id, payment.lesson_id, payment.amount), (None, self.other_lesson.pk, 1))
+
+        payment.course = self.course
+        payment.save()
+        self.assertFalse(Entitlement.objects.filter(user=self.user, course=self.course).exists())
+        url = reverse('lms:courses-detail', args=(self.course.pk,))
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class FillPaymentsTestCase(APITestCase):
+    """Тестирование генерации данных для нагрузочного тестирования"""
+
+    def fill(self, **options):
+        call_command('fill_payments', stdout=io.StringIO(), **options)
+
+    def payments_snapshot(self):
+        return list(Payment.objects.order_by('id').values_list(
+            'user__email', 'payment_date', 'course__title', 'lesson__title', 'amount', 'payment_method', 'status',
+        ))
+
+    def test_volumes(self):
+        """Тест создания заданных объемов данных с датами платежей в прошлом"""
+
+        self.fill(users=50, courses=10, lessons=100, subscriptions=200, payments=500, batch_size=64, days=30)
+        self.assertEqual(User.objects.count(), 50)
+        self.assertEqual(Course.objects.count(), 10)
+        self.assertEqual(Lesson.objects.count(), 100)
+        self.assertEqual(Payment.objects.count(), 500)
+        self.assertTrue(0 < Subscription.objects.count() <= 200)
+        self.assertFalse(Payment.objects.filter(payment_date__gte=timezone.now()).exists())
+        self.assertGreater(Payment.objects.filter(payment_date__lt=timezone.now() - timedelta(days=2)).count(), 400)
+
+    def test_deterministic(self):
+        """Тест повторяемости данных при одинаковом seed и исходном состоянии БД"""
+
+        def generate(seed):
+            User.objects.all().delete()
+            Course.objects.all().delete()
+            self.fill(users=20, courses=5, lessons=20, subscriptions=30, payments=100, seed=seed)
+            return self.payments_snapshot()
+
+        first = generate(seed=7)
+        self.assertEqual(generate(seed=7), first)
+        self.assertNotEqual(generate(seed=8), first)
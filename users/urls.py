@@ -2,7 +2,8 @@ from django.urls import path
 from rest_framework.routers import SimpleRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from users.views import UserViewSet, PaymentViewSet, UserProfileViewSet, PaymentCreateAPIView
+from users.views import UserViewSet, PaymentViewSet, UserProfileViewSet, PaymentCreateAPIView, \
+    PaymentAnalyticsAPIView, PaymentStatusAPIView, StripeWebhookAPIView, TokenRevokeAPIView
 from users.apps import UsersConfig
 
 
@@ -16,9 +17,13 @@ router.register('profile', UserProfileViewSet, basename='user-profile')
 urlpatterns = [
     path('payments/course/<int:course_id>/', PaymentCreateAPIView.as_view(), name='payment-course-create'),
     path('payments/lesson/<int:lesson_id>/', PaymentCreateAPIView.as_view(), name='payment-lesson-create'),
+    path('payments/analytics/', PaymentAnalyticsAPIView.as_view(), name='payment-analytics'),
+    path('payments/<int:pk>/status/', PaymentStatusAPIView.as_view(), name='payment-status'),
+    path('payments/webhook/', StripeWebhookAPIView.as_view(), name='payment-webhook'),
 
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/revoke/', TokenRevokeAPIView.as_view(), name='token_revoke'),
 ]
 
 urlpatterns += router.urls
@@ -1,17 +1,32 @@
+import json
+
+import stripe
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import Coalesce
+from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.filters import OrderingFilter
-from rest_framework.generics import CreateAPIView, get_object_or_404
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.generics import CreateAPIView, RetrieveAPIView, get_object_or_404
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from config.settings import STRIPE_ASYNC_CHECKOUT, STRIPE_WEBHOOK_SECRET
 from lms.models import Course, Lesson
-from users.models import User, Payment
+from lms.paginations import PaymentHistoryPagination, SwitchablePagination
+from users.analytics import get_paying_users_count, get_revenue_report, get_top_courses
+from users.models import User, Payment, StripeEvent
 from users.permissions import IsOwnerOrReadOnly
 from users.serializers import UserSerializer, PaymentSerializer, UserProfileSerializer, UserProfileUpdateSerializer, \
-    PublicProfileSerializer
-from users.services import create_stripe_sessions, create_stripe_price, create_stripe_product
+    PublicProfileSerializer, PaymentAnalyticsQuerySerializer, PaymentStatusSerializer, TokenRevokeSerializer
+from users.revocation import revoke_token, revoke_users
+from users.services import create_stripe_sessions, get_stripe_price_id
+from users.tasks import create_checkout_session, process_stripe_events
 
 
 class UserViewSet(ModelViewSet):
@@ -30,10 +45,15 @@ class UserViewSet(ModelViewSet):
 
 
 class PaymentViewSet(ModelViewSet):
-    """Контроллер для платежа"""
+    """Контроллер для платежа. Список по умолчанию выводится массивом без пагинации, как до ее введения,
+    чтобы не ломать существующих клиентов. Курсорная пагинация включается параметром ?pagination=cursor
+    (рекомендуется для больших списков), постраничная - ?pagination=page"""
 
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
+    pagination_class = SwitchablePagination
+    pagination_mode = 'none'
+    allow_unpaginated = True
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = [
         'course',  # Фильтр по ID курса (/payments/?course=1)
@@ -43,33 +63,104 @@ class PaymentViewSet(ModelViewSet):
     ordering_fields = ['payment_date']  # Сортировка по дате (/payments/?ordering=payment_date)
     ordering = ['-payment_date']  # Сортировка по умолчанию (новые сначала)
 
+    def perform_create(self, serializer):
+        """Записывает платеж наличными или переводом (вне Stripe) текущего пользователя.
+        Платеж, записанный администратором, сразу оплачен. Платеж, заявленный пользователем, ожидает
+        подтверждения ('open'): администратор меняет статус на 'paid' в админке, и доступ выдается сигналом"""
+        status_value = Payment.STATUS_PAID if self.request.user.is_staff else Payment.STATUS_OPEN
+        serializer.save(user=self.request.user, status=status_value)
 
-class UserProfileViewSet(ModelViewSet):
-    """Контроллер для профиля пользователя"""
 
-    queryset = User.objects.all()
+class PaymentAnalyticsAPIView(APIView):
+    """Отчет по платежам для администраторов. Строится по ежедневным сводкам (PaymentDailyRollup),
+    а не по полной истории платежей.
+    Параметры запроса:
+    - date_from, date_to: период отчета (по умолчанию последние 30 дней)
+    - period: группировка по дням ('day') или месяцам ('month')
+    - group_by: дополнительная группировка по 'course', 'lesson' или 'payment_method'
+    - top: количество курсов в рейтинге по выручке"""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        serializer = PaymentAnalyticsQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        date_from, date_to = params['date_from'], params['date_to']
+
+        return Response({
+            'date_from': date_from,
+            'date_to': date_to,
+            'revenue': get_revenue_report(date_from, date_to, params['period'], params.get('group_by')),
+            'top_courses': get_top_courses(date_from, date_to, params['top']),
+            'paying_users': get_paying_users_count(date_from, date_to),
+        })
+
+
+class UserProfileViewSet(ModelViewSet):
+    """Контроллер для профиля пользователя.
+    Список и чужие профили выводятся публичным сериализатором с загрузкой только публичных полей,
+    список по умолчанию - массивом без пагинации, как до ее введения (курсорная пагинация для больших списков
+    включается параметром ?pagination=cursor, постраничная - ?pagination=page).
+    Владелец получает свой профиль со сводкой по оплаченным платежам (количество, сумма, дата последнего),
+    посчитанной агрегатами в запросе профиля, а историю платежей - отдельным эндпоинтом с пагинацией
+    (/profile/<id>/payments/)"""
+
+    queryset = User.objects.order_by('id')
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    pagination_class = SwitchablePagination
+    pagination_mode = 'none'
+    allow_unpaginated = True
+    ordering_fields = ['id']
+
+    def is_owner(self):
+        """Проверяет, запрошен ли профиль текущего пользователя (pk из URL - строка)"""
+
+        return str(self.request.user.pk) == self.kwargs.get(self.lookup_field)
 
     def get_serializer_class(self):
         """Выбираем сериализатор в зависимости от действия и владельца"""
 
         if self.action in ['update', 'partial_update']:
             return UserProfileUpdateSerializer
-        elif self.action in ['retrieve', 'list']:
-            if self.request.user.pk == self.kwargs.get('pk', None):
+        elif self.action == 'list':
+            return PublicProfileSerializer
+        elif self.action == 'retrieve':
+            if self.is_owner():
                 return UserProfileSerializer
             return PublicProfileSerializer
+        elif self.action == 'payments':
+            return PaymentSerializer
         return UserProfileSerializer  # fallback
 
     def get_queryset(self):
-        """Оптимизация запросов"""
+        """Оптимизация запросов: публичные профили загружаются только с публичными полями,
+        профиль владельца - со сводкой по оплаченным платежам"""
 
         queryset = super().get_queryset()
-        if self.action == 'list':
-            # Для списка возвращаем только публичные данные через сериализатор
-            return queryset
+        serializer_class = self.get_serializer_class()
+        if serializer_class is PublicProfileSerializer:
+            return queryset.only(*PublicProfileSerializer.Meta.fields)
+        if serializer_class is UserProfileSerializer:
+            paid = Q(payments__status=Payment.STATUS_PAID)
+            return queryset.annotate(
+                payments_count=Count('payments', filter=paid),
+                total_spent=Coalesce(Sum('payments__amount', filter=paid), 0),
+                last_payment_date=Max('payments__payment_date', filter=paid),
+            )
         return queryset
 
+    @action(detail=True, methods=['get'])
+    def payments(self, request, *args, **kwargs):
+        """История платежей владельца профиля с курсорной пагинацией (новые сначала).
+        Профиль не загружается: владелец определяется по id из URL"""
+
+        if not self.is_owner():
+            raise PermissionDenied('История платежей доступна только владельцу профиля')
+        paginator = PaymentHistoryPagination()
+        page = paginator.paginate_queryset(Payment.objects.filter(user_id=request.user.pk), request, view=self)
+        return paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+
 
 class PaymentCreateAPIView(CreateAPIView):
     """API endpoint для создания платежной сессии через Stripe.
@@ -77,17 +168,21 @@ class PaymentCreateAPIView(CreateAPIView):
     Позволяет создавать платежи как для курсов, так и для отдельных уроков.
     При создании платежа:
     1. Валидирует входные данные
-    2. Создает продукт в Stripe
-    3. Создает цену в Stripe (с конвертацией рублей в копейки)
-    4. Создает сессию оплаты в Stripe
-    5. Сохраняет платеж в базу данных
+    2. Получает продукт и цену в Stripe (с конвертацией рублей в копейки), созданные для курса/урока ранее,
+       или создает их
+    3. Создает сессию оплаты в Stripe
+    4. Сохраняет платеж в базу данных
 
     Требуемые параметры в URL:
     - Для курса: /payments/course/<int:course_id>/
     - Для урока: /payments/lesson/<int:lesson_id>/
 
+    Асинхронный режим (?async=true или настройка STRIPE_ASYNC_CHECKOUT): платеж сохраняется в статусе 'pending',
+    сессия оплаты создается задачей Celery, а клиент получает ссылку на эндпоинт статуса платежа.
+
     Возвращает:
     - 201 Created: при успешном создании (с URL для оплаты)
+    - 202 Accepted: в асинхронном режиме (с id платежа и URL статуса)
     - 400 Bad Request: при ошибках валидации
     - 404 Not Found: если курс/урок не существует"""
 
@@ -120,6 +215,9 @@ class PaymentCreateAPIView(CreateAPIView):
         serializer = self.get_serializer(data=payment_data)  # Создаем сериализатор и валидируем данные
         serializer.is_valid(raise_exception=True)
 
+        if self.is_async(request):
+            return self.perform_async_create(serializer, obj)  # Сессия оплаты создается в фоне
+
         self.perform_create(serializer, obj, obj_type)  # Создаем платеж в Stripe и сохраняем в БД
 
         return Response(
@@ -128,6 +226,27 @@ class PaymentCreateAPIView(CreateAPIView):
             headers=self.get_success_headers(serializer.data)
         )
 
+    def is_async(self, request):
+        """Определяет режим создания сессии оплаты: параметр ?async=true|false или настройка STRIPE_ASYNC_CHECKOUT"""
+
+        async_param = request.query_params.get('async')
+        if async_param is None:
+            return STRIPE_ASYNC_CHECKOUT
+        return async_param.lower() == 'true'
+
+    def perform_async_create(self, serializer, obj):
+        """Сохраняет платеж в статусе 'pending' и ставит в очередь задачу создания сессии оплаты.
+        Запрос не ждет ответа Stripe, поэтому задержки платежного сервиса не занимают воркеры API"""
+
+        payment = serializer.save(user=self.request.user, amount=obj.price, status=Payment.STATUS_PENDING)
+        transaction.on_commit(lambda: create_checkout_session.delay(payment.pk))
+        status_url = self.request.build_absolute_uri(reverse('users:payment-status', args=(payment.pk,)))
+        return Response(
+            {'payment_id': payment.pk, 'status': payment.status, 'status_url': status_url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': status_url}
+        )
+
     def get_object_type(self, kwargs):
         """Определяет тип оплачиваемого объекта по параметрам URL.
         Возвращает:
@@ -179,19 +298,13 @@ class PaymentCreateAPIView(CreateAPIView):
     def perform_create(self, serializer, obj, obj_type):
         """Основная логика создания платежа.
         Выполняет:
-        1. Создание продукта в Stripe
-        2. Создание цены в Stripe
-        3. Создание платежной сессии
-        4. Сохранение платежа в БД"""
-
-        product_name = f"Курс: {obj.title}" if obj_type == 'course' else f"Урок: {obj.title}"
-        product_data = {
-            "name": product_name,
-            "description": obj.description if hasattr(obj, 'description') else product_name
-        }
-        stripe_product = create_stripe_product(product_data)
-        stripe_price = create_stripe_price(obj.price, stripe_product)
-        session_id, payment_url = create_stripe_sessions(stripe_price)
+        1. Получение цены в Stripe (продукт и цена создаются только при первой покупке объекта
+           или после изменения его названия/стоимости)
+        2. Создание платежной сессии
+        3. Сохранение платежа в БД"""
+
+        stripe_price_id = get_stripe_price_id(obj, obj_type)
+        session_id, payment_url = create_stripe_sessions(stripe_price_id)
 
         serializer.save(
             user=self.request.user,
@@ -199,3 +312,59 @@ class PaymentCreateAPIView(CreateAPIView):
             link=payment_url,
             amount=obj.price
         )
+
+
+class PaymentStatusAPIView(RetrieveAPIView):
+    """Легковесный эндпоинт статуса платежа текущего пользователя для опроса клиентом
+    после асинхронного создания сессии оплаты"""
+
+    serializer_class = PaymentStatusSerializer
+
+    def get_queryset(self):
+        return Payment.objects.filter(user=self.request.user).only('id', 'status', 'link')
+
+
+class TokenRevokeAPIView(APIView):
+    """Выход из системы: отзывает текущий access-токен и переданный refresh-токен ('refresh'),
+    а с параметром 'all' - все выпущенные токены пользователя. Отозванные токены отклоняются
+    по кешу (users.revocation) до истечения их срока действия"""
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = TokenRevokeSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        if serializer.validated_data['all']:
+            revoke_users([request.user.pk])
+        for token in (request.auth, serializer.validated_data.get('refresh')):
+            if token is not None:
+                revoke_token(token)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class StripeWebhookAPIView(APIView):
+    """Эндпоинт вебхука Stripe. Проверяет подпись события, сохраняет событие (повторные доставки
+    с тем же id игнорируются) и ставит в очередь задачу обработки событий. Статусы платежей
+    обновляются задачей process_stripe_events, поэтому ответ Stripe возвращается сразу"""
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        payload = request.body
+        try:
+            stripe.WebhookSignature.verify_header(
+                payload.decode('utf-8'), request.headers.get('Stripe-Signature'), STRIPE_WEBHOOK_SECRET,
+                stripe.Webhook.DEFAULT_TOLERANCE
+            )
+            event = json.loads(payload)
+            event_id, event_type = event['id'], event['type']
+        except (stripe.SignatureVerificationError, ValueError, KeyError, TypeError):
+            return Response({'error': 'Некорректное событие Stripe'}, status=status.HTTP_400_BAD_REQUEST)
+
+        StripeEvent.objects.bulk_create(
+            [StripeEvent(event_id=event_id, event_type=event_type, payload=event)],
+            ignore_conflicts=True
+        )
+        transaction.on_commit(process_stripe_events.delay)
+        return Response({'received': True}, status=status.HTTP_200_OK)